@@ -14,6 +14,7 @@ from features.ecommerce.shipping_routes import shipping_router
 from features.ecommerce.woocommerce_cart_routes import woocommerce_cart_router
 from features.ecommerce.test_woocommerce_routes import test_woocommerce_router
 from features.tracking.routes import tracking_router
+from features.tracking.background import start_tracking_services, stop_tracking_services
 
 # Crear aplicación FastAPI
 app = FastAPI(title="Vehicle Tracking API", version="1.0.0")
@@ -35,6 +36,15 @@ print("🔄 Ejecutando migraciones de BD...")
 run_migrations()
 print("✅ Migraciones completadas")
 
+# Servicios de tracking en segundo plano (broker de eventos entre workers)
+@app.on_event("startup")
+async def startup_tracking_services():
+    await start_tracking_services()
+
+@app.on_event("shutdown")
+async def shutdown_tracking_services():
+    await stop_tracking_services()
+
 # Incluir routers de features
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 app.include_router(users_router, prefix="/users", tags=["Users"])
@@ -24,6 +24,65 @@ class Settings:
     # Rate limiting
     RATE_LIMIT_REQUESTS_PER_MINUTE = int(os.getenv("RATE_LIMIT_REQUESTS_PER_MINUTE", 60))
     
+    # Tracking en tiempo real
+    # memory:// (un worker), postgresql://... (LISTEN/NOTIFY) o redis://host:6379
+    TRACKING_BROKER_URL = os.getenv("TRACKING_BROKER_URL", "memory://")
+    # Ingesta de ubicaciones por lotes: flush al llegar a N pings o cada X segundos
+    LOCATION_INGEST_BATCH_SIZE = int(os.getenv("LOCATION_INGEST_BATCH_SIZE", 500))
+    LOCATION_INGEST_FLUSH_INTERVAL = float(os.getenv("LOCATION_INGEST_FLUSH_INTERVAL", 1.0))
+    # Asignación automática: radio máximo (km) de búsqueda de conductores
+    DISPATCH_MAX_RADIUS_KM = float(os.getenv("DISPATCH_MAX_RADIUS_KM", 25.0))
+    # Historial de ubicaciones: particiones (month/day) en PostgreSQL y retención en días (0 = sin límite)
+    LOCATION_PARTITION_INTERVAL = os.getenv("LOCATION_PARTITION_INTERVAL", "month")
+    LOCATION_PARTITIONS_AHEAD = int(os.getenv("LOCATION_PARTITIONS_AHEAD", 2))
+    LOCATION_RETENTION_DAYS = int(os.getenv("LOCATION_RETENTION_DAYS", 0))
+    LOCATION_MAINTENANCE_INTERVAL = int(os.getenv("LOCATION_MAINTENANCE_INTERVAL", 3600))
+    # ETA: segundos entre recálculos, ventana (posiciones) de la velocidad suavizada y factor ruta/línea recta
+    ETA_TICK_INTERVAL = float(os.getenv("ETA_TICK_INTERVAL", 5.0))
+    ETA_EWMA_WINDOW = int(os.getenv("ETA_EWMA_WINDOW", 10))
+    ETA_ROAD_FACTOR = float(os.getenv("ETA_ROAD_FACTOR", 1.3))
+    # Geocodificador externo compatible con Nominatim (vacío = solo caché y centroides de ZIP)
+    GEOCODER_URL = os.getenv("GEOCODER_URL", "")
+    GEOCODER_TIMEOUT = float(os.getenv("GEOCODER_TIMEOUT", 3.0))
+    # Segundos que se sirve el dashboard de administración desde caché
+    DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", 10.0))
+    # Segundos entre reconstrucciones de driver_stats desde el historial de entregas
+    DRIVER_STATS_RECONCILE_INTERVAL = int(os.getenv("DRIVER_STATS_RECONCILE_INTERVAL", 86400))
+    # Geocercas: ubicación de la tienda (vacía = sin geocerca de salida) y radios en metros
+    STORE_LATITUDE = float(os.getenv("STORE_LATITUDE")) if os.getenv("STORE_LATITUDE") else None
+    STORE_LONGITUDE = float(os.getenv("STORE_LONGITUDE")) if os.getenv("STORE_LONGITUDE") else None
+    GEOFENCE_STORE_RADIUS_M = float(os.getenv("GEOFENCE_STORE_RADIUS_M", 150))
+    GEOFENCE_ARRIVING_RADIUS_M = float(os.getenv("GEOFENCE_ARRIVING_RADIUS_M", 500))
+    GEOFENCE_ARRIVAL_RADIUS_M = float(os.getenv("GEOFENCE_ARRIVAL_RADIUS_M", 75))
+    # WebSocket de clientes: límites por worker y por orden, segundos máximos por envío
+    # y desbordes seguidos de la cola antes de expulsar a un cliente lento
+    WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", 5000))
+    WS_MAX_CONNECTIONS_PER_ORDER = int(os.getenv("WS_MAX_CONNECTIONS_PER_ORDER", 20))
+    WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", 5.0))
+    WS_SLOW_CLIENT_STRIKES = int(os.getenv("WS_SLOW_CLIENT_STRIKES", 3))
+    # Mapa en vivo de administradores: segundos entre envíos y zoom desde el que se ven conductores individuales
+    LIVE_MAP_PUSH_INTERVAL = float(os.getenv("LIVE_MAP_PUSH_INTERVAL", 1.0))
+    LIVE_MAP_CLUSTER_ZOOM = int(os.getenv("LIVE_MAP_CLUSTER_ZOOM", 13))
+    # Muestreo adaptativo: intervalo (segundos) según estado y velocidad del conductor
+    ADAPTIVE_SAMPLING_ENABLED = os.getenv("ADAPTIVE_SAMPLING_ENABLED", "true").lower() == "true"
+    SAMPLING_IDLE_INTERVAL = int(os.getenv("SAMPLING_IDLE_INTERVAL", 60))
+    SAMPLING_EN_ROUTE_MAX_INTERVAL = int(os.getenv("SAMPLING_EN_ROUTE_MAX_INTERVAL", 30))
+    SAMPLING_MIN_INTERVAL = int(os.getenv("SAMPLING_MIN_INTERVAL", 5))
+    SAMPLING_TARGET_DISTANCE_M = float(os.getenv("SAMPLING_TARGET_DISTANCE_M", 150))
+    # Filtro GPS: velocidad máxima creíble, distancia mínima entre puntos, segundos
+    # máximos sin guardar un punto estacionado y suavizado de Kalman opcional
+    GPS_FILTER_ENABLED = os.getenv("GPS_FILTER_ENABLED", "true").lower() == "true"
+    GPS_FILTER_MAX_SPEED_KMH = float(os.getenv("GPS_FILTER_MAX_SPEED_KMH", 200))
+    GPS_FILTER_MIN_DISTANCE_M = float(os.getenv("GPS_FILTER_MIN_DISTANCE_M", 5))
+    GPS_FILTER_KEEPALIVE_SECONDS = float(os.getenv("GPS_FILTER_KEEPALIVE_SECONDS", 60))
+    GPS_FILTER_SMOOTHING = os.getenv("GPS_FILTER_SMOOTHING", "false").lower() == "true"
+    GPS_FILTER_PROCESS_NOISE = float(os.getenv("GPS_FILTER_PROCESS_NOISE", 10.0))
+    # Entregas activas cuya resolución número de orden -> entrega -> conductor se guarda en memoria
+    ORDER_RESOLUTION_CACHE_SIZE = int(os.getenv("ORDER_RESOLUTION_CACHE_SIZE", 10000))
+    # Orden de visita de entregas: segundos que se reutiliza y minutos por parada para las ETAs
+    ROUTE_PLAN_TTL = float(os.getenv("ROUTE_PLAN_TTL", 300.0))
+    ROUTE_STOP_MINUTES = float(os.getenv("ROUTE_STOP_MINUTES", 4.0))
+    
     # Configuración de la aplicación
     APP_NAME = os.getenv("APP_NAME", "Vehicle Tracking API")
     APP_VERSION = os.getenv("APP_VERSION", "1.0.0")
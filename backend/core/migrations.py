@@ -3,12 +3,17 @@ Sistema de migraciones automático
 Se ejecuta al iniciar la aplicación para crear/actualizar la BD
 """
 from sqlalchemy.orm import Session
+from sqlalchemy import text
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+import re
+from core.config import settings
 from core.database import engine, SessionLocal, Base
 from features.users.models import User
 from features.roles.models import Role
 from features.auth.models import PasswordReset, LoginAttempt
 from features.vehicles.models import Vehicle
-from features.tracking.models import Driver, DeliveryTracking, LocationUpdate, DriverSession
+from features.tracking.models import Driver, DeliveryTracking, LocationUpdate, LocationRollup, DriverStats, GeocodeCache, DriverSession
 from features.ecommerce.models import Order, OrderItem, Cart, CartItem
 from core.security import get_password_hash
 import logging
@@ -19,7 +24,16 @@ def run_migrations():
     """Ejecuta todas las migraciones necesarias"""
     try:
         # 1. Crear todas las tablas
+        if is_postgres():
+            # location_updates se crea particionada, fuera de create_all
+            tables = [table for table in Base.metadata.sorted_tables if table.name != LOCATION_TABLE]
+            Base.metadata.create_all(bind=engine, tables=tables)
+            ensure_partitioned_location_updates()
+            with engine.begin() as connection:
+                ensure_location_partitions(connection)
         Base.metadata.create_all(bind=engine)
+        ensure_location_indexes()
+        ensure_table_indexes()
         logger.info("✅ Tablas creadas/actualizadas")
         
         # 2. Crear roles por defecto
@@ -34,6 +48,200 @@ def run_migrations():
         logger.error(f"❌ Error en migraciones: {e}")
         raise
 
+# === HISTORIAL DE UBICACIONES PARTICIONADO (PostgreSQL) ===
+
+LOCATION_TABLE = "location_updates"
+LOCATION_DEFAULT_PARTITION = "location_updates_default"
+LOCATION_LEGACY_PARTITION = "location_updates_legacy"
+
+# Índices de location_updates (nombre, columnas)
+LOCATION_INDEXES = (
+    ("ix_location_updates_id", "id"),
+    ("ix_location_updates_driver_id", "driver_id"),
+    ("ix_location_updates_delivery_id", "delivery_id"),
+    ("ix_location_updates_timestamp", "timestamp"),
+    ("ix_location_updates_driver_timestamp", "driver_id, timestamp"),
+)
+
+PARTITIONED_LOCATION_DDL = """
+CREATE TABLE location_updates (
+    id INTEGER NOT NULL DEFAULT nextval('location_updates_id_seq'),
+    driver_id INTEGER NOT NULL REFERENCES drivers (id),
+    delivery_id INTEGER REFERENCES delivery_tracking (id),
+    latitude DOUBLE PRECISION NOT NULL,
+    longitude DOUBLE PRECISION NOT NULL,
+    accuracy DOUBLE PRECISION,
+    speed DOUBLE PRECISION,
+    heading DOUBLE PRECISION,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp)
+"""
+
+Partition = Tuple[str, Optional[datetime], Optional[datetime]]
+
+
+def is_postgres() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def ensure_partitioned_location_updates():
+    """
+    Crear location_updates particionada por rango de timestamp
+    - Si existe como tabla normal se convierte: la tabla antigua pasa a ser
+      la partición location_updates_legacy (bloquea la tabla mientras se valida)
+    """
+    with engine.begin() as connection:
+        relkind = connection.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": LOCATION_TABLE}
+        ).scalar()
+        if relkind == "p":
+            return
+
+        legacy_upper = None
+        if relkind == "r":
+            # Liberar nombres de la tabla, PK e índices para la tabla particionada
+            connection.execute(text(f"ALTER TABLE {LOCATION_TABLE} RENAME TO {LOCATION_LEGACY_PARTITION}"))
+            # Una partición debe tener la misma PK que la tabla particionada
+            connection.execute(text(
+                f"ALTER TABLE {LOCATION_LEGACY_PARTITION} DROP CONSTRAINT location_updates_pkey, "
+                f"ADD CONSTRAINT {LOCATION_LEGACY_PARTITION}_pkey PRIMARY KEY (id, timestamp)"
+            ))
+            for index_name, _ in LOCATION_INDEXES:
+                legacy_name = index_name.replace(LOCATION_TABLE, LOCATION_LEGACY_PARTITION, 1)
+                connection.execute(text(f"ALTER INDEX IF EXISTS {index_name} RENAME TO {legacy_name}"))
+
+            newest = connection.execute(
+                text(f"SELECT max(timestamp) FROM {LOCATION_LEGACY_PARTITION}")
+            ).scalar()
+            legacy_upper = next_period(period_start(max(newest or datetime.utcnow(), datetime.utcnow())))
+
+        connection.execute(text("CREATE SEQUENCE IF NOT EXISTS location_updates_id_seq"))
+        connection.execute(text(PARTITIONED_LOCATION_DDL))
+        connection.execute(text("ALTER SEQUENCE location_updates_id_seq OWNED BY location_updates.id"))
+        for index_name, columns in LOCATION_INDEXES:
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {LOCATION_TABLE} ({columns})"))
+
+        if legacy_upper is not None:
+            connection.execute(text(
+                f"ALTER TABLE {LOCATION_TABLE} ATTACH PARTITION {LOCATION_LEGACY_PARTITION} "
+                f"FOR VALUES FROM (MINVALUE) TO ('{legacy_upper.isoformat(sep=' ')}')"
+            ))
+            logger.info(f"✅ location_updates convertida a tabla particionada (histórico hasta {legacy_upper})")
+        else:
+            logger.info("✅ location_updates creada como tabla particionada")
+
+
+def ensure_location_indexes():
+    """Crear los índices de historial que create_all no añade a tablas existentes"""
+    with engine.begin() as connection:
+        for index_name, columns in LOCATION_INDEXES:
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {LOCATION_TABLE} ({columns})"))
+
+
+# Índices añadidos a tablas existentes (tabla, nombre, columnas)
+TABLE_INDEXES = (
+    ("delivery_tracking", "ix_delivery_tracking_driver_assigned", "driver_id, assigned_at"),
+    ("delivery_tracking", "ix_delivery_tracking_status", "status"),
+    ("delivery_tracking", "ix_delivery_tracking_completed_at", "completed_at"),
+    ("orders", "ix_orders_woocommerce_order_id", "woocommerce_order_id"),
+)
+
+
+def ensure_table_indexes():
+    """Crear en tablas ya existentes los índices declarados después de su creación"""
+    with engine.begin() as connection:
+        for table_name, index_name, columns in TABLE_INDEXES:
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns})"))
+
+
+def ensure_location_partitions(connection) -> List[str]:
+    """
+    Crear las particiones del periodo actual y de los siguientes
+    (LOCATION_PARTITIONS_AHEAD), más la partición DEFAULT
+    """
+    if not is_postgres():
+        return []
+
+    existing = list_location_partitions(connection)
+    created = []
+    start = period_start(datetime.utcnow())
+    for _ in range(settings.LOCATION_PARTITIONS_AHEAD + 1):
+        end = next_period(start)
+        overlaps = any(
+            (lower is None or lower < end) and (upper is None or upper > start)
+            for name, lower, upper in existing if name != LOCATION_DEFAULT_PARTITION
+        )
+        if not overlaps:
+            name = partition_name(start)
+            try:
+                with connection.begin_nested():
+                    connection.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {LOCATION_TABLE} "
+                        f"FOR VALUES FROM ('{start.isoformat(sep=' ')}') TO ('{end.isoformat(sep=' ')}')"
+                    ))
+                created.append(name)
+            except Exception as e:
+                # P. ej. la partición DEFAULT ya tiene filas de ese rango
+                logger.warning(f"No se pudo crear la partición {name}: {e}")
+        start = end
+
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {LOCATION_DEFAULT_PARTITION} PARTITION OF {LOCATION_TABLE} DEFAULT"
+    ))
+    if created:
+        logger.info(f"✅ Particiones de ubicaciones creadas: {', '.join(created)}")
+    return created
+
+
+def list_location_partitions(connection) -> List[Partition]:
+    """Particiones de location_updates con sus límites (None = sin límite)"""
+    rows = connection.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:name)"
+    ), {"name": LOCATION_TABLE}).all()
+
+    partitions = []
+    for name, bound in rows:
+        match = re.search(r"FROM \((.+?)\) TO \((.+?)\)", bound or "")
+        if match:
+            partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+        else:
+            partitions.append((name, None, None))
+    return sorted(partitions, key=lambda partition: partition[2] or datetime.max)
+
+
+def period_start(moment: datetime) -> datetime:
+    """Inicio del periodo de partición (mes o día) que contiene `moment`"""
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if settings.LOCATION_PARTITION_INTERVAL == "day":
+        return day
+    return day.replace(day=1)
+
+
+def next_period(start: datetime) -> datetime:
+    if settings.LOCATION_PARTITION_INTERVAL == "day":
+        return start + timedelta(days=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(start: datetime) -> str:
+    if settings.LOCATION_PARTITION_INTERVAL == "day":
+        return f"{LOCATION_TABLE}_p{start:%Y_%m_%d}"
+    return f"{LOCATION_TABLE}_p{start:%Y_%m}"
+
+
+def _parse_bound(value: str) -> Optional[datetime]:
+    value = value.strip()
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
 def create_default_roles():
     """Crea los roles por defecto si no existen"""
     db = SessionLocal()
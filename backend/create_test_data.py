@@ -49,7 +49,7 @@ def create_test_data():
                 status='assigned',
                 priority='normal',
                 delivery_address=test_order.shipping_address,
-                delivery_coordinates={'lat': 40.7128, 'lng': -74.0060},
+                delivery_coordinates={'lat': 40.7128, 'lng': -74.0060, 'source': 'explicit'},
                 estimated_arrival=datetime.utcnow(),
                 customer_name=test_order.customer_name,
                 customer_phone=test_order.customer_phone
@@ -57,7 +57,7 @@ class Order(Base):
     __tablename__ = "orders"
     
     id = Column(Integer, primary_key=True, index=True)
-    woocommerce_order_id = Column(Integer, nullable=True)  # ID de la orden en WooCommerce
+    woocommerce_order_id = Column(Integer, nullable=True, index=True)  # ID de la orden en WooCommerce
     session_id = Column(String(255), nullable=True)
     user_id = Column(Integer, nullable=True)
     
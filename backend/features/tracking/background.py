@@ -0,0 +1,42 @@
+"""
+Arranque y parada de los servicios en segundo plano del tracking
+"""
+import asyncio
+import logging
+
+from core.config import settings
+from features.tracking.broker import create_broker
+from features.tracking.eta import eta_engine
+from features.tracking.driver_stats import driver_stats_reconciler
+from features.tracking.events import tracking_bus
+from features.tracking.geofence import geofence_monitor
+from features.tracking.ingest import location_ingest
+from features.tracking.live_map import live_map_hub
+from features.tracking.live_store import live_driver_store
+from features.tracking.retention import location_retention
+
+logger = logging.getLogger(__name__)
+
+
+async def start_tracking_services():
+    """Iniciar broker de eventos y tareas de tracking"""
+    broker = create_broker(settings.TRACKING_BROKER_URL)
+    await tracking_bus.start(broker)
+    await asyncio.to_thread(live_driver_store.load)
+    await location_ingest.start()
+    await geofence_monitor.start()
+    await location_retention.start()
+    await driver_stats_reconciler.start()
+    await eta_engine.start()
+    await live_map_hub.start()
+
+
+async def stop_tracking_services():
+    """Detener las tareas de tracking"""
+    await live_map_hub.stop()
+    await eta_engine.stop()
+    await driver_stats_reconciler.stop()
+    await location_retention.stop()
+    await geofence_monitor.stop()
+    await location_ingest.stop()
+    await tracking_bus.stop()
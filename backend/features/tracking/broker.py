@@ -0,0 +1,344 @@
+"""
+Brokers de mensajes para distribuir eventos de tracking entre workers
+
+Backends disponibles (según TRACKING_BROKER_URL):
+- memory://                  Un solo proceso (por defecto)
+- postgresql://user:pw@host/db  LISTEN/NOTIFY de PostgreSQL
+- redis://host:6379          Protocolo Redis (PUBLISH/SUBSCRIBE)
+"""
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import asyncio
+import json
+import logging
+import queue
+import select
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Canales de eventos
+CHANNEL_LOCATION = "tracking_location"
+CHANNEL_DELIVERY = "tracking_delivery"
+CHANNEL_DRIVER = "tracking_driver"
+CHANNEL_WORKERS = "tracking_workers"
+CHANNELS = (CHANNEL_LOCATION, CHANNEL_DELIVERY, CHANNEL_DRIVER, CHANNEL_WORKERS)
+
+# Mensajes pendientes de enviar antes de empezar a descartar
+OUTBOX_SIZE = 10000
+# Segundos de espera antes de reconectar al broker
+RECONNECT_DELAY = 2
+# Límite de PostgreSQL para el payload de NOTIFY (bytes, sin incluir el terminador)
+MAX_NOTIFY_PAYLOAD_BYTES = 7999
+
+MessageHandler = Callable[[str, Dict[str, Any]], None]
+
+
+class TrackingBroker(ABC):
+    """Interfaz base de los brokers de eventos de tracking"""
+
+    name = "base"
+
+    def __init__(self):
+        self._handler: Optional[MessageHandler] = None
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    async def start(self, handler: MessageHandler):
+        """Iniciar el broker; `handler(channel, message)` recibe los mensajes de todos los workers"""
+        self._handler = handler
+
+    async def stop(self):
+        """Detener el broker"""
+        self._handler = None
+
+    @abstractmethod
+    def publish(self, channel: str, message: Dict[str, Any]):
+        """Publicar un mensaje sin bloquear (seguro desde cualquier hilo)"""
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores del broker"""
+        return {
+            "backend": self.name,
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped
+        }
+
+    def _deliver(self, channel: str, message: Dict[str, Any]):
+        self.received += 1
+        if self._handler is not None:
+            self._handler(channel, message)
+
+
+class InMemoryBroker(TrackingBroker):
+    """Broker en memoria: solo entrega mensajes dentro del mismo proceso"""
+
+    name = "memory"
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        self.published += 1
+        self._deliver(channel, message)
+
+
+class PostgresBroker(TrackingBroker):
+    """Broker basado en LISTEN/NOTIFY de PostgreSQL"""
+
+    name = "postgres"
+
+    def __init__(self, dsn: str):
+        super().__init__()
+        self._dsn = dsn
+        self._outbox: "queue.Queue[Tuple[str, str]]" = queue.Queue(maxsize=OUTBOX_SIZE)
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    async def start(self, handler: MessageHandler):
+        await super().start(handler)
+        self._stop_event.clear()
+        self._threads = [
+            threading.Thread(target=self._listen_loop, name="tracking-pg-listen", daemon=True),
+            threading.Thread(target=self._notify_loop, name="tracking-pg-notify", daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info("Broker de tracking PostgreSQL iniciado")
+
+    async def stop(self):
+        self._stop_event.set()
+        for thread in self._threads:
+            await asyncio.to_thread(thread.join, RECONNECT_DELAY + 1)
+        self._threads = []
+        await super().stop()
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        payload = json.dumps(message, default=str)
+        if len(payload.encode()) > MAX_NOTIFY_PAYLOAD_BYTES:
+            # pg_notify fallaría y forzaría la reconexión del hilo de envío
+            self.dropped += 1
+            logger.warning(f"Mensaje de tracking descartado en {channel}: excede el límite de NOTIFY")
+            return
+        try:
+            self._outbox.put_nowait((channel, payload))
+            self.published += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _connect(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        connection = psycopg2.connect(self._dsn)
+        connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        return connection
+
+    def _listen_loop(self):
+        while not self._stop_event.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                cursor = connection.cursor()
+                for channel in CHANNELS:
+                    cursor.execute(f"LISTEN {channel}")
+
+                while not self._stop_event.is_set():
+                    if select.select([connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        try:
+                            self._deliver(notify.channel, json.loads(notify.payload))
+                        except Exception as e:
+                            logger.error(f"Error procesando NOTIFY de tracking: {str(e)}")
+            except Exception as e:
+                logger.error(f"Error en LISTEN de tracking: {str(e)}")
+                self._stop_event.wait(RECONNECT_DELAY)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def _notify_loop(self):
+        while not self._stop_event.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                cursor = connection.cursor()
+                while not self._stop_event.is_set():
+                    try:
+                        channel, payload = self._outbox.get(timeout=1.0)
+                    except queue.Empty:
+                        continue
+                    cursor.execute("SELECT pg_notify(%s, %s)", (channel, payload))
+            except Exception as e:
+                logger.error(f"Error en NOTIFY de tracking: {str(e)}")
+                self._stop_event.wait(RECONNECT_DELAY)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+
+class RedisBroker(TrackingBroker):
+    """
+    Broker sobre el protocolo Redis (RESP)
+    - Solo usa AUTH, PUBLISH y SUBSCRIBE, por lo que cualquier servidor
+      compatible con el protocolo puede atenderlo
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        super().__init__()
+        parsed = urlparse(url)
+        self._host = parsed.hostname or "localhost"
+        self._port = parsed.port or 6379
+        self._password = parsed.password
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self, handler: MessageHandler):
+        await super().start(handler)
+        self._loop = asyncio.get_running_loop()
+        self._outbox = asyncio.Queue(maxsize=OUTBOX_SIZE)
+        self._tasks = [
+            asyncio.create_task(self._subscribe_loop()),
+            asyncio.create_task(self._publish_loop())
+        ]
+        logger.info(f"Broker de tracking Redis iniciado ({self._host}:{self._port})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await super().stop()
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        if self._loop is None:
+            self.dropped += 1
+            return
+        payload = json.dumps(message, default=str)
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self._loop:
+            self._enqueue(channel, payload)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, channel, payload)
+
+    def _enqueue(self, channel: str, payload: str):
+        try:
+            self._outbox.put_nowait((channel, payload))
+            self.published += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _open_connection(self):
+        reader, writer = await asyncio.open_connection(self._host, self._port)
+        if self._password:
+            writer.write(_encode_command("AUTH", self._password))
+            await writer.drain()
+            await _read_reply(reader)
+        return reader, writer
+
+    async def _subscribe_loop(self):
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._open_connection()
+                writer.write(_encode_command("SUBSCRIBE", *CHANNELS))
+                await writer.drain()
+
+                while True:
+                    reply = await _read_reply(reader)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        try:
+                            self._deliver(reply[1].decode(), json.loads(reply[2]))
+                        except Exception as e:
+                            logger.error(f"Error procesando mensaje Redis de tracking: {str(e)}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en SUBSCRIBE de tracking: {str(e)}")
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    async def _publish_loop(self):
+        pending: Optional[Tuple[str, str]] = None
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._open_connection()
+                while True:
+                    if pending is None:
+                        pending = await self._outbox.get()
+                    writer.write(_encode_command("PUBLISH", *pending))
+                    await writer.drain()
+                    await _read_reply(reader)
+                    pending = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en PUBLISH de tracking: {str(e)}")
+                await asyncio.sleep(RECONNECT_DELAY)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+
+def _encode_command(*args: str) -> bytes:
+    """Codificar un comando en formato RESP"""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg.encode() if isinstance(arg, str) else arg
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(parts)
+
+
+async def _read_reply(reader: asyncio.StreamReader) -> Any:
+    """Leer una respuesta RESP"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Conexión cerrada por el servidor")
+    prefix, data = line[:1], line[1:-2]
+
+    if prefix == b"+":
+        return data
+    if prefix == b"-":
+        raise RuntimeError(data.decode())
+    if prefix == b":":
+        return int(data)
+    if prefix == b"$":
+        length = int(data)
+        if length < 0:
+            return None
+        value = await reader.readexactly(length + 2)
+        return value[:-2]
+    if prefix == b"*":
+        count = int(data)
+        if count < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(count)]
+    raise ValueError(f"Respuesta RESP inválida: {line!r}")
+
+
+def create_broker(url: str) -> TrackingBroker:
+    """Crear el broker correspondiente a la URL configurada"""
+    scheme = urlparse(url).scheme.split("+")[0]
+
+    if scheme in ("", "memory"):
+        return InMemoryBroker()
+    if scheme in ("postgres", "postgresql"):
+        # psycopg2 no entiende el sufijo de driver de SQLAlchemy (postgresql+psycopg2://)
+        return PostgresBroker(url.replace(urlparse(url).scheme, "postgresql", 1))
+    if scheme == "redis":
+        return RedisBroker(url)
+
+    raise ValueError(f"Backend de broker de tracking no soportado: {url}")
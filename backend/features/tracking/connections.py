@@ -0,0 +1,212 @@
+"""
+Conexiones WebSocket de los clientes que siguen una orden
+
+Cada cliente tiene una cola de salida acotada (la de su OrderStream) que
+drena su propio handler: un cliente lento nunca frena a los demás. Si la
+cola se llena se descartan los mensajes más antiguos y el cliente recibe un
+snapshot; si sigue sin ponerse al día o un envío supera el tiempo máximo se
+le expulsa. Las conexiones se limitan por orden y por worker.
+"""
+from typing import Any, Dict, Optional, Set
+import asyncio
+import json
+import time
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from core.config import settings
+
+# Código de cierre para clientes rechazados o expulsados (reintentar más tarde)
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class ClientConnection:
+    """Conexión de un cliente con su cola de salida y métricas de envío"""
+
+    def __init__(self, websocket: WebSocket, order_number: str, manager: "ConnectionManager"):
+        self.websocket = websocket
+        self.order_number = order_number
+        self.queue: Optional[asyncio.Queue] = None
+        self.evicted = asyncio.Event()
+        self.eviction_reason: Optional[str] = None
+
+        self._manager = manager
+        self._receive_task: Optional[asyncio.Task] = None
+        # Desbordes seguidos de la cola sin que el cliente se ponga al día
+        self._strikes = 0
+
+        # Contadores
+        self.sent = 0
+        self.dropped = 0
+        self.overflows = 0
+        self.send_seconds = 0.0
+        self.max_send_seconds = 0.0
+
+    async def next_item(self) -> Optional[Any]:
+        """
+        Siguiente elemento de la cola de salida
+        - None si el cliente fue expulsado
+        - WebSocketDisconnect si el cliente se desconectó (sus mensajes se ignoran)
+        """
+        if self.queue.empty():
+            # El cliente está al día
+            self._strikes = 0
+
+        item_task = asyncio.create_task(self.queue.get())
+        evicted_task = asyncio.create_task(self.evicted.wait())
+        try:
+            while True:
+                if self._receive_task is None:
+                    self._receive_task = asyncio.create_task(self.websocket.receive())
+                done, _ = await asyncio.wait(
+                    {item_task, evicted_task, self._receive_task}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if evicted_task in done:
+                    return None
+                if self._receive_task in done:
+                    message = self._receive_task.result()
+                    self._receive_task = None
+                    if message["type"] == "websocket.disconnect":
+                        raise WebSocketDisconnect()
+                    continue
+                return item_task.result()
+        finally:
+            item_task.cancel()
+            evicted_task.cancel()
+
+    async def send_text(self, message: str):
+        """Enviar un mensaje midiendo la latencia; expulsa al cliente si excede el tiempo máximo"""
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self.websocket.send_text(message), timeout=self._manager.send_timeout)
+        except asyncio.TimeoutError:
+            self.evict("send_timeout")
+            raise
+        elapsed = time.monotonic() - started
+        self.sent += 1
+        self.send_seconds += elapsed
+        self.max_send_seconds = max(self.max_send_seconds, elapsed)
+
+    async def send_json(self, data: Dict[str, Any]):
+        await self.send_text(json.dumps(data))
+
+    def record_overflow(self, dropped: int):
+        """La cola se llenó y se descartaron `dropped` mensajes pendientes"""
+        self.dropped += dropped
+        self.overflows += 1
+        self._strikes += 1
+        if self._strikes >= self._manager.slow_client_strikes:
+            self.evict("slow_consumer")
+
+    def evict(self, reason: str):
+        if self.evicted.is_set():
+            return
+        self.eviction_reason = reason
+        self.evicted.set()
+        self._manager.evictions += 1
+
+    async def close(self):
+        """Cerrar el socket de un cliente expulsado"""
+        try:
+            await asyncio.wait_for(
+                self.websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason=self.eviction_reason or ""),
+                timeout=self._manager.send_timeout
+            )
+        except Exception as close_error:
+            print(f"Error closing evicted client: {close_error}")
+
+    def release(self):
+        if self._receive_task is not None:
+            self._receive_task.cancel()
+            self._receive_task = None
+
+
+class ConnectionManager:
+    """Conexiones de clientes de este worker agrupadas por orden"""
+
+    def __init__(self, max_connections: int = 5000, max_per_order: int = 20,
+                 send_timeout: float = 5.0, slow_client_strikes: int = 3):
+        self.max_connections = max_connections
+        self.max_per_order = max_per_order
+        self.send_timeout = send_timeout
+        self.slow_client_strikes = slow_client_strikes
+
+        self._connections: Dict[str, Set[ClientConnection]] = {}
+        self._count = 0
+
+        # Contadores de las conexiones ya cerradas (las abiertas se suman en stats)
+        self.accepted = 0
+        self.rejected = 0
+        self.evictions = 0
+        self._closed_totals = {"sent": 0, "dropped": 0, "overflows": 0, "send_seconds": 0.0}
+        self._max_send_seconds = 0.0
+
+    def connect(self, websocket: WebSocket, order_number: str) -> Optional[ClientConnection]:
+        """Registrar un cliente; None si se alcanzó el límite por orden o por worker"""
+        connections = self._connections.get(order_number)
+        if self._count >= self.max_connections or (
+            connections is not None and len(connections) >= self.max_per_order
+        ):
+            self.rejected += 1
+            return None
+
+        connection = ClientConnection(websocket, order_number, self)
+        self._connections.setdefault(order_number, set()).add(connection)
+        self._count += 1
+        self.accepted += 1
+        return connection
+
+    def disconnect(self, connection: ClientConnection):
+        connection.release()
+        connections = self._connections.get(connection.order_number)
+        if connections is None or connection not in connections:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self._connections[connection.order_number]
+        self._count -= 1
+
+        self._closed_totals["sent"] += connection.sent
+        self._closed_totals["dropped"] += connection.dropped
+        self._closed_totals["overflows"] += connection.overflows
+        self._closed_totals["send_seconds"] += connection.send_seconds
+        self._max_send_seconds = max(self._max_send_seconds, connection.max_send_seconds)
+
+    def orders(self):
+        return list(self._connections.keys())
+
+    def stats(self) -> Dict[str, Any]:
+        connections = [connection for group in self._connections.values() for connection in group]
+        depths = [connection.queue.qsize() for connection in connections if connection.queue is not None]
+        sent = self._closed_totals["sent"] + sum(connection.sent for connection in connections)
+        send_seconds = self._closed_totals["send_seconds"] + sum(
+            connection.send_seconds for connection in connections
+        )
+        max_send_seconds = max(
+            [self._max_send_seconds] + [connection.max_send_seconds for connection in connections]
+        )
+        return {
+            "connections": self._count,
+            "orders": len(self._connections),
+            "max_connections": self.max_connections,
+            "max_per_order": self.max_per_order,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "evictions": self.evictions,
+            "queue_depth": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "sent": sent,
+            "dropped": self._closed_totals["dropped"] + sum(connection.dropped for connection in connections),
+            "overflows": self._closed_totals["overflows"] + sum(connection.overflows for connection in connections),
+            "avg_send_ms": round(send_seconds / sent * 1000, 3) if sent else 0.0,
+            "max_send_ms": round(max_send_seconds * 1000, 3)
+        }
+
+
+# Instancia global de conexiones de clientes
+connection_manager = ConnectionManager(
+    max_connections=settings.WS_MAX_CONNECTIONS,
+    max_per_order=settings.WS_MAX_CONNECTIONS_PER_ORDER,
+    send_timeout=settings.WS_SEND_TIMEOUT,
+    slow_client_strikes=settings.WS_SLOW_CLIENT_STRIKES
+)
@@ -0,0 +1,144 @@
+"""
+Agregados del dashboard de administración
+
+Los contadores de conductores y entregas se calculan en una sola sentencia
+(COUNT(*) FILTER) y el dashboard completo se sirve desde una caché de TTL
+corto que se invalida con cada cambio de estado de conductores o entregas
+(canales tracking_driver y tracking_delivery, en todos los workers).
+"""
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import select, func, desc, true, and_, or_
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+import threading
+import time
+
+from core.config import settings
+from features.tracking.models import Driver, DeliveryTracking, DriverStats
+from features.tracking.broker import CHANNEL_DELIVERY, CHANNEL_DRIVER
+from features.tracking.events import tracking_bus
+
+ACTIVE_DELIVERY_STATUSES = ["assigned", "started", "in_progress"]
+RECENT_LIMIT = 10
+
+
+class DashboardService:
+    """Consultas del dashboard de administración"""
+
+    @staticmethod
+    def get_counters(db: Session) -> Dict[str, int]:
+        """Contadores de conductores y entregas en una sola consulta"""
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+        drivers = select(
+            func.count().label("total_drivers"),
+            func.count().filter(Driver.is_online.is_(True)).label("online_drivers"),
+            func.count().filter(Driver.is_available.is_(True)).label("available_drivers"),
+            func.count().filter(Driver.is_delivering.is_(True)).label("delivering_drivers")
+        ).subquery()
+
+        # Total histórico desde los contadores por conductor (no recorre delivery_tracking)
+        totals = select(
+            func.coalesce(func.sum(DriverStats.total_deliveries), 0).label("total_deliveries")
+        ).subquery()
+
+        # Solo entregas activas o completadas hoy (índices de status y completed_at)
+        completed_today = and_(
+            DeliveryTracking.status == "completed",
+            DeliveryTracking.completed_at >= today,
+            DeliveryTracking.completed_at < today + timedelta(days=1)
+        )
+        active = DeliveryTracking.status.in_(ACTIVE_DELIVERY_STATUSES)
+        deliveries = select(
+            func.count().filter(active).label("active_deliveries"),
+            func.count().filter(completed_today).label("completed_deliveries_today")
+        ).where(or_(active, completed_today)).subquery()
+
+        row = db.execute(
+            select(drivers, totals, deliveries).select_from(
+                drivers.join(totals, true()).join(deliveries, true())
+            )
+        ).one()
+        return dict(row._mapping)
+
+    @staticmethod
+    def get_recent_drivers(db: Session, limit: int = RECENT_LIMIT) -> List[Driver]:
+        """Últimos conductores con usuario y vehículo precargados"""
+        return db.query(Driver).options(
+            selectinload(Driver.user),
+            selectinload(Driver.vehicle)
+        ).order_by(desc(Driver.created_at)).limit(limit).all()
+
+    @staticmethod
+    def get_recent_deliveries(db: Session, limit: int = RECENT_LIMIT) -> List[DeliveryTracking]:
+        """Últimas entregas con conductor, vehículo y orden precargados"""
+        return db.query(DeliveryTracking).options(
+            selectinload(DeliveryTracking.driver).selectinload(Driver.user),
+            selectinload(DeliveryTracking.driver).selectinload(Driver.vehicle),
+            selectinload(DeliveryTracking.order)
+        ).order_by(desc(DeliveryTracking.assigned_at)).limit(limit).all()
+
+
+class DashboardCache:
+    """Caché de TTL corto del dashboard, invalidada por cambios de estado"""
+
+    def __init__(self, ttl: float = 10.0):
+        self.ttl = ttl
+        self._value: Optional[Any] = None
+        self._expires = 0.0
+        self._version = 0
+        self._lock = threading.Lock()
+
+        # Contadores
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self) -> Optional[Any]:
+        """Valor vigente o None"""
+        with self._lock:
+            if self._value is not None and time.monotonic() < self._expires:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            return None
+
+    def version(self) -> int:
+        """Versión actual; se pasa a set() para descartar cálculos invalidados a mitad"""
+        return self._version
+
+    def set(self, value: Any, version: int):
+        with self._lock:
+            if version == self._version:
+                self._value = value
+                self._expires = time.monotonic() + self.ttl
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._value = None
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations
+        }
+
+    def _on_driver_message(self, message: Dict[str, Any]):
+        # Los cambios del intervalo de reporte no cambian los contadores
+        if "sampling_interval" not in message:
+            self.invalidate()
+
+    def _on_delivery_message(self, message: Dict[str, Any]):
+        # Las actualizaciones de ETA/distancia no cambian los contadores
+        if message.get("type") == "status_update":
+            self.invalidate()
+
+
+# Instancia global de la caché del dashboard
+dashboard_cache = DashboardCache(ttl=settings.DASHBOARD_CACHE_TTL)
+tracking_bus.add_listener(CHANNEL_DRIVER, dashboard_cache._on_driver_message)
+tracking_bus.add_listener(CHANNEL_DELIVERY, dashboard_cache._on_delivery_message)
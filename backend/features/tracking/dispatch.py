@@ -0,0 +1,77 @@
+"""
+Motor de asignación automática de entregas
+
+Puntúa en una sola pasada vectorizada a todos los conductores online y
+disponibles frente a las coordenadas de la entrega, y bloquea la fila
+del mejor candidato libre para que dos asignaciones concurrentes no
+reserven al mismo conductor.
+
+Un conductor con una entrega activa deja de estar disponible, así que
+todos los candidatos tienen carga cero: se elige el más cercano.
+"""
+from sqlalchemy.orm import Session
+from typing import List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from core.config import settings
+from features.tracking.models import Driver
+from features.tracking.geo import haversine_km_many
+from features.tracking.live_store import live_driver_store
+
+logger = logging.getLogger(__name__)
+
+class DispatchEngine:
+    """Selección y bloqueo del mejor conductor para una entrega"""
+
+    def __init__(self, max_radius_km: float = 25.0):
+        self.max_radius_km = max_radius_km
+
+    def rank_drivers(self, lat: float, lng: float) -> List[Tuple[int, float]]:
+        """
+        Candidatos ordenados por distancia
+        - Retorna [(driver_id, distancia_km)] dentro del radio máximo
+        """
+        candidates = live_driver_store.dispatch_candidates()
+        if not candidates:
+            return []
+
+        driver_ids = np.array([record.driver_id for record in candidates])
+        lats = np.array([record.lat for record in candidates], dtype=float)
+        lngs = np.array([record.lng for record in candidates], dtype=float)
+
+        distances = haversine_km_many(lat, lng, lats, lngs)
+        in_range = distances <= self.max_radius_km
+        if not in_range.any():
+            return []
+        driver_ids, distances = driver_ids[in_range], distances[in_range]
+
+        order = np.argsort(distances, kind="stable")
+        return [(int(driver_ids[i]), float(distances[i])) for i in order]
+
+    def claim_best_driver(self, lat: float, lng: float, db: Session) -> Optional[Driver]:
+        """
+        Bloquear (SELECT ... FOR UPDATE SKIP LOCKED) el mejor conductor libre
+        - El bloqueo se mantiene hasta el commit de la asignación
+        - Los conductores bloqueados por otra asignación se saltan
+        """
+        for driver_id, distance in self.rank_drivers(lat, lng):
+            driver = db.query(Driver).filter(
+                Driver.id == driver_id,
+                Driver.is_online == True,
+                Driver.is_available == True
+            ).with_for_update(skip_locked=True).first()
+            if driver is not None:
+                logger.info(
+                    f"Conductor {driver_id} seleccionado automáticamente "
+                    f"(distancia {distance:.2f} km)"
+                )
+                return driver
+        return None
+
+
+# Instancia global del motor de asignación
+dispatch_engine = DispatchEngine(
+    max_radius_km=settings.DISPATCH_MAX_RADIUS_KM
+)
@@ -0,0 +1,272 @@
+"""
+Canal de ingesta de ubicaciones por WebSocket de los conductores
+
+Cada conexión lee el socket de forma continua y agrupa los pings: si llegan
+más rápido que el intervalo del conductor (el adaptativo de
+features.tracking.sampling, o el configurado en su perfil) solo se conserva
+el último y se envía a la ingesta cuando vence el intervalo. Las respuestas
+salen por una cola acotada, así un conductor lento no bloquea la lectura.
+
+Mensajes del servidor al conductor:
+    {"type": "config", "location_update_interval": segundos}
+    {"type": "ack", "timestamp": iso, "location": {...}, "coalesced": n}
+    {"type": "error", "error": "..."}
+"""
+from typing import Any, Dict, Optional, Set
+from datetime import datetime
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from core.database import SessionLocal
+from features.tracking.models import Driver
+from features.tracking.broker import CHANNEL_DRIVER
+from features.tracking.events import tracking_bus
+from features.tracking.ingest import location_ingest
+from features.tracking.sampling import sampling_controller
+from features.tracking.schemas import LocationUpdateRequest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCATION_INTERVAL = 30
+# Fracción del intervalo a partir de la cual se acepta un nuevo ping (tolera relojes del móvil)
+INTERVAL_TOLERANCE = 0.8
+# Mensajes salientes pendientes por conductor; los acks se descartan si se llena
+OUTBOUND_QUEUE_SIZE = 16
+LOCATION_FIELDS = ("latitude", "longitude")
+
+
+class DriverChannel:
+    """Conexión WebSocket de un conductor con agrupación de pings"""
+
+    def __init__(self, websocket: WebSocket, driver_id: int, interval: int):
+        self.websocket = websocket
+        self.driver_id = driver_id
+        self.interval = interval
+        self.loop = asyncio.get_running_loop()
+
+        self._outbound: asyncio.Queue = asyncio.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+        self._latest: Optional[LocationUpdateRequest] = None
+        self._coalesced = 0
+        self._last_accepted = 0.0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        # Contadores
+        self.received = 0
+        self.accepted = 0
+        self.coalesced = 0
+
+    async def run(self):
+        """Leer pings hasta que el conductor se desconecte"""
+        sender = asyncio.create_task(self._send_loop())
+        self.send_control({"type": "config", "location_update_interval": self.interval})
+        try:
+            while True:
+                data = await self.websocket.receive_json()
+                self.received += 1
+                self._on_ping(data)
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.warning(f"Conexión del conductor {self.driver_id} cerrada: {str(e)}")
+        finally:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+            # El último ping agrupado no se pierde al desconectar
+            self._accept_latest()
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+    def set_interval(self, interval: int):
+        """Cambiar el intervalo del conductor y notificárselo (seguro desde cualquier hilo)"""
+        self.loop.call_soon_threadsafe(self._apply_interval, interval)
+
+    def send_control(self, message: Dict[str, Any]):
+        """Encolar un mensaje de control; nunca se descarta"""
+        if self._outbound.full():
+            # Los acks pendientes son prescindibles
+            while not self._outbound.empty():
+                self._outbound.get_nowait()
+        self._outbound.put_nowait(message)
+
+    def _apply_interval(self, interval: int):
+        if interval == self.interval:
+            return
+        self.interval = interval
+        self.send_control({"type": "config", "location_update_interval": interval})
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._schedule_flush()
+
+    def _on_ping(self, data: Any):
+        if not isinstance(data, dict) or not all(data.get(key) is not None for key in LOCATION_FIELDS):
+            self._send_reply({
+                "type": "error",
+                "error": "Datos de ubicación incompletos",
+                "required": list(LOCATION_FIELDS)
+            })
+            return
+
+        # Mismas validaciones que el endpoint REST: un valor inválido haría fallar
+        # el lote compartido de la ingesta
+        try:
+            location = LocationUpdateRequest.model_validate(data)
+        except ValidationError as e:
+            errors = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+            )
+            self._send_reply({"type": "error", "error": f"Error actualizando ubicación: {errors}"})
+            return
+
+        if self._latest is not None:
+            self._coalesced += 1
+            self.coalesced += 1
+        self._latest = location
+
+        if self._flush_handle is None:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        delay = self._last_accepted + self.interval * INTERVAL_TOLERANCE - time.monotonic()
+        if delay <= 0:
+            self._flush_handle = None
+            self._accept_latest()
+        else:
+            self._flush_handle = self.loop.call_later(delay, self._on_flush_timer)
+
+    def _on_flush_timer(self):
+        self._flush_handle = None
+        self._accept_latest()
+
+    def _accept_latest(self):
+        location, coalesced = self._latest, self._coalesced
+        if location is None:
+            return
+        self._latest, self._coalesced = None, 0
+        self._last_accepted = time.monotonic()
+
+        try:
+            # Encolar en la ingesta por lotes (la BD se escribe en el flush, fuera del event loop)
+            accepted = location_ingest.submit(
+                self.driver_id,
+                location.latitude,
+                location.longitude,
+                accuracy=location.accuracy,
+                speed=location.speed,
+                heading=location.heading
+            )
+        except Exception as e:
+            self._send_reply({"type": "error", "error": f"Error actualizando ubicación: {str(e)}"})
+            return
+
+        self.accepted += 1
+        self._send_reply({
+            "type": "ack",
+            "success": True,
+            "message": "Ubicación actualizada",
+            "timestamp": datetime.utcnow().isoformat(),
+            "location": accepted,
+            "coalesced": coalesced
+        })
+
+    def _send_reply(self, message: Dict[str, Any]):
+        if not self._outbound.full():
+            self._outbound.put_nowait(message)
+
+    async def _send_loop(self):
+        while True:
+            message = await self._outbound.get()
+            try:
+                await self.websocket.send_text(json.dumps(message))
+            except Exception as send_error:
+                print(f"Error sending driver message: {send_error}")
+                return
+
+
+class DriverChannelRegistry:
+    """Conexiones de conductores de este worker"""
+
+    def __init__(self):
+        self._channels: Dict[int, Set[DriverChannel]] = {}
+        self._lock = threading.Lock()
+        self.received = 0
+        self.accepted = 0
+        self.coalesced = 0
+
+    async def serve(self, websocket: WebSocket, driver_id: int):
+        """Atender la conexión de un conductor (el socket ya fue aceptado)"""
+        interval = await asyncio.to_thread(_load_driver_interval, driver_id)
+        if interval is not None:
+            interval = sampling_controller.current_interval(driver_id) or interval
+        if interval is None:
+            try:
+                await websocket.send_json({"type": "error", "error": "Conductor no encontrado"})
+                await websocket.close()
+            except Exception as send_error:
+                print(f"Error sending driver not found: {send_error}")
+            return
+
+        channel = DriverChannel(websocket, driver_id, interval)
+        with self._lock:
+            self._channels.setdefault(driver_id, set()).add(channel)
+        try:
+            await channel.run()
+        finally:
+            with self._lock:
+                channels = self._channels.get(driver_id)
+                if channels is not None:
+                    channels.discard(channel)
+                    if not channels:
+                        del self._channels[driver_id]
+                self.received += channel.received
+                self.accepted += channel.accepted
+                self.coalesced += channel.coalesced
+
+    def set_interval(self, driver_id: int, interval: int):
+        """Enviar un nuevo intervalo a las conexiones locales del conductor"""
+        with self._lock:
+            channels = list(self._channels.get(driver_id, ()))
+        for channel in channels:
+            channel.set_interval(interval)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            channels = [channel for group in self._channels.values() for channel in group]
+        return {
+            "connections": len(channels),
+            "drivers": len(self._channels),
+            "received": self.received + sum(channel.received for channel in channels),
+            "accepted": self.accepted + sum(channel.accepted for channel in channels),
+            "coalesced": self.coalesced + sum(channel.coalesced for channel in channels)
+        }
+
+    def _on_driver_message(self, message: Dict[str, Any]):
+        # Con muestreo adaptativo el intervalo fijo del perfil no se envía al conductor
+        if sampling_controller.enabled:
+            interval = message.get("sampling_interval")
+        else:
+            interval = message.get("location_update_interval")
+        if interval:
+            self.set_interval(message["driver_id"], interval)
+
+
+def _load_driver_interval(driver_id: int) -> Optional[int]:
+    """Intervalo configurado del conductor, o None si no existe"""
+    db = SessionLocal()
+    try:
+        row = db.query(Driver.location_update_interval).filter(Driver.id == driver_id).first()
+    finally:
+        db.close()
+    if row is None:
+        return None
+    return row[0] or DEFAULT_LOCATION_INTERVAL
+
+
+# Instancia global de conexiones de conductores
+driver_channels = DriverChannelRegistry()
+tracking_bus.add_listener(CHANNEL_DRIVER, driver_channels._on_driver_message)
@@ -0,0 +1,236 @@
+"""
+Contadores de entregas por conductor
+
+driver_stats guarda los totales de cada conductor y se actualiza en la
+misma transacción que la asignación o el cambio de estado, por lo que leer
+las estadísticas no depende del tamaño del historial. Una tarea periódica
+los reconstruye desde delivery_tracking para corregir cualquier desvío.
+Las entregas de los últimos 30 días se cuentan con el índice
+(driver_id, assigned_at): el costo depende solo de la actividad reciente.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import logging
+
+from core.config import settings
+from core.database import SessionLocal
+from features.tracking.models import DeliveryTracking, DriverStats
+
+logger = logging.getLogger(__name__)
+
+# Estados finales contados y su columna en driver_stats
+COUNTED_STATUSES = {
+    "completed": "completed_deliveries",
+    "failed": "failed_deliveries"
+}
+RECENT_DAYS = 30
+# Clave del advisory lock de la reconciliación
+RECONCILE_LOCK_KEY = 734203
+# INSERT con ON CONFLICT por dialecto (los demás usan UPDATE y luego INSERT)
+UPSERT_DIALECTS = {
+    "postgresql": postgresql_insert,
+    "sqlite": sqlite_insert
+}
+
+
+class DriverStatsService:
+    """Mantenimiento y lectura de driver_stats"""
+
+    @staticmethod
+    def record_assignment(driver_id: int, db: Session):
+        """Contar una entrega asignada (sin commit: va en la transacción del llamador)"""
+        _increment(db, driver_id, {"total_deliveries": 1})
+
+    @staticmethod
+    def record_status_change(driver_id: int, old_status: str, new_status: str, db: Session):
+        """Ajustar los contadores de estados finales (sin commit)"""
+        if old_status == new_status:
+            return
+        deltas: Dict[str, int] = {}
+        if old_status in COUNTED_STATUSES:
+            deltas[COUNTED_STATUSES[old_status]] = -1
+        if new_status in COUNTED_STATUSES:
+            column = COUNTED_STATUSES[new_status]
+            deltas[column] = deltas.get(column, 0) + 1
+        if deltas:
+            _increment(db, driver_id, deltas)
+
+    @staticmethod
+    def get_stats(driver_ids: List[int], db: Session) -> Dict[int, Dict[str, Any]]:
+        """Estadísticas de varios conductores: una fila de driver_stats por conductor"""
+        stats = {
+            driver_id: {
+                "total_deliveries": 0,
+                "completed_deliveries": 0,
+                "failed_deliveries": 0,
+                "success_rate": 0.0,
+                "recent_deliveries_30_days": 0
+            }
+            for driver_id in driver_ids
+        }
+        if not driver_ids:
+            return stats
+
+        rows = db.query(
+            DriverStats.driver_id,
+            DriverStats.total_deliveries,
+            DriverStats.completed_deliveries,
+            DriverStats.failed_deliveries
+        ).filter(DriverStats.driver_id.in_(list(stats))).all()
+
+        for driver_id, total, completed, failed in rows:
+            stats[driver_id].update({
+                "total_deliveries": total,
+                "completed_deliveries": completed,
+                "failed_deliveries": failed,
+                "success_rate": round(completed / total * 100, 2) if total > 0 else 0.0
+            })
+
+        since = datetime.utcnow() - timedelta(days=RECENT_DAYS)
+        recent = db.query(DeliveryTracking.driver_id, func.count()).filter(
+            DeliveryTracking.driver_id.in_(list(stats)),
+            DeliveryTracking.assigned_at >= since
+        ).group_by(DeliveryTracking.driver_id).all()
+
+        for driver_id, count in recent:
+            stats[driver_id]["recent_deliveries_30_days"] = count
+
+        return stats
+
+    @staticmethod
+    def reconcile(db: Session) -> int:
+        """
+        Reconstruir driver_stats desde delivery_tracking
+        - En PostgreSQL bloquea driver_stats para no perder incrementos concurrentes
+        - Retorna el número de conductores corregidos
+        """
+        if db.bind.dialect.name == "postgresql":
+            locked = db.execute(
+                text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": RECONCILE_LOCK_KEY}
+            ).scalar()
+            if not locked:
+                return 0
+            db.execute(text("LOCK TABLE driver_stats IN SHARE ROW EXCLUSIVE MODE"))
+
+        actual = {
+            driver_id: {
+                "total_deliveries": total,
+                "completed_deliveries": completed,
+                "failed_deliveries": failed
+            }
+            for driver_id, total, completed, failed in db.query(
+                DeliveryTracking.driver_id,
+                func.count(),
+                func.count().filter(DeliveryTracking.status == "completed"),
+                func.count().filter(DeliveryTracking.status == "failed")
+            ).group_by(DeliveryTracking.driver_id).all()
+        }
+
+        fixed = 0
+        stored = {row.driver_id: row for row in db.query(DriverStats).all()}
+        for driver_id, counters in actual.items():
+            row = stored.pop(driver_id, None)
+            if row is None:
+                db.add(DriverStats(driver_id=driver_id, **counters))
+                fixed += 1
+            elif any(getattr(row, column) != value for column, value in counters.items()):
+                for column, value in counters.items():
+                    setattr(row, column, value)
+                fixed += 1
+
+        # Conductores cuyo historial ya no tiene entregas
+        for row in stored.values():
+            if row.total_deliveries or row.completed_deliveries or row.failed_deliveries:
+                row.total_deliveries = row.completed_deliveries = row.failed_deliveries = 0
+                fixed += 1
+
+        db.commit()
+        return fixed
+
+
+class DriverStatsReconcileJob:
+    """Tarea periódica que reconstruye driver_stats (la primera ejecución es al arrancar)"""
+
+    def __init__(self, interval_seconds: int = 86400):
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[datetime] = None
+        self.last_fixed = 0
+
+    async def start(self):
+        """Iniciar la tarea periódica"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Detener la tarea periódica"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error(f"Error reconciliando estadísticas de conductores: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def run_once(self) -> int:
+        db = SessionLocal()
+        try:
+            fixed = DriverStatsService.reconcile(db)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self.last_run = datetime.utcnow()
+        self.last_fixed = fixed
+        if fixed:
+            logger.info(f"Estadísticas de conductores reconciliadas: {fixed} corregidos")
+        return fixed
+
+
+def _increment(db: Session, driver_id: int, deltas: Dict[str, int]):
+    """
+    Sumar deltas a la fila del conductor (creándola si no existe)
+    - PostgreSQL/SQLite: un solo INSERT ... ON CONFLICT DO UPDATE, atómico aunque
+      dos transacciones creen la fila a la vez
+    """
+    dialect_insert = UPSERT_DIALECTS.get(db.bind.dialect.name)
+    initial = {
+        "total_deliveries": 0, "completed_deliveries": 0, "failed_deliveries": 0,
+        **{column: max(delta, 0) for column, delta in deltas.items()}
+    }
+    increments = {column: getattr(DriverStats, column) + delta for column, delta in deltas.items()}
+
+    if dialect_insert is not None:
+        db.execute(
+            dialect_insert(DriverStats)
+            .values(driver_id=driver_id, **initial)
+            .on_conflict_do_update(
+                index_elements=[DriverStats.driver_id],
+                set_={**increments, "updated_at": func.now()}
+            )
+        )
+        return
+
+    updated = db.query(DriverStats).filter(DriverStats.driver_id == driver_id).update(
+        increments, synchronize_session=False
+    )
+    if not updated:
+        db.add(DriverStats(driver_id=driver_id, **initial))
+        db.flush()
+
+
+# Instancia global de la reconciliación de estadísticas
+driver_stats_reconciler = DriverStatsReconcileJob(
+    interval_seconds=settings.DRIVER_STATS_RECONCILE_INTERVAL
+)
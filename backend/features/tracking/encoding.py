@@ -0,0 +1,182 @@
+"""
+Codificaciones compactas de trayectorias (historial y rutas de entrega)
+
+Formatos:
+- json      Lista de objetos (formato original)
+- polyline  Coordenadas en polyline de Google (precisión 1e-5) y arreglos
+            delta de timestamps, velocidad y dirección
+- binary    Columnar con enteros varint zigzag delta-codificados
+
+Formato binario (todos los enteros son varint):
+    b"TRK" + versión (1 byte)
+    número de puntos N
+    N deltas zigzag de latitud  (grados * 1e5)
+    N deltas zigzag de longitud (grados * 1e5)
+    N deltas zigzag de timestamp (segundos epoch UTC, el primero absoluto)
+    N velocidades (km/h * 10 + 1; 0 = sin dato)
+    N direcciones (grados + 1; 0 = sin dato)
+"""
+from typing import Any, Dict, List, Optional, Sequence
+from datetime import datetime, timezone
+
+import numpy as np
+
+TRACK_MAGIC = b"TRK"
+TRACK_VERSION = 1
+COORDINATE_SCALE = 1e5
+SPEED_SCALE = 10
+
+TRACK_FORMATS = ("json", "polyline", "binary")
+# Tipos MIME aceptados en el header Accept
+BINARY_MEDIA_TYPE = "application/vnd.tracking.track"
+POLYLINE_MEDIA_TYPE = "application/vnd.tracking.polyline+json"
+
+
+def resolve_track_format(format: Optional[str], accept: Optional[str]) -> str:
+    """Formato de respuesta según el parámetro `format` o el header Accept"""
+    if format:
+        return format
+    accept = accept or ""
+    if BINARY_MEDIA_TYPE in accept or "application/octet-stream" in accept:
+        return "binary"
+    if POLYLINE_MEDIA_TYPE in accept:
+        return "polyline"
+    return "json"
+
+
+def encode_track_polyline(points: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Trayectoria como polyline + arreglos delta de tiempo, velocidad y dirección"""
+    lats, lngs, times = _columns(points)
+    time_deltas = np.diff(times, prepend=0).tolist() if len(points) else []
+
+    return {
+        "encoding": "polyline",
+        "precision": 5,
+        "count": len(points),
+        "polyline": encode_polyline(lats, lngs),
+        "timestamps": time_deltas,
+        "speed": [_round(point.get("speed"), 1) for point in points],
+        "heading": [_round(point.get("heading"), 0) for point in points]
+    }
+
+
+def encode_track_binary(points: Sequence[Dict[str, Any]]) -> bytes:
+    """Trayectoria en el formato binario columnar (ver docstring del módulo)"""
+    lats, lngs, times = _columns(points)
+    out = bytearray(TRACK_MAGIC)
+    out.append(TRACK_VERSION)
+    _write_varint(out, len(points))
+
+    for values in (_scaled_deltas(lats), _scaled_deltas(lngs), np.diff(times, prepend=0)):
+        for value in values.tolist():
+            _write_varint(out, _zigzag(value))
+
+    for point in points:
+        _write_varint(out, _optional_scaled(point.get("speed"), SPEED_SCALE))
+    for point in points:
+        _write_varint(out, _optional_scaled(point.get("heading"), 1))
+    return bytes(out)
+
+
+def decode_track_binary(data: bytes) -> List[Dict[str, Any]]:
+    """Decodificar el formato binario (referencia para los clientes)"""
+    if data[:3] != TRACK_MAGIC or data[3] != TRACK_VERSION:
+        raise ValueError("Formato de trayectoria binaria no soportado")
+
+    position = 4
+    count, position = _read_varint(data, position)
+    columns = []
+    for _ in range(5):
+        values = []
+        for _ in range(count):
+            value, position = _read_varint(data, position)
+            values.append(value)
+        columns.append(values)
+
+    lats = np.cumsum([_unzigzag(value) for value in columns[0]]) / COORDINATE_SCALE
+    lngs = np.cumsum([_unzigzag(value) for value in columns[1]]) / COORDINATE_SCALE
+    times = np.cumsum([_unzigzag(value) for value in columns[2]])
+
+    return [
+        {
+            "latitude": float(lats[i]),
+            "longitude": float(lngs[i]),
+            "timestamp": datetime.fromtimestamp(int(times[i]), tz=timezone.utc).replace(tzinfo=None),
+            "speed": (columns[3][i] - 1) / SPEED_SCALE if columns[3][i] else None,
+            "heading": float(columns[4][i] - 1) if columns[4][i] else None
+        }
+        for i in range(count)
+    ]
+
+
+def encode_polyline(lats: np.ndarray, lngs: np.ndarray) -> str:
+    """Codificar coordenadas con el algoritmo polyline de Google (precisión 1e-5)"""
+    lat_deltas = _scaled_deltas(lats).tolist()
+    lng_deltas = _scaled_deltas(lngs).tolist()
+
+    chunks: List[str] = []
+    for lat_delta, lng_delta in zip(lat_deltas, lng_deltas):
+        for value in (lat_delta, lng_delta):
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def _columns(points: Sequence[Dict[str, Any]]):
+    count = len(points)
+    lats = np.fromiter((point["latitude"] for point in points), dtype=float, count=count)
+    lngs = np.fromiter((point["longitude"] for point in points), dtype=float, count=count)
+    times = np.fromiter((_epoch_seconds(point["timestamp"]) for point in points), dtype=np.int64, count=count)
+    return lats, lngs, times
+
+
+def _scaled_deltas(values: np.ndarray) -> np.ndarray:
+    scaled = np.round(values * COORDINATE_SCALE).astype(np.int64)
+    return np.diff(scaled, prepend=0)
+
+
+def _epoch_seconds(value: datetime) -> int:
+    # Los timestamps del historial son UTC sin zona horaria
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _optional_scaled(value: Optional[float], scale: int) -> int:
+    if value is None:
+        return 0
+    return max(int(round(value * scale)), 0) + 1
+
+
+def _round(value: Optional[float], digits: int) -> Optional[float]:
+    return round(value, digits) if value is not None else None
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, position: int):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
@@ -0,0 +1,287 @@
+"""
+Motor de ETA suavizado
+
+Mantiene en memoria un modelo de velocidad por conductor (EWMA de las
+últimas N posiciones, usando la velocidad reportada o la derivada del
+desplazamiento) y, en un tick periódico, recalcula en una sola pasada
+vectorizada la distancia restante y la hora estimada de llegada de todas
+las entregas activas. Los cambios se persisten con un único UPDATE.
+"""
+from sqlalchemy import update, case, text
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import threading
+
+import numpy as np
+
+from core.config import settings
+from core.database import SessionLocal
+from features.tracking.models import DeliveryTracking
+from features.tracking.broker import CHANNEL_LOCATION
+from features.tracking.events import tracking_bus
+from features.tracking.geo import haversine_km, haversine_km_many
+from features.tracking.live_store import live_driver_store
+
+logger = logging.getLogger(__name__)
+
+# Estados de entrega con ETA
+ACTIVE_DELIVERY_STATUSES = ["assigned", "started", "in_progress"]
+# Velocidad inicial de un conductor sin historial y velocidad mínima usada en la ETA (km/h)
+DEFAULT_SPEED_KMH = 30.0
+MIN_SPEED_KMH = 8.0
+# Velocidades derivadas por encima de esto se consideran saltos de GPS
+MAX_SPEED_KMH = 150.0
+# Separación máxima entre posiciones para derivar la velocidad (segundos)
+MAX_SAMPLE_GAP_SECONDS = 300
+# Distancia a la que se considera que el conductor ya llegó (km)
+ARRIVAL_RADIUS_KM = 0.05
+# Cambios mínimos para volver a persistir/notificar una entrega
+MIN_DISTANCE_CHANGE_KM = 0.01
+MIN_ETA_CHANGE_SECONDS = 30
+# Clave del advisory lock: solo un worker persiste cada tick
+ETA_LOCK_KEY = 734202
+
+
+class DriverSpeedModel:
+    """Velocidad suavizada (EWMA) y última posición de un conductor"""
+
+    __slots__ = ("speed_kmh", "samples", "lat", "lng", "fix_time")
+
+    def __init__(self):
+        self.speed_kmh = DEFAULT_SPEED_KMH
+        self.samples = 0
+        self.lat: Optional[float] = None
+        self.lng: Optional[float] = None
+        self.fix_time: Optional[datetime] = None
+
+
+class EtaEngine:
+    """Modelos de velocidad por conductor y recálculo periódico de ETAs"""
+
+    def __init__(self, tick_interval: float = 5.0, ewma_window: int = 10, road_factor: float = 1.3):
+        self.tick_interval = tick_interval
+        self.alpha = 2.0 / (ewma_window + 1)
+        self.road_factor = road_factor
+
+        self._models: Dict[int, DriverSpeedModel] = {}
+        # delivery_id -> (driver_id, lat destino, lng destino), refrescado en cada tick
+        self._destinations: Dict[int, Tuple[int, float, float]] = {}
+        # driver_id -> [(delivery_id, lat destino, lng destino)] por antigüedad de asignación
+        self._driver_destinations: Dict[int, List[Tuple[int, float, float]]] = {}
+        # delivery_id -> (distancia, llegada) persistidas
+        self._published: Dict[int, Tuple[float, datetime]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        # Contadores
+        self.ticks = 0
+        self.last_tick_ms = 0.0
+        self.last_updated = 0
+
+    async def start(self):
+        """Iniciar el tick periódico"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Detener el tick periódico"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def observe(self, driver_id: int, lat: float, lng: float,
+                speed: Optional[float] = None, fix_time: Optional[datetime] = None):
+        """Incorporar una posición al modelo de velocidad del conductor (O(1))"""
+        fix_time = fix_time or datetime.utcnow()
+        with self._lock:
+            model = self._models.get(driver_id)
+            if model is None:
+                model = self._models[driver_id] = DriverSpeedModel()
+            elif model.fix_time is not None and fix_time <= model.fix_time:
+                return
+
+            sample = speed
+            if sample is None and model.fix_time is not None:
+                elapsed = (fix_time - model.fix_time).total_seconds()
+                if 0 < elapsed <= MAX_SAMPLE_GAP_SECONDS:
+                    sample = haversine_km(model.lat, model.lng, lat, lng) / elapsed * 3600
+
+            if sample is not None and 0 <= sample <= MAX_SPEED_KMH:
+                if model.samples == 0:
+                    model.speed_kmh = sample
+                else:
+                    model.speed_kmh += self.alpha * (sample - model.speed_kmh)
+                model.samples += 1
+
+            model.lat, model.lng, model.fix_time = lat, lng, fix_time
+
+    def driver_speed(self, driver_id: int) -> float:
+        """Velocidad suavizada usada para la ETA (km/h)"""
+        model = self._models.get(driver_id)
+        speed = model.speed_kmh if model is not None else DEFAULT_SPEED_KMH
+        return max(speed, MIN_SPEED_KMH)
+
+    def estimate(self, driver_id: int, lat: float, lng: float,
+                 delivery_id: Optional[int] = None) -> Tuple[Optional[float], Optional[datetime]]:
+        """
+        Distancia restante (km) y llegada estimada para una posición
+        - Usa los destinos cargados en el último tick (sin consultar la BD)
+        - Sin delivery_id usa la entrega activa más antigua del conductor
+        """
+        if delivery_id is not None:
+            destination = self._destinations.get(delivery_id)
+            if destination is None or destination[0] != driver_id:
+                return None, None
+            dest_lat, dest_lng = destination[1], destination[2]
+        else:
+            pending = self._driver_destinations.get(driver_id)
+            if not pending:
+                return None, None
+            _, dest_lat, dest_lng = pending[0]
+
+        distance = haversine_km(lat, lng, dest_lat, dest_lng) * self.road_factor
+        hours = 0.0 if distance <= ARRIVAL_RADIUS_KM else distance / self.driver_speed(driver_id)
+        return round(distance, 2), datetime.utcnow() + timedelta(hours=hours)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "drivers_modeled": len(self._models),
+            "active_deliveries": len(self._destinations),
+            "ticks": self.ticks,
+            "last_tick_ms": round(self.last_tick_ms, 2),
+            "last_updated": self.last_updated
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            try:
+                await asyncio.to_thread(self.tick)
+            except Exception as e:
+                logger.error(f"Error recalculando ETAs: {str(e)}")
+
+    def tick(self, now: Optional[datetime] = None) -> int:
+        """
+        Recalcular y persistir las ETAs de todas las entregas activas
+        - Todos los workers refrescan los destinos (los usa estimate());
+          solo el que obtiene el advisory lock persiste y notifica
+        """
+        started = datetime.utcnow()
+        now = now or started
+        db = SessionLocal()
+        try:
+            deliveries = db.query(
+                DeliveryTracking.id, DeliveryTracking.driver_id, DeliveryTracking.delivery_coordinates
+            ).filter(
+                DeliveryTracking.status.in_(ACTIVE_DELIVERY_STATUSES),
+                DeliveryTracking.delivery_coordinates.isnot(None)
+            ).order_by(DeliveryTracking.assigned_at, DeliveryTracking.id).all()
+
+            destinations = {}
+            driver_destinations: Dict[int, List[Tuple[int, float, float]]] = {}
+            for delivery_id, driver_id, coordinates in deliveries:
+                if coordinates and coordinates.get("lat") is not None and coordinates.get("lng") is not None:
+                    destinations[delivery_id] = (driver_id, coordinates["lat"], coordinates["lng"])
+                    driver_destinations.setdefault(driver_id, []).append(
+                        (delivery_id, coordinates["lat"], coordinates["lng"])
+                    )
+            self._destinations = destinations
+            self._driver_destinations = driver_destinations
+            self._published = {key: value for key, value in self._published.items() if key in destinations}
+
+            if db.bind.dialect.name == "postgresql":
+                locked = db.execute(
+                    text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": ETA_LOCK_KEY}
+                ).scalar()
+                if not locked:
+                    db.commit()
+                    return 0
+
+            changed = self._compute(destinations, now)
+            if changed:
+                db.execute(
+                    update(DeliveryTracking)
+                    .where(DeliveryTracking.id.in_(list(changed)))
+                    .values(
+                        distance_remaining=case(
+                            {delivery_id: value[0] for delivery_id, value in changed.items()},
+                            value=DeliveryTracking.id
+                        ),
+                        estimated_arrival=case(
+                            {delivery_id: value[1] for delivery_id, value in changed.items()},
+                            value=DeliveryTracking.id
+                        )
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self._published.update(changed)
+        for delivery_id, (distance, arrival) in changed.items():
+            tracking_bus.publish_delivery_event(delivery_id, {
+                "type": "delivery_update",
+                "distance_remaining": distance,
+                "estimated_arrival": arrival.isoformat()
+            })
+
+        self.ticks += 1
+        self.last_updated = len(changed)
+        self.last_tick_ms = (datetime.utcnow() - started).total_seconds() * 1000
+        return len(changed)
+
+    def _compute(self, destinations: Dict[int, Tuple[int, float, float]],
+                 now: datetime) -> Dict[int, Tuple[float, datetime]]:
+        """Pasada vectorizada: distancias y llegadas de las entregas con posición conocida"""
+        delivery_ids: List[int] = []
+        rows: List[Tuple[float, float, float, float, float]] = []
+        for delivery_id, (driver_id, dest_lat, dest_lng) in destinations.items():
+            record = live_driver_store.get(driver_id)
+            if record is None or not record.has_location:
+                continue
+            delivery_ids.append(delivery_id)
+            rows.append((record.lat, record.lng, dest_lat, dest_lng, self.driver_speed(driver_id)))
+        if not rows:
+            return {}
+
+        data = np.array(rows, dtype=float)
+        distances = haversine_km_many(data[:, 0], data[:, 1], data[:, 2], data[:, 3]) * self.road_factor
+        hours = np.where(distances <= ARRIVAL_RADIUS_KM, 0.0, distances / data[:, 4])
+        seconds = np.round(hours * 3600)
+
+        changed = {}
+        for delivery_id, distance, offset in zip(delivery_ids, distances.tolist(), seconds.tolist()):
+            distance = round(distance, 2)
+            arrival = now + timedelta(seconds=offset)
+            previous = self._published.get(delivery_id)
+            if (previous is None
+                    or abs(previous[0] - distance) >= MIN_DISTANCE_CHANGE_KM
+                    or abs((previous[1] - arrival).total_seconds()) >= MIN_ETA_CHANGE_SECONDS):
+                changed[delivery_id] = (distance, arrival)
+        return changed
+
+    def _on_location_message(self, message: Dict[str, Any]):
+        location = message["location"]
+        timestamp = location.get("timestamp")
+        self.observe(
+            message["driver_id"],
+            location["lat"],
+            location["lng"],
+            speed=location.get("speed"),
+            fix_time=datetime.fromisoformat(timestamp) if timestamp else None
+        )
+
+
+# Instancia global del motor de ETA
+eta_engine = EtaEngine(
+    tick_interval=settings.ETA_TICK_INTERVAL,
+    ewma_window=settings.ETA_EWMA_WINDOW,
+    road_factor=settings.ETA_ROAD_FACTOR
+)
+tracking_bus.add_listener(CHANNEL_LOCATION, eta_engine._on_location_message)
@@ -0,0 +1,240 @@
+"""
+Bus de eventos en proceso para el tracking en tiempo real
+
+Los conductores publican una vez por ping y los clientes suscritos a una
+entrega reciben el evento solo cuando algo cambia, sin consultar la BD.
+Los eventos viajan por un broker (memoria, PostgreSQL o Redis) para que
+lleguen a los clientes conectados a cualquier worker.
+"""
+from typing import Any, Callable, Dict, List, Optional, Set
+import asyncio
+import logging
+import os
+import socket
+import time
+
+from features.tracking.broker import (
+    TrackingBroker, InMemoryBroker, CHANNEL_LOCATION, CHANNEL_DELIVERY, CHANNEL_DRIVER, CHANNEL_WORKERS
+)
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo de la cola de eventos por suscriptor
+SUBSCRIBER_QUEUE_SIZE = 100
+# Intervalo (segundos) del heartbeat de estado de cada worker
+WORKER_HEARTBEAT_INTERVAL = 5
+
+# Identificador de este worker dentro del cluster
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+
+class TrackingEventBus:
+    """Distribuye eventos de ubicación y estado a los suscriptores de cada entrega"""
+
+    def __init__(self):
+        # delivery_id -> colas de los suscriptores
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        # driver_id -> entregas con suscriptores de ese conductor
+        self._driver_deliveries: Dict[int, Set[int]] = {}
+        # delivery_id -> driver_id
+        self._delivery_driver: Dict[int, int] = {}
+        # Última ubicación enviada por conductor (para evitar eventos repetidos)
+        self._last_locations: Dict[int, Dict[str, Any]] = {}
+        # canal -> funciones que reciben todos los mensajes del canal
+        self._listeners: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self._broker: TrackingBroker = InMemoryBroker()
+        self._started = False
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._stats_provider: Optional[Callable[[], Dict[str, Any]]] = None
+        # worker_id -> (estadísticas, instante de recepción)
+        self._workers: Dict[str, tuple] = {}
+
+    async def start(self, broker: TrackingBroker):
+        """Conectar el bus al broker y empezar a emitir heartbeats"""
+        self._loop = asyncio.get_running_loop()
+        self._broker = broker
+        await broker.start(self._on_broker_message)
+        self._started = True
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        logger.info(f"Bus de tracking iniciado: worker {WORKER_ID}, broker {broker.name}")
+
+    async def stop(self):
+        """Detener heartbeats y broker"""
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        if self._started:
+            await self._broker.stop()
+            self._started = False
+
+    def add_listener(self, channel: str, listener: Callable[[Dict[str, Any]], None]):
+        """
+        Registrar una función que recibe todos los mensajes de un canal
+        - Se invoca desde el hilo del broker, debe ser thread-safe
+        """
+        self._listeners.setdefault(channel, []).append(listener)
+
+    def set_stats_provider(self, provider: Callable[[], Dict[str, Any]]):
+        """Registrar la función que reporta las conexiones de este worker"""
+        self._stats_provider = provider
+
+    def subscribe(self, delivery_id: int, driver_id: int) -> asyncio.Queue:
+        """Suscribirse a los eventos de una entrega"""
+        self._loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(delivery_id, set()).add(queue)
+        self._driver_deliveries.setdefault(driver_id, set()).add(delivery_id)
+        self._delivery_driver[delivery_id] = driver_id
+        return queue
+
+    def unsubscribe(self, delivery_id: int, queue: asyncio.Queue):
+        """Cancelar suscripción a una entrega"""
+        queues = self._subscribers.get(delivery_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if queues:
+            return
+
+        # Sin suscriptores: limpiar índices de la entrega
+        del self._subscribers[delivery_id]
+        driver_id = self._delivery_driver.pop(delivery_id, None)
+        deliveries = self._driver_deliveries.get(driver_id)
+        if deliveries is not None:
+            deliveries.discard(delivery_id)
+            if not deliveries:
+                del self._driver_deliveries[driver_id]
+
+    def publish_location(self, driver_id: int, location: Dict[str, Any], **extra: Any):
+        """Publicar la ubicación de un conductor (una vez por ping)"""
+        event = {"type": "location_update", "driver_id": driver_id, "location": location, **extra}
+        self._publish(CHANNEL_LOCATION, event)
+
+    def publish_delivery_event(self, delivery_id: int, event: Dict[str, Any]):
+        """Publicar un evento (cambio de estado, ETA, etc.) de una entrega"""
+        self._publish(CHANNEL_DELIVERY, {**event, "delivery_id": delivery_id})
+
+    def publish_driver_state(self, driver_id: int, state: Dict[str, Any]):
+        """Publicar cambios de estado o datos de un conductor"""
+        self._publish(CHANNEL_DRIVER, {**state, "driver_id": driver_id})
+
+    def subscriber_count(self, delivery_id: Optional[int] = None) -> int:
+        """Número de suscriptores de una entrega o de todas"""
+        if delivery_id is not None:
+            return len(self._subscribers.get(delivery_id, ()))
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def cluster_status(self) -> Dict[str, Any]:
+        """
+        Estado agregado de todos los workers que reportaron heartbeat recientemente
+        - Los totales suman los contadores de cada worker (una orden seguida desde
+          dos workers cuenta dos veces en active_connections)
+        - El detalle por orden y por subsistema ("local") es solo de este worker
+        """
+        cutoff = time.monotonic() - WORKER_HEARTBEAT_INTERVAL * 3
+        workers: List[Dict[str, Any]] = [
+            stats for worker_id, (stats, received_at) in self._workers.items()
+            if received_at >= cutoff and worker_id != WORKER_ID
+        ]
+        local = self._local_stats()
+        workers.append(self._worker_summary(local))
+
+        return {
+            "workers": len(workers),
+            "active_connections": sum(worker.get("orders", 0) for worker in workers),
+            "total_clients": sum(worker.get("total_clients", 0) for worker in workers),
+            "bus_subscribers": sum(worker.get("bus_subscribers", 0) for worker in workers),
+            "per_worker": workers,
+            "local": local
+        }
+
+    def _local_stats(self) -> Dict[str, Any]:
+        stats = self._stats_provider() if self._stats_provider else {}
+        return {
+            "worker_id": WORKER_ID,
+            "bus_subscribers": self.subscriber_count(),
+            "broker": self._broker.stats(),
+            **stats
+        }
+
+    def _worker_summary(self, local: Dict[str, Any]) -> Dict[str, Any]:
+        """Contadores de tamaño fijo del heartbeat (el payload de NOTIFY está limitado)"""
+        return {
+            "worker_id": WORKER_ID,
+            "orders": len(local.get("orders_tracking", ())),
+            "total_clients": local.get("total_clients", 0),
+            "bus_subscribers": local["bus_subscribers"],
+            "broker": local["broker"]
+        }
+
+    async def _heartbeat_loop(self):
+        while True:
+            try:
+                self._broker.publish(CHANNEL_WORKERS, self._worker_summary(self._local_stats()))
+            except Exception as e:
+                logger.error(f"Error publicando heartbeat de tracking: {str(e)}")
+            await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+
+    def _publish(self, channel: str, message: Dict[str, Any]):
+        if self._started:
+            self._broker.publish(channel, message)
+        else:
+            # Sin broker iniciado (scripts, tests): entrega local directa
+            self._on_broker_message(channel, message)
+
+    def _on_broker_message(self, channel: str, message: Dict[str, Any]):
+        """Procesar un mensaje recibido del broker (puede llegar desde otro hilo)"""
+        for listener in self._listeners.get(channel, ()):
+            try:
+                listener(message)
+            except Exception as e:
+                logger.error(f"Error en listener del canal {channel}: {str(e)}")
+
+        if channel == CHANNEL_LOCATION:
+            self._call_in_loop(self._dispatch_driver, message["driver_id"], message)
+        elif channel == CHANNEL_DELIVERY:
+            self._call_in_loop(self._dispatch, message["delivery_id"], message)
+        elif channel == CHANNEL_WORKERS:
+            self._workers[message["worker_id"]] = (message, time.monotonic())
+
+    def _call_in_loop(self, callback, *args):
+        """Ejecutar en el event loop de los suscriptores (seguro desde otros hilos)"""
+        if self._loop is None or self._loop.is_closed():
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self._loop:
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def _dispatch_driver(self, driver_id: int, event: Dict[str, Any]):
+        # Los clientes solo reciben el evento si la ubicación cambió
+        location = event["location"]
+        fingerprint = {key: value for key, value in location.items() if key != "timestamp"}
+        if self._last_locations.get(driver_id) == fingerprint:
+            return
+        self._last_locations[driver_id] = fingerprint
+
+        for delivery_id in list(self._driver_deliveries.get(driver_id, ())):
+            self._dispatch(delivery_id, {**event, "delivery_id": delivery_id})
+
+    def _dispatch(self, delivery_id: int, event: Dict[str, Any]):
+        for queue in list(self._subscribers.get(delivery_id, ())):
+            if queue.full():
+                # Cliente lento: descartar el evento más antiguo
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(event)
+
+
+# Instancia global del bus de eventos
+tracking_bus = TrackingEventBus()
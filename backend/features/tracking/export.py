@@ -0,0 +1,100 @@
+"""
+Exportación en streaming del historial de ubicaciones
+
+Lee con cursor del lado del servidor (stream_results + yield_per) sobre
+tuplas de columnas y emite bloques NDJSON o CSV, por lo que la memoria no
+depende del tamaño del rango exportado.
+"""
+from sqlalchemy import select
+from typing import Any, Iterator, List, Optional
+from datetime import datetime
+import csv
+import io
+import json
+
+from core.database import SessionLocal
+from features.tracking.models import LocationUpdate
+
+# Filas leídas del cursor por bloque
+EXPORT_FETCH_SIZE = 2000
+# Filas por bloque enviado al cliente
+EXPORT_CHUNK_ROWS = 1000
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+EXPORT_COLUMNS = (
+    LocationUpdate.id,
+    LocationUpdate.driver_id,
+    LocationUpdate.delivery_id,
+    LocationUpdate.latitude,
+    LocationUpdate.longitude,
+    LocationUpdate.accuracy,
+    LocationUpdate.speed,
+    LocationUpdate.heading,
+    LocationUpdate.timestamp
+)
+
+
+class LocationExportService:
+    """Exportación del historial de ubicaciones por bloques"""
+
+    @staticmethod
+    def stream(export_format: str, start: datetime, end: Optional[datetime] = None,
+               driver_id: Optional[int] = None) -> Iterator[str]:
+        """
+        Generar el historial en bloques de texto (NDJSON o CSV)
+        - Usa su propia sesión: la de la petición se cierra antes de enviar la respuesta
+        - Orden: conductor y timestamp
+        """
+        criteria: List[Any] = [LocationUpdate.timestamp >= start]
+        if end is not None:
+            criteria.append(LocationUpdate.timestamp < end)
+        if driver_id is not None:
+            criteria.append(LocationUpdate.driver_id == driver_id)
+
+        query = select(*EXPORT_COLUMNS).where(*criteria).order_by(
+            LocationUpdate.driver_id, LocationUpdate.timestamp
+        ).execution_options(yield_per=EXPORT_FETCH_SIZE)
+
+        names = [column.key for column in EXPORT_COLUMNS]
+        write_rows = _csv_rows if export_format == "csv" else _ndjson_rows
+
+        db = SessionLocal()
+        try:
+            if export_format == "csv":
+                yield _csv_rows([names])
+
+            for partition in db.execute(query).partitions(EXPORT_CHUNK_ROWS):
+                yield write_rows([_serialize_row(names, row) for row in partition]
+                                 if export_format != "csv" else [_csv_values(row) for row in partition])
+        finally:
+            db.close()
+
+    @staticmethod
+    def filename(prefix: str, export_format: str, start: datetime) -> str:
+        return f"{prefix}_{start:%Y%m%d%H%M}.{export_format}"
+
+
+def _serialize_row(names: List[str], row) -> dict:
+    record = dict(zip(names, row))
+    record["timestamp"] = record["timestamp"].isoformat()
+    return record
+
+
+def _csv_values(row) -> list:
+    values = list(row)
+    values[-1] = values[-1].isoformat()
+    return values
+
+
+def _ndjson_rows(records: List[dict]) -> str:
+    return "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+
+
+def _csv_rows(rows: List[list]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue()
@@ -0,0 +1,226 @@
+"""
+Geocodificación de direcciones de entrega
+
+Resuelve las coordenadas de destino una sola vez, al asignar la entrega:
+1. Caché permanente de direcciones normalizadas (tabla geocode_cache)
+2. Geocodificador externo opcional (GEOCODER_URL); sus respuestas se guardan en la caché
+3. Centroide del código postal (tabla local, sin red)
+
+Las coordenadas llevan su origen en "source" (explicit, geocoder o zip):
+un centroide de código postal solo sirve para ordenar y despachar, no para
+decidir que el conductor llegó a la puerta.
+"""
+from abc import ABC, abstractmethod
+from sqlalchemy.exc import IntegrityError
+from typing import Any, Dict, List, Optional, Tuple, Union
+from datetime import datetime
+import logging
+import re
+import threading
+
+import httpx
+
+from core.config import settings
+from core.database import SessionLocal
+from features.tracking.models import GeocodeCache
+from features.tracking.zip_centroids import ZIP_CENTROIDS
+
+logger = logging.getLogger(__name__)
+
+# Abreviaturas USPS aplicadas al normalizar direcciones
+STREET_ABBREVIATIONS = {
+    "STREET": "ST", "AVENUE": "AVE", "ROAD": "RD", "DRIVE": "DR", "BOULEVARD": "BLVD",
+    "LANE": "LN", "COURT": "CT", "PLACE": "PL", "TERRACE": "TER", "HIGHWAY": "HWY",
+    "PARKWAY": "PKWY", "CIRCLE": "CIR", "ROUTE": "RT", "SQUARE": "SQ", "TURNPIKE": "TPKE",
+    "NORTH": "N", "SOUTH": "S", "EAST": "E", "WEST": "W",
+    "APARTMENT": "APT", "SUITE": "STE", "UNIT": "UNIT"
+}
+ZIP_PATTERN = re.compile(r"\b(\d{5})(?:-\d{4})?\b")
+
+Coordinates = Dict[str, Any]
+
+# Origen de las coordenadas de destino (delivery_coordinates["source"])
+SOURCE_EXPLICIT = "explicit"
+SOURCE_GEOCODER = "geocoder"
+SOURCE_ZIP = "zip"
+
+
+class ExternalGeocoder(ABC):
+    """Interfaz base de los geocodificadores externos"""
+
+    name = "base"
+
+    @abstractmethod
+    def geocode(self, query: str) -> Optional[Tuple[float, float]]:
+        """
+        Coordenadas (lat, lng) de una dirección
+        - None si el proveedor no la encuentra (se guarda en la caché)
+        - Lanza excepción ante errores de red (no se guarda)
+        """
+
+
+class NominatimGeocoder(ExternalGeocoder):
+    """Geocodificador compatible con la API /search de Nominatim"""
+
+    name = "nominatim"
+
+    def __init__(self, base_url: str, timeout: float = 3.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def geocode(self, query: str) -> Optional[Tuple[float, float]]:
+        response = httpx.get(
+            f"{self.base_url}/search",
+            params={"q": query, "format": "json", "limit": 1, "countrycodes": "us"},
+            headers={"User-Agent": settings.APP_NAME},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            return None
+        return float(results[0]["lat"]), float(results[0]["lon"])
+
+
+def create_geocoder(url: str, timeout: float = 3.0) -> Optional[ExternalGeocoder]:
+    """Crear el geocodificador externo configurado (None si no hay)"""
+    if not url:
+        return None
+    return NominatimGeocoder(url, timeout=timeout)
+
+
+def normalize_address(address: Union[Dict[str, Any], str, None]) -> Tuple[str, Optional[str]]:
+    """
+    Clave normalizada de una dirección y su código postal de 5 dígitos
+    - Acepta el dict de shipping_address de WooCommerce o texto libre
+    """
+    if not address:
+        return "", None
+
+    if isinstance(address, dict):
+        parts = [
+            address.get("address_1"), address.get("address_2"),
+            address.get("city"), address.get("state"), address.get("postcode")
+        ]
+        text = " ".join(str(part) for part in parts if part)
+    else:
+        text = address
+
+    # El código postal va al final; se toma la última coincidencia (el número de calle también puede tener 5 dígitos)
+    matches = ZIP_PATTERN.findall(text)
+    text = ZIP_PATTERN.sub(r"\1", text)
+
+    words: List[str] = []
+    for word in re.sub(r"[^A-Z0-9 ]", " ", text.upper().replace("#", " APT ")).split():
+        word = STREET_ABBREVIATIONS.get(word, word)
+        if not words or word != words[-1] or word.isdigit():
+            words.append(word)
+    return " ".join(words), matches[-1] if matches else None
+
+
+class AddressGeocoder:
+    """Resolución de coordenadas de entrega con caché y contadores"""
+
+    def __init__(self, external: Optional[ExternalGeocoder] = None):
+        self.external = external
+        self._lock = threading.Lock()
+
+        # Contadores
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.external_calls = 0
+        self.external_errors = 0
+        self.zip_fallbacks = 0
+        self.unresolved = 0
+
+    def set_external(self, external: Optional[ExternalGeocoder]):
+        """Reemplazar el geocodificador externo (None lo desactiva)"""
+        self.external = external
+
+    def resolve(self, address: Union[Dict[str, Any], str, None]) -> Optional[Coordinates]:
+        """
+        Coordenadas {"lat", "lng", "source"} de una dirección, o None si no se pueden resolver
+        - Usa su propia sesión: la caché se conserva aunque falle la asignación
+        - Puede llamar al geocodificador externo (bloqueante): desde código
+          async se ejecuta con asyncio.to_thread
+        """
+        key, postcode = normalize_address(address)
+        if not key:
+            return None
+
+        db = SessionLocal()
+        try:
+            entry = db.query(GeocodeCache).filter(GeocodeCache.address_key == key).first()
+            if entry is not None and (entry.latitude is not None or self.external is None
+                                      or entry.source == self.external.name):
+                entry.hits += 1
+                entry.last_used_at = datetime.utcnow()
+                db.commit()
+                self._count("cache_hits")
+                if entry.latitude is not None:
+                    return {"lat": entry.latitude, "lng": entry.longitude, "source": SOURCE_GEOCODER}
+                return self._zip_centroid(postcode)
+
+            self._count("cache_misses")
+            if self.external is not None:
+                coordinates = self._geocode_external(db, entry, key, postcode)
+                if coordinates is not None:
+                    return coordinates
+        finally:
+            db.close()
+
+        return self._zip_centroid(postcode)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "external": self.external.name if self.external is not None else None,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "external_calls": self.external_calls,
+            "external_errors": self.external_errors,
+            "zip_fallbacks": self.zip_fallbacks,
+            "unresolved": self.unresolved
+        }
+
+    def _geocode_external(self, db, entry: Optional[GeocodeCache], key: str,
+                          postcode: Optional[str]) -> Optional[Coordinates]:
+        self._count("external_calls")
+        try:
+            result = self.external.geocode(key)
+        except Exception as e:
+            self._count("external_errors")
+            logger.warning(f"Error del geocodificador {self.external.name}: {str(e)}")
+            return None
+
+        # Respuesta permanente (también "no encontrada") para no repetir la consulta
+        if entry is None:
+            entry = GeocodeCache(address_key=key, postcode=postcode, hits=0)
+            db.add(entry)
+        entry.latitude, entry.longitude = result if result is not None else (None, None)
+        entry.source = self.external.name
+        entry.last_used_at = datetime.utcnow()
+        try:
+            db.commit()
+        except IntegrityError:
+            # Otro worker guardó la misma dirección
+            db.rollback()
+
+        if result is None:
+            return None
+        return {"lat": result[0], "lng": result[1], "source": SOURCE_GEOCODER}
+
+    def _zip_centroid(self, postcode: Optional[str]) -> Optional[Coordinates]:
+        centroid = ZIP_CENTROIDS.get(postcode) if postcode else None
+        if centroid is None:
+            self._count("unresolved")
+            return None
+        self._count("zip_fallbacks")
+        return {"lat": centroid[0], "lng": centroid[1], "source": SOURCE_ZIP}
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+# Instancia global del geocodificador de entregas
+address_geocoder = AddressGeocoder(create_geocoder(settings.GEOCODER_URL, settings.GEOCODER_TIMEOUT))
@@ -0,0 +1,310 @@
+"""
+Geocercas de entrega: llegada y salida automáticas
+
+Cada entrega activa tiene en memoria una geocerca de la tienda y otra del
+destino. Se construyen con el evento "assigned" del bus, que llega a todos
+los workers con las coordenadas del destino, y se eliminan con el cambio a
+un estado final; la BD solo se consulta una vez por conductor, la primera
+vez que llega un ping suyo (entregas asignadas antes de arrancar el worker).
+Cada ping que entra por la ingesta se compara solo con las geocercas de su
+conductor (O(1)) y emite eventos "geofence" en el canal de la entrega:
+
+- departed (tienda)   el conductor sale de la tienda   -> estado "started"
+- arriving (destino)  entra al radio de aproximación
+- arrived (destino)   entra al radio de llegada
+- departed (destino)  sale del destino tras llegar     -> estado "completed"
+
+Las geocercas del destino solo se activan si sus coordenadas son precisas
+(indicadas al asignar o del geocodificador): un centroide de código postal
+puede estar a kilómetros de la puerta y completaría entregas por error. Sin
+"source" (entregas anteriores) el destino se trata como impreciso.
+
+Los cambios de estado pasan por DeliveryTrackingService.update_delivery_status,
+que libera al conductor y cierra las conexiones de los clientes.
+"""
+from typing import Any, Callable, Dict, List, Optional, Set
+from datetime import datetime
+import asyncio
+import logging
+import math
+import threading
+
+from core.config import settings
+from core.database import SessionLocal
+from features.tracking.models import DeliveryTracking
+from features.tracking.broker import CHANNEL_DELIVERY
+from features.tracking.events import tracking_bus
+from features.tracking.geocoding import SOURCE_EXPLICIT, SOURCE_GEOCODER
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_DELIVERY_STATUSES = ["assigned", "started", "in_progress"]
+# Radio de salida = radio de entrada * factor (histéresis contra el ruido del GPS)
+EXIT_RADIUS_FACTOR = 2.0
+EARTH_RADIUS_M = 6371000.0
+# Orígenes de coordenadas con los que se detecta llegada y salida del destino
+PRECISE_COORDINATE_SOURCES = (SOURCE_EXPLICIT, SOURCE_GEOCODER)
+
+
+class DeliveryGeofence:
+    """Geocercas de la tienda y del destino de una entrega, con su estado"""
+
+    __slots__ = (
+        "delivery_id", "driver_id", "dest_lat", "dest_lng", "cos_lat", "precise",
+        "at_store", "left_store", "arriving", "arrived", "completed"
+    )
+
+    def __init__(self, delivery_id: int, driver_id: int, dest_lat: float, dest_lng: float,
+                 status: str = "assigned", precise: bool = True):
+        self.delivery_id = delivery_id
+        self.driver_id = driver_id
+        self.dest_lat = dest_lat
+        self.dest_lng = dest_lng
+        # False: solo la geocerca de la tienda (destino aproximado)
+        self.precise = precise
+        # Proyección equirectangular: a escala de una ciudad el error es despreciable
+        self.cos_lat = math.cos(math.radians(dest_lat))
+
+        self.at_store = False
+        self.left_store = status != "assigned"
+        self.arriving = False
+        self.arrived = False
+        self.completed = False
+
+    def distance_m(self, lat: float, lng: float, ref_lat: float, ref_lng: float) -> float:
+        x = math.radians(lng - ref_lng) * self.cos_lat
+        y = math.radians(lat - ref_lat)
+        return math.hypot(x, y) * EARTH_RADIUS_M
+
+
+class GeofenceMonitor:
+    """Geocercas por conductor y detección de eventos en cada ping"""
+
+    def __init__(self, store_lat: Optional[float] = None, store_lng: Optional[float] = None,
+                 store_radius_m: float = 150, arriving_radius_m: float = 500,
+                 arrival_radius_m: float = 75):
+        self.store_lat = store_lat
+        self.store_lng = store_lng
+        self.store_radius_m = store_radius_m
+        self.arriving_radius_m = arriving_radius_m
+        self.arrival_radius_m = arrival_radius_m
+
+        # driver_id -> geocercas de sus entregas activas
+        self._fences: Dict[int, List[DeliveryGeofence]] = {}
+        # Conductores cuyas entregas anteriores al arranque ya se leyeron de la BD
+        self._loaded: Set[int] = set()
+        self._loading: Set[int] = set()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        # Contadores
+        self.checks = 0
+        self.events = 0
+        self.auto_started = 0
+        self.auto_completed = 0
+
+    async def start(self):
+        """Capturar el event loop para el trabajo de BD en segundo plano"""
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        self._loop = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @property
+    def has_store(self) -> bool:
+        return self.store_lat is not None and self.store_lng is not None
+
+    def register(self, delivery_id: int, driver_id: int, coordinates: Optional[Dict[str, Any]],
+                 status: str = "assigned"):
+        """Registrar las geocercas de una entrega recién asignada"""
+        fence = _build_fence(delivery_id, driver_id, coordinates, status)
+        if fence is None:
+            return
+        with self._lock:
+            fences = self._fences.setdefault(driver_id, [])
+            # El worker que asigna la registra y luego recibe su propio evento
+            if all(item.delivery_id != delivery_id for item in fences):
+                fences.append(fence)
+
+    def check(self, driver_id: int, lat: float, lng: float, fix_time: Optional[datetime] = None):
+        """Comparar un ping con las geocercas del conductor (sin consultar la BD)"""
+        with self._lock:
+            fences = self._fences.get(driver_id)
+            loaded = driver_id in self._loaded
+        if not loaded:
+            # Entregas asignadas antes del arranque: se cargan una vez en segundo plano
+            self._request_load(driver_id)
+        if not fences:
+            return
+
+        self.checks += 1
+        timestamp = (fix_time or datetime.utcnow()).isoformat()
+        for fence in fences:
+            if not fence.completed:
+                self._check_fence(fence, lat, lng, timestamp)
+
+    def distance_to_destination(self, driver_id: int, lat: float, lng: float) -> Optional[float]:
+        """Metros al destino más cercano de las entregas activas del conductor"""
+        with self._lock:
+            fences = self._fences.get(driver_id)
+        if not fences:
+            return None
+        distances = [
+            fence.distance_m(lat, lng, fence.dest_lat, fence.dest_lng)
+            for fence in fences if not fence.completed
+        ]
+        return min(distances, default=None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "drivers": len(self._fences),
+            "fences": sum(len(fences) for fences in self._fences.values()),
+            "checks": self.checks,
+            "events": self.events,
+            "auto_started": self.auto_started,
+            "auto_completed": self.auto_completed
+        }
+
+    def _check_fence(self, fence: DeliveryGeofence, lat: float, lng: float, timestamp: str):
+        if self.has_store and not fence.left_store:
+            store_distance = fence.distance_m(lat, lng, self.store_lat, self.store_lng)
+            if store_distance <= self.store_radius_m:
+                fence.at_store = True
+            elif fence.at_store and store_distance > self.store_radius_m * EXIT_RADIUS_FACTOR:
+                fence.left_store = True
+                self._emit(fence, "departed", "store", timestamp)
+                self.auto_started += 1
+                self._schedule(_advance_status, fence.delivery_id, "started")
+
+        if not fence.precise:
+            return
+        distance = fence.distance_m(lat, lng, fence.dest_lat, fence.dest_lng)
+        if not fence.arriving and distance <= self.arriving_radius_m:
+            fence.arriving = True
+            self._emit(fence, "arriving", "destination", timestamp)
+        if not fence.arrived and distance <= self.arrival_radius_m:
+            fence.arrived = True
+            self._emit(fence, "arrived", "destination", timestamp)
+        elif fence.arrived and distance > self.arrival_radius_m * EXIT_RADIUS_FACTOR:
+            fence.completed = True
+            self._emit(fence, "departed", "destination", timestamp)
+            self.auto_completed += 1
+            self._schedule(_advance_status, fence.delivery_id, "completed")
+
+    def _emit(self, fence: DeliveryGeofence, event: str, zone: str, timestamp: str):
+        self.events += 1
+        tracking_bus.publish_delivery_event(fence.delivery_id, {
+            "type": "geofence",
+            "event": event,
+            "zone": zone,
+            "timestamp": timestamp
+        })
+
+    def _request_load(self, driver_id: int):
+        with self._lock:
+            if driver_id in self._loading:
+                return
+            self._loading.add(driver_id)
+        self._schedule(self._load_driver, driver_id)
+
+    def _schedule(self, function: Callable, *args):
+        """Ejecutar trabajo de BD fuera del event loop (en línea si no hay loop)"""
+        if self._loop is None:
+            self._run_safely(function, *args)
+        else:
+            self._loop.call_soon_threadsafe(self._spawn, function, args)
+
+    def _spawn(self, function: Callable, args: tuple):
+        task = asyncio.create_task(asyncio.to_thread(self._run_safely, function, *args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _run_safely(self, function: Callable, *args):
+        try:
+            function(*args)
+        except Exception as e:
+            logger.error(f"Error en geocercas: {str(e)}")
+
+    def _load_driver(self, driver_id: int):
+        try:
+            db = SessionLocal()
+            try:
+                deliveries = db.query(
+                    DeliveryTracking.id, DeliveryTracking.delivery_coordinates, DeliveryTracking.status
+                ).filter(
+                    DeliveryTracking.driver_id == driver_id,
+                    DeliveryTracking.status.in_(ACTIVE_DELIVERY_STATUSES)
+                ).all()
+            finally:
+                db.close()
+
+            with self._lock:
+                # Las geocercas ya en memoria (eventos recibidos durante la consulta) mandan
+                fences = self._fences.setdefault(driver_id, [])
+                known = {fence.delivery_id for fence in fences}
+                for delivery_id, coordinates, status in deliveries:
+                    if delivery_id not in known:
+                        fence = _build_fence(delivery_id, driver_id, coordinates, status)
+                        if fence is not None:
+                            fences.append(fence)
+                self._loaded.add(driver_id)
+        finally:
+            with self._lock:
+                self._loading.discard(driver_id)
+
+    def _on_delivery_message(self, message: Dict[str, Any]):
+        message_type = message.get("type")
+        if message_type == "assigned":
+            self.register(
+                message["delivery_id"], message["driver_id"],
+                message.get("delivery_coordinates"), message.get("status", "assigned")
+            )
+            return
+        if message_type != "status_update" or message.get("status") in ACTIVE_DELIVERY_STATUSES:
+            return
+        delivery_id = message["delivery_id"]
+        with self._lock:
+            for driver_id, fences in list(self._fences.items()):
+                remaining = [fence for fence in fences if fence.delivery_id != delivery_id]
+                if len(remaining) != len(fences):
+                    self._fences[driver_id] = remaining
+
+
+def _build_fence(delivery_id: int, driver_id: int, coordinates: Optional[Dict[str, Any]],
+                 status: str) -> Optional[DeliveryGeofence]:
+    """Geocercas de una entrega (None sin coordenadas de destino)"""
+    if not coordinates or coordinates.get("lat") is None or coordinates.get("lng") is None:
+        return None
+    precise = coordinates.get("source") in PRECISE_COORDINATE_SOURCES
+    return DeliveryGeofence(delivery_id, driver_id, coordinates["lat"], coordinates["lng"], status, precise)
+
+
+def _advance_status(delivery_id: int, status: str):
+    """Avanzar el estado de la entrega si aún no lo alcanzó"""
+    from features.tracking.schemas import DeliveryStatusUpdate
+    from features.tracking.services import DeliveryTrackingService
+
+    db = SessionLocal()
+    try:
+        current = db.query(DeliveryTracking.status).filter(DeliveryTracking.id == delivery_id).scalar()
+        order = ["assigned", "started", "in_progress", "completed"]
+        if current not in order or order.index(current) >= order.index(status):
+            return
+        DeliveryTrackingService.update_delivery_status(delivery_id, DeliveryStatusUpdate(status=status), db)
+        logger.info(f"Entrega {delivery_id}: estado {status} por geocerca")
+    finally:
+        db.close()
+
+
+# Instancia global de geocercas
+geofence_monitor = GeofenceMonitor(
+    store_lat=settings.STORE_LATITUDE,
+    store_lng=settings.STORE_LONGITUDE,
+    store_radius_m=settings.GEOFENCE_STORE_RADIUS_M,
+    arriving_radius_m=settings.GEOFENCE_ARRIVING_RADIUS_M,
+    arrival_radius_m=settings.GEOFENCE_ARRIVAL_RADIUS_M
+)
+tracking_bus.add_listener(CHANNEL_DELIVERY, geofence_monitor._on_delivery_message)
@@ -0,0 +1,161 @@
+"""
+Filtro de ruido GPS previo a la ingesta
+
+Cada ping se compara con el último punto aceptado del conductor:
+
+- jitter    dentro del radio de precisión del punto anterior (teléfono
+            estacionado): se descarta, salvo un punto cada KEEPALIVE segundos
+- outlier   implica una velocidad imposible (salto por un mal fix): se
+            rechaza; tras varios rechazos seguidos se acepta como nueva posición
+- stale     más antiguo que el último punto aceptado
+
+Opcionalmente los puntos aceptados pasan por un filtro de Kalman ligero
+(posición constante con ruido de proceso proporcional al tiempo) que
+suaviza el recorrido usando la precisión reportada como ruido de medida.
+Los puntos descartados no se persisten ni se difunden.
+"""
+from typing import Any, Dict, Optional, Tuple
+from datetime import datetime
+import math
+import threading
+
+from core.config import settings
+
+EARTH_RADIUS_M = 6371000.0
+# Precisión asumida cuando el dispositivo no la reporta
+DEFAULT_ACCURACY_M = 10.0
+# Radio máximo de jitter (una precisión de 2 km no debe ocultar movimiento real)
+MAX_JITTER_RADIUS_M = 100.0
+# Rechazos seguidos por velocidad tras los cuales se acepta la nueva posición
+OUTLIER_RESET_COUNT = 3
+
+
+class DriverFixState:
+    """Último punto aceptado de un conductor y estado del filtro de Kalman"""
+
+    __slots__ = ("lat", "lng", "accuracy", "fix_time", "variance", "rejections")
+
+    def __init__(self, lat: float, lng: float, accuracy: float, fix_time: datetime):
+        self.lat = lat
+        self.lng = lng
+        self.accuracy = accuracy
+        self.fix_time = fix_time
+        # Varianza de la posición estimada (m²)
+        self.variance = accuracy * accuracy
+        self.rejections = 0
+
+
+class GpsFilter:
+    """Descarte de jitter y outliers por conductor, con suavizado opcional"""
+
+    def __init__(self, enabled: bool = True, max_speed_kmh: float = 200, min_distance_m: float = 5,
+                 keepalive_seconds: float = 60, smoothing: bool = False, process_noise_ms: float = 10.0):
+        self.enabled = enabled
+        self.max_speed_ms = max_speed_kmh / 3.6
+        self.min_distance_m = min_distance_m
+        self.keepalive_seconds = keepalive_seconds
+        self.smoothing = smoothing
+        self.process_noise_ms = process_noise_ms
+
+        self._states: Dict[int, DriverFixState] = {}
+        self._lock = threading.Lock()
+
+        # Contadores
+        self.accepted = 0
+        self.rejected_jitter = 0
+        self.rejected_outlier = 0
+        self.rejected_stale = 0
+
+    def process(self, driver_id: int, lat: float, lng: float, accuracy: Optional[float],
+                fix_time: datetime) -> Tuple[Optional[str], float, float]:
+        """
+        Evaluar un ping
+        - Retorna (motivo del descarte o None, latitud, longitud a usar)
+        - Con suavizado, las coordenadas aceptadas son las estimadas por el filtro
+        """
+        if not self.enabled:
+            return None, lat, lng
+        accuracy = accuracy if accuracy else DEFAULT_ACCURACY_M
+
+        with self._lock:
+            state = self._states.get(driver_id)
+            if state is None:
+                self._states[driver_id] = DriverFixState(lat, lng, accuracy, fix_time)
+                self.accepted += 1
+                return None, lat, lng
+
+            elapsed = (fix_time - state.fix_time).total_seconds()
+            if elapsed <= 0:
+                self.rejected_stale += 1
+                return "stale", state.lat, state.lng
+
+            distance = _distance_m(state.lat, state.lng, lat, lng)
+
+            jitter_radius = min(max(accuracy, self.min_distance_m), MAX_JITTER_RADIUS_M)
+            if distance <= jitter_radius and elapsed < self.keepalive_seconds:
+                self.rejected_jitter += 1
+                return "jitter", state.lat, state.lng
+
+            # La incertidumbre de ambos puntos no cuenta como desplazamiento
+            moved = max(distance - accuracy - state.accuracy, 0.0)
+            if moved / elapsed > self.max_speed_ms:
+                state.rejections += 1
+                if state.rejections < OUTLIER_RESET_COUNT:
+                    self.rejected_outlier += 1
+                    return "outlier", state.lat, state.lng
+                # Los saltos se repiten: el punto erróneo era el anterior
+                self._states[driver_id] = DriverFixState(lat, lng, accuracy, fix_time)
+                self.accepted += 1
+                return None, lat, lng
+
+            if self.smoothing:
+                self._smooth(state, lat, lng, accuracy, elapsed)
+            else:
+                state.lat, state.lng = lat, lng
+            state.accuracy = accuracy
+            state.fix_time = fix_time
+            state.rejections = 0
+            self.accepted += 1
+            return None, state.lat, state.lng
+
+    def stats(self) -> Dict[str, Any]:
+        rejected = self.rejected_jitter + self.rejected_outlier + self.rejected_stale
+        total = self.accepted + rejected
+        return {
+            "enabled": self.enabled,
+            "smoothing": self.smoothing,
+            "drivers": len(self._states),
+            "accepted": self.accepted,
+            "rejected": rejected,
+            "rejected_jitter": self.rejected_jitter,
+            "rejected_outlier": self.rejected_outlier,
+            "rejected_stale": self.rejected_stale,
+            "rejection_rate": round(rejected / total, 4) if total else 0.0
+        }
+
+    def _smooth(self, state: DriverFixState, lat: float, lng: float, accuracy: float, elapsed: float):
+        # Predicción: la incertidumbre crece con el tiempo transcurrido
+        state.variance += elapsed * self.process_noise_ms ** 2
+        # Corrección con la medida, ponderada por su precisión
+        gain = state.variance / (state.variance + accuracy * accuracy)
+        state.lat += gain * (lat - state.lat)
+        state.lng += gain * (lng - state.lng)
+        state.variance *= 1 - gain
+
+
+def _distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    # Proyección equirectangular: suficiente para distancias entre pings consecutivos
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * EARTH_RADIUS_M
+
+
+# Instancia global del filtro GPS
+gps_filter = GpsFilter(
+    enabled=settings.GPS_FILTER_ENABLED,
+    max_speed_kmh=settings.GPS_FILTER_MAX_SPEED_KMH,
+    min_distance_m=settings.GPS_FILTER_MIN_DISTANCE_M,
+    keepalive_seconds=settings.GPS_FILTER_KEEPALIVE_SECONDS,
+    smoothing=settings.GPS_FILTER_SMOOTHING,
+    process_noise_ms=settings.GPS_FILTER_PROCESS_NOISE
+)
@@ -0,0 +1,322 @@
+"""
+Pipeline de ingesta de ubicaciones por lotes
+
+Los pings de los conductores se encolan en memoria y se confirman al
+instante; un flush periódico (por tamaño o por tiempo) los persiste con
+un INSERT multi-fila en location_updates y un único UPDATE de la última
+posición de cada conductor. Los pings sin entrega explícita se asocian a
+la entrega activa del conductor con una sola consulta por lote. Una fila
+rechazada por la BD se aísla dividiendo el lote y solo ella se descarta.
+"""
+from sqlalchemy import insert, update, case, literal
+from sqlalchemy.exc import DataError, IntegrityError
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import asyncio
+import logging
+import threading
+import time
+
+from core.config import settings
+from core.database import SessionLocal
+from features.tracking.models import Driver, DeliveryTracking, LocationUpdate
+from features.tracking.events import tracking_bus
+from features.tracking.geofence import geofence_monitor
+from features.tracking.gps_filter import gps_filter
+from features.tracking.live_store import live_driver_store
+from features.tracking.sampling import sampling_controller
+
+logger = logging.getLogger(__name__)
+
+# Estados de entrega que siguen activos
+ACTIVE_DELIVERY_STATUSES = ["assigned", "started", "in_progress"]
+# Estados en los que el conductor ya va hacia el cliente (preferidos al asociar pings)
+EN_ROUTE_DELIVERY_STATUSES = ("started", "in_progress")
+# Máximo de pings pendientes retenidos si la BD no está disponible
+MAX_PENDING_PINGS = 100000
+# Reintentos de un ping antes de descartarlo
+MAX_FLUSH_ATTEMPTS = 3
+# Columnas de location_updates escritas por la ingesta
+HISTORY_COLUMNS = ("driver_id", "delivery_id", "latitude", "longitude", "accuracy", "speed", "heading", "timestamp")
+
+
+class LocationIngestBuffer:
+    """Buffer de pings de ubicación con flush por tamaño o por tiempo"""
+
+    def __init__(self, max_batch_size: int = 500, flush_interval: float = 1.0):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Contadores
+        self.received = 0
+        self.persisted = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.filtered = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+
+    async def start(self):
+        """Iniciar la tarea de flush periódico"""
+        self._loop = asyncio.get_running_loop()
+        self._flush_requested = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Ingesta de ubicaciones iniciada (lote {self.max_batch_size}, intervalo {self.flush_interval}s)"
+        )
+
+    async def stop(self):
+        """Detener la tarea y persistir los pings pendientes"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+        self._loop = None
+
+    def submit(self, driver_id: int, latitude: float, longitude: float,
+               accuracy: Optional[float] = None, speed: Optional[float] = None,
+               heading: Optional[float] = None, delivery_id: Optional[int] = None,
+               timestamp: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Encolar un ping de ubicación
+        - Los pings con jitter u outliers (features.tracking.gps_filter) se descartan
+          antes de persistirse o difundirse
+        - Actualiza el almacén en vivo, notifica a los clientes y evalúa las geocercas
+          y el intervalo de reporte del conductor
+        - Retorna de inmediato la ubicación actual del conductor
+        """
+        timestamp = timestamp or datetime.utcnow()
+        rejection, latitude, longitude = gps_filter.process(driver_id, latitude, longitude, accuracy, timestamp)
+        row = {
+            "driver_id": driver_id,
+            "delivery_id": delivery_id,
+            "latitude": latitude,
+            "longitude": longitude,
+            "accuracy": accuracy,
+            "speed": speed,
+            "heading": heading,
+            "timestamp": timestamp
+        }
+        if rejection is not None:
+            self.filtered += 1
+            return {**_location_json(row), "filtered": rejection}
+
+        with self._lock:
+            self._pending.append(row)
+            self.received += 1
+            pending = len(self._pending)
+
+        if self._loop is None:
+            # Sin tarea de flush (scripts, tests): persistir inmediatamente
+            self.flush()
+        elif pending >= self.max_batch_size:
+            self._loop.call_soon_threadsafe(self._flush_requested.set)
+
+        location = _location_json(row)
+
+        # Escritura inmediata en el almacén en vivo y difusión a clientes y workers
+        live_driver_store.update_fix(
+            driver_id, latitude, longitude, accuracy=accuracy, speed=speed,
+            heading=heading, fix_time=timestamp
+        )
+        tracking_bus.publish_location(driver_id, location, last_update=location["timestamp"])
+
+        # Llegada/salida automáticas (solo en el worker que recibe el ping)
+        geofence_monitor.check(driver_id, latitude, longitude, timestamp)
+        sampling_controller.observe(driver_id, latitude, longitude, speed)
+
+        return location
+
+    def pending_count(self) -> int:
+        """Pings en cola pendientes de persistir"""
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de la ingesta"""
+        return {
+            "received": self.received,
+            "persisted": self.persisted,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "filtered": self.filtered,
+            "pending": self.pending_count(),
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2)
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Error en flush de ubicaciones: {str(e)}")
+
+    def flush(self) -> int:
+        """Persistir los pings pendientes; retorna el número de filas escritas"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            persisted = self._persist(batch)
+
+            self.persisted += persisted
+            self.flushes += 1
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+            return persisted
+
+    def _persist(self, batch: List[Dict[str, Any]]) -> int:
+        """
+        Escribir un lote en su propia transacción
+        - Si la BD rechaza alguna fila (IntegrityError/DataError) el lote se divide
+          en mitades hasta aislarla: solo se descartan las filas rechazadas
+        - Ante otros errores (BD no disponible) el lote vuelve a la cola
+        """
+        try:
+            self._write(batch)
+            return len(batch)
+        except (IntegrityError, DataError) as e:
+            if len(batch) == 1:
+                self.rejected += 1
+                logger.warning(f"Ubicación del conductor {batch[0]['driver_id']} rechazada por la BD: {str(e.orig)}")
+                return 0
+            middle = len(batch) // 2
+            return self._persist(batch[:middle]) + self._persist(batch[middle:])
+        except Exception as e:
+            logger.error(f"Error persistiendo lote de {len(batch)} ubicaciones: {str(e)}")
+            self._requeue(batch)
+            return 0
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        db = SessionLocal()
+        try:
+            # Última posición de cada conductor dentro del lote
+            latest: Dict[int, Dict[str, Any]] = {}
+            for row in batch:
+                current = latest.get(row["driver_id"])
+                if current is None or row["timestamp"] >= current["timestamp"]:
+                    latest[row["driver_id"]] = row
+
+            # Entrega activa de cada conductor para los pings que no la indican
+            self._attach_deliveries(db, batch)
+
+            # 1. INSERT multi-fila del historial
+            db.execute(
+                insert(LocationUpdate),
+                [{column: row[column] for column in HISTORY_COLUMNS} for row in batch]
+            )
+
+            # 2. Un solo UPDATE de la posición actual de todos los conductores del lote
+            location_type = Driver.current_location.type
+            db.execute(
+                update(Driver)
+                .where(Driver.id.in_(list(latest)))
+                .values(
+                    current_location=case(
+                        {
+                            driver_id: literal(_location_json(row), location_type)
+                            for driver_id, row in latest.items()
+                        },
+                        value=Driver.id
+                    ),
+                    last_location_update=case(
+                        {driver_id: row["timestamp"] for driver_id, row in latest.items()},
+                        value=Driver.id
+                    )
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+            # 3. Última posición de las entregas activas (la ETA la recalcula features.tracking.eta)
+            db.execute(
+                update(DeliveryTracking)
+                .where(
+                    DeliveryTracking.driver_id.in_(list(latest)),
+                    DeliveryTracking.status.in_(ACTIVE_DELIVERY_STATUSES)
+                )
+                .values(
+                    last_location_update=case(
+                        {driver_id: row["timestamp"] for driver_id, row in latest.items()},
+                        value=DeliveryTracking.driver_id
+                    )
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _attach_deliveries(self, db, batch: List[Dict[str, Any]]):
+        """Asignar delivery_id a los pings sin entrega (la en curso o, si no, la más antigua)"""
+        driver_ids = {row["driver_id"] for row in batch if row["delivery_id"] is None}
+        if not driver_ids:
+            return
+        active = db.query(
+            DeliveryTracking.id, DeliveryTracking.driver_id, DeliveryTracking.status
+        ).filter(
+            DeliveryTracking.driver_id.in_(list(driver_ids)),
+            DeliveryTracking.status.in_(ACTIVE_DELIVERY_STATUSES)
+        ).order_by(DeliveryTracking.assigned_at, DeliveryTracking.id).all()
+
+        deliveries: Dict[int, int] = {}
+        en_route: Dict[int, int] = {}
+        for delivery_id, driver_id, status in active:
+            deliveries.setdefault(driver_id, delivery_id)
+            if status in EN_ROUTE_DELIVERY_STATUSES:
+                en_route.setdefault(driver_id, delivery_id)
+
+        for row in batch:
+            if row["delivery_id"] is None:
+                row["delivery_id"] = en_route.get(row["driver_id"], deliveries.get(row["driver_id"]))
+
+    def _requeue(self, batch: List[Dict[str, Any]]):
+        """Devolver un lote fallido a la cola (descartando reintentos agotados o excedentes)"""
+        retry = []
+        for row in batch:
+            row["attempts"] = row.get("attempts", 0) + 1
+            if row["attempts"] < MAX_FLUSH_ATTEMPTS:
+                retry.append(row)
+
+        with self._lock:
+            room = max(MAX_PENDING_PINGS - len(self._pending), 0)
+            kept = retry[len(retry) - room:] if room < len(retry) else retry
+            self.dropped += len(batch) - len(kept)
+            self._pending = kept + self._pending
+
+
+def _location_json(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "lat": row["latitude"],
+        "lng": row["longitude"],
+        "accuracy": row["accuracy"],
+        "speed": row["speed"],
+        "heading": row["heading"],
+        "timestamp": row["timestamp"].isoformat()
+    }
+
+
+# Instancia global de la ingesta de ubicaciones
+location_ingest = LocationIngestBuffer(
+    max_batch_size=settings.LOCATION_INGEST_BATCH_SIZE,
+    flush_interval=settings.LOCATION_INGEST_FLUSH_INTERVAL
+)
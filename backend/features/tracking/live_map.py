@@ -0,0 +1,331 @@
+"""
+Mapa en vivo de la flota para administradores
+
+Cada administrador se suscribe con el rectángulo visible del mapa y el
+nivel de zoom; el servidor le envía solo los conductores dentro de ese
+rectángulo y, con zoom bajo, los agrupa en clusters. Los cambios de
+posición y estado se acumulan y se envían una vez por intervalo, solo a
+los mapas cuyo rectángulo contiene (o contenía) al conductor.
+
+Mensajes del cliente:
+    {"type": "subscribe", "bbox": [sur, oeste, norte, este], "zoom": z}
+
+Mensajes del servidor:
+    {"type": "drivers", "zoom": z, "drivers": [...]}           estado completo
+    {"type": "update", "drivers": [...], "removed": [ids]}      cambios
+    {"type": "clusters", "zoom": z, "clusters": [...], "total": n}
+    {"type": "error", "error": "..."}
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import math
+import threading
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from core.config import settings
+from core.database import SessionLocal
+from core.security import verify_access_token
+from features.users.models import User
+from features.tracking.broker import CHANNEL_LOCATION, CHANNEL_DRIVER
+from features.tracking.events import tracking_bus
+from features.tracking.live_store import live_driver_store, LiveDriverRecord
+
+logger = logging.getLogger(__name__)
+
+MAX_ZOOM = 22
+# Celdas de cluster por tile de mapa (tiles de 256 px -> celdas de ~64 px)
+CLUSTER_CELLS_PER_TILE = 4
+# Decimales de las coordenadas enviadas (~10 m)
+COORDINATE_DECIMALS = 4
+# Mensajes salientes pendientes por administrador antes de reenviar el estado completo
+OUTBOUND_QUEUE_SIZE = 16
+# Código de cierre para credenciales inválidas
+CLOSE_POLICY_VIOLATION = 1008
+
+BoundingBox = Tuple[float, float, float, float]
+
+
+class LiveMapSession:
+    """Conexión de un administrador con su rectángulo visible"""
+
+    def __init__(self, websocket: WebSocket, cluster_zoom: int):
+        self.websocket = websocket
+        self.cluster_zoom = cluster_zoom
+        self.bbox: Optional[BoundingBox] = None
+        self.zoom = 0
+        # Conductores incluidos en el último envío
+        self.visible: Set[int] = set()
+        self.needs_snapshot = True
+
+        self._last_clusters: Optional[List[Dict[str, Any]]] = None
+        self._outbound: asyncio.Queue = asyncio.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+
+        # Contadores
+        self.sent = 0
+        self.dropped = 0
+
+    @property
+    def clustered(self) -> bool:
+        return self.zoom < self.cluster_zoom
+
+    def subscribe(self, data: Any) -> Optional[str]:
+        """Cambiar el rectángulo y el zoom; retorna un mensaje de error si son inválidos"""
+        try:
+            south, west, north, east = (float(value) for value in data["bbox"])
+            zoom = int(data.get("zoom", self.zoom))
+        except (KeyError, TypeError, ValueError):
+            return "Se requiere bbox [sur, oeste, norte, este] y zoom"
+        if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+            return "bbox fuera de rango"
+        if not 0 <= zoom <= MAX_ZOOM:
+            return f"zoom debe estar entre 0 y {MAX_ZOOM}"
+
+        self.bbox = (south, west, north, east)
+        self.zoom = zoom
+        self.needs_snapshot = True
+        return None
+
+    def build_message(self, changed: List[Tuple[int, Optional[LiveDriverRecord]]]) -> Optional[Dict[str, Any]]:
+        """Mensaje con lo que cambió en el rectángulo del administrador (None si nada)"""
+        if self.bbox is None:
+            return None
+        if self.needs_snapshot:
+            self.needs_snapshot = False
+            self._last_clusters = None
+            if self.clustered:
+                return self._cluster_message()
+            drivers = live_driver_store.in_bounds(*self.bbox)
+            self.visible = {record.driver_id for record in drivers}
+            return {"type": "drivers", "zoom": self.zoom, "drivers": [_serialize_driver(record) for record in drivers]}
+
+        if self.clustered:
+            affected = any(
+                driver_id in self.visible or (record is not None and self._shows(record))
+                for driver_id, record in changed
+            )
+            return self._cluster_message() if affected else None
+
+        drivers, removed = [], []
+        for driver_id, record in changed:
+            if record is not None and self._shows(record):
+                self.visible.add(driver_id)
+                drivers.append(_serialize_driver(record))
+            elif driver_id in self.visible:
+                self.visible.discard(driver_id)
+                removed.append(driver_id)
+        if not drivers and not removed:
+            return None
+        return {"type": "update", "drivers": drivers, "removed": removed}
+
+    def enqueue(self, message: Dict[str, Any]):
+        if self._outbound.full():
+            # Administrador lento: descartar lo pendiente y reenviar el estado completo
+            self.dropped += self._outbound.qsize()
+            while not self._outbound.empty():
+                self._outbound.get_nowait()
+            self.needs_snapshot = True
+            return
+        self._outbound.put_nowait(message)
+
+    async def send_loop(self):
+        while True:
+            message = await self._outbound.get()
+            try:
+                await self.websocket.send_text(json.dumps(message, default=str))
+                self.sent += 1
+            except Exception as send_error:
+                print(f"Error sending live map message: {send_error}")
+                return
+
+    def _shows(self, record: LiveDriverRecord) -> bool:
+        return record.is_online and record.has_location and _contains(self.bbox, record.lat, record.lng)
+
+    def _cluster_message(self) -> Optional[Dict[str, Any]]:
+        drivers = live_driver_store.in_bounds(*self.bbox)
+        self.visible = {record.driver_id for record in drivers}
+        clusters = _cluster(drivers, self.zoom)
+        if clusters == self._last_clusters:
+            return None
+        self._last_clusters = clusters
+        return {"type": "clusters", "zoom": self.zoom, "clusters": clusters, "total": len(drivers)}
+
+
+class LiveMapHub:
+    """Mapas en vivo de este worker y envío periódico de cambios"""
+
+    def __init__(self, push_interval: float = 1.0, cluster_zoom: int = 13):
+        self.push_interval = push_interval
+        self.cluster_zoom = cluster_zoom
+
+        self._sessions: Set[LiveMapSession] = set()
+        # Conductores que cambiaron desde el último envío (escrito desde el hilo del broker)
+        self._dirty: Set[int] = set()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        # Contadores
+        self.ticks = 0
+        self.messages = 0
+        self.rejected = 0
+
+    async def start(self):
+        """Iniciar el envío periódico"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def serve(self, websocket: WebSocket, token: str):
+        """Atender el mapa de un administrador (el socket ya fue aceptado)"""
+        if not await asyncio.to_thread(_is_admin_token, token):
+            self.rejected += 1
+            try:
+                await websocket.send_json({"type": "error", "error": "Solo administradores pueden ver el mapa"})
+                await websocket.close(code=CLOSE_POLICY_VIOLATION)
+            except Exception as send_error:
+                print(f"Error sending live map rejection: {send_error}")
+            return
+
+        session = LiveMapSession(websocket, self.cluster_zoom)
+        self._sessions.add(session)
+        sender = asyncio.create_task(session.send_loop())
+        try:
+            while True:
+                data = await websocket.receive_json()
+                error = session.subscribe(data) if isinstance(data, dict) else "Mensaje inválido"
+                if error:
+                    session.enqueue({"type": "error", "error": error})
+                else:
+                    # El estado del nuevo rectángulo se envía sin esperar al siguiente intervalo
+                    self._push(session, [])
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.warning(f"Mapa en vivo cerrado: {str(e)}")
+        finally:
+            self._sessions.discard(session)
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+    def tick(self):
+        """Enviar a cada mapa los cambios acumulados desde el último intervalo"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        self.ticks += 1
+        if not self._sessions:
+            return
+        # Una sola lectura del almacén por conductor, compartida por todos los mapas
+        changed = [(driver_id, live_driver_store.get(driver_id)) for driver_id in dirty]
+        for session in list(self._sessions):
+            self._push(session, changed)
+
+    def stats(self) -> Dict[str, Any]:
+        sessions = list(self._sessions)
+        return {
+            "sessions": len(sessions),
+            "clustered_sessions": sum(1 for session in sessions if session.clustered),
+            "ticks": self.ticks,
+            "messages": self.messages,
+            "rejected": self.rejected,
+            "dropped": sum(session.dropped for session in sessions),
+            "pending_changes": len(self._dirty)
+        }
+
+    def _push(self, session: LiveMapSession, changed: List[Tuple[int, Optional[LiveDriverRecord]]]):
+        try:
+            message = session.build_message(changed)
+        except Exception as e:
+            logger.error(f"Error construyendo el mapa en vivo: {str(e)}")
+            return
+        if message is not None:
+            self.messages += 1
+            session.enqueue(message)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.push_interval)
+            self.tick()
+
+    def _on_driver_change(self, message: Dict[str, Any]):
+        # Los cambios del intervalo de reporte no se ven en el mapa
+        if self._sessions and "sampling_interval" not in message:
+            with self._lock:
+                self._dirty.add(message["driver_id"])
+
+
+def _contains(bbox: BoundingBox, lat: float, lng: float) -> bool:
+    south, west, north, east = bbox
+    if not south <= lat <= north:
+        return False
+    if west <= east:
+        return west <= lng <= east
+    # Rectángulo que cruza el antimeridiano
+    return lng >= west or lng <= east
+
+
+def _cluster(drivers: List[LiveDriverRecord], zoom: int) -> List[Dict[str, Any]]:
+    """Agrupar conductores en celdas proporcionales al tamaño de tile del zoom"""
+    cell_size = 360.0 / (2 ** zoom) / CLUSTER_CELLS_PER_TILE
+    cells: Dict[Tuple[int, int], List[LiveDriverRecord]] = {}
+    for record in drivers:
+        cell = (math.floor(record.lat / cell_size), math.floor(record.lng / cell_size))
+        cells.setdefault(cell, []).append(record)
+
+    clusters = []
+    for cell in sorted(cells):
+        members = cells[cell]
+        cluster = {
+            "lat": round(sum(record.lat for record in members) / len(members), COORDINATE_DECIMALS),
+            "lng": round(sum(record.lng for record in members) / len(members), COORDINATE_DECIMALS),
+            "count": len(members),
+            "delivering": sum(1 for record in members if record.is_delivering)
+        }
+        if len(members) == 1:
+            cluster["driver_id"] = members[0].driver_id
+        clusters.append(cluster)
+    return clusters
+
+
+def _serialize_driver(record: LiveDriverRecord) -> Dict[str, Any]:
+    return {
+        "driver_id": record.driver_id,
+        "driver_name": record.name,
+        "lat": round(record.lat, COORDINATE_DECIMALS + 1),
+        "lng": round(record.lng, COORDINATE_DECIMALS + 1),
+        "heading": record.heading,
+        "speed": record.speed,
+        "is_delivering": record.is_delivering,
+        "last_update": record.fix_time.isoformat() if record.fix_time else None
+    }
+
+
+def _is_admin_token(token: str) -> bool:
+    """Validar el token (incluida la blacklist) y que pertenezca a un administrador"""
+    from features.auth.services import AuthService
+
+    email = verify_access_token(token)
+    if email is None:
+        return False
+    db = SessionLocal()
+    try:
+        if AuthService.is_token_blacklisted(token, db):
+            return False
+        user = db.query(User).filter(User.email == email).first()
+        return user is not None and user.role is not None and user.role.name == "admin"
+    finally:
+        db.close()
+
+
+# Instancia global de mapas en vivo
+live_map_hub = LiveMapHub(
+    push_interval=settings.LIVE_MAP_PUSH_INTERVAL,
+    cluster_zoom=settings.LIVE_MAP_CLUSTER_ZOOM
+)
+tracking_bus.add_listener(CHANNEL_LOCATION, live_map_hub._on_driver_change)
+tracking_bus.add_listener(CHANNEL_DRIVER, live_map_hub._on_driver_change)
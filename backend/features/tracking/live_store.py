@@ -0,0 +1,297 @@
+"""
+Almacén en memoria de la posición en vivo de los conductores
+
+Mantiene la última ubicación y los datos de presentación (nombre,
+teléfono, vehículo) de cada conductor para que las lecturas de
+"ubicación actual" no consulten la BD. Se actualiza desde la ingesta de
+ubicaciones y desde los cambios de estado publicados en el broker.
+"""
+from sqlalchemy.orm import Session, joinedload
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+import logging
+import threading
+
+from core.database import SessionLocal
+from features.tracking.models import Driver
+from features.tracking.broker import CHANNEL_LOCATION, CHANNEL_DRIVER
+from features.tracking.events import tracking_bus
+from features.tracking.spatial import SpatialGridIndex
+
+logger = logging.getLogger(__name__)
+
+
+class LiveDriverRecord:
+    """Última posición y datos de presentación de un conductor"""
+
+    __slots__ = (
+        "driver_id", "user_id", "name", "phone",
+        "vehicle_brand", "vehicle_model", "vehicle_plate",
+        "is_online", "is_available", "is_delivering", "location_update_interval",
+        "sampling_interval", "sampling_state",
+        "lat", "lng", "accuracy", "speed", "heading", "fix_time",
+        "updated_at"
+    )
+
+    def __init__(self, driver_id: int):
+        self.driver_id = driver_id
+        self.user_id: Optional[int] = None
+        self.name = "Conductor"
+        self.phone: Optional[str] = None
+        self.vehicle_brand: Optional[str] = None
+        self.vehicle_model: Optional[str] = None
+        self.vehicle_plate: Optional[str] = None
+        self.is_online = False
+        self.is_available = True
+        self.is_delivering = False
+        self.location_update_interval = 30
+        # Intervalo adaptativo vigente (features.tracking.sampling)
+        self.sampling_interval: Optional[int] = None
+        self.sampling_state: Optional[str] = None
+        self.lat: Optional[float] = None
+        self.lng: Optional[float] = None
+        self.accuracy: Optional[float] = None
+        self.speed: Optional[float] = None
+        self.heading: Optional[float] = None
+        self.fix_time: Optional[datetime] = None
+        self.updated_at: Optional[datetime] = None
+
+    @property
+    def has_location(self) -> bool:
+        return self.lat is not None and self.lng is not None
+
+    def location(self) -> Optional[Dict[str, Any]]:
+        """Ubicación actual con el mismo formato que Driver.current_location"""
+        if not self.has_location:
+            return None
+        return {
+            "lat": self.lat,
+            "lng": self.lng,
+            "accuracy": self.accuracy,
+            "speed": self.speed,
+            "heading": self.heading,
+            "timestamp": self.fix_time.isoformat() if self.fix_time else None
+        }
+
+    def vehicle_info(self) -> Optional[Dict[str, Any]]:
+        if self.vehicle_plate is None and self.vehicle_brand is None:
+            return None
+        return {
+            "brand": self.vehicle_brand,
+            "model": self.vehicle_model,
+            "plate": self.vehicle_plate
+        }
+
+
+class LiveDriverStore:
+    """Registro en memoria de los conductores indexado por driver_id y user_id"""
+
+    def __init__(self):
+        self._records: Dict[int, LiveDriverRecord] = {}
+        self._by_user: Dict[int, int] = {}
+        self._index = SpatialGridIndex()
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    def load(self, db: Optional[Session] = None):
+        """Cargar todos los conductores con una sola consulta"""
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            drivers = db.query(Driver).options(
+                joinedload(Driver.user), joinedload(Driver.vehicle)
+            ).all()
+            with self._lock:
+                for driver in drivers:
+                    self._apply_state(driver.id, driver_state(driver))
+                self._loaded = True
+            logger.info(f"Almacén de conductores en vivo cargado: {len(drivers)} conductores")
+        finally:
+            if own_session:
+                db.close()
+
+    def ensure_loaded(self):
+        """Cargar el almacén si aún no se ha hecho (scripts, tests)"""
+        if not self._loaded:
+            self.load()
+
+    def get(self, driver_id: int, db: Optional[Session] = None) -> Optional[LiveDriverRecord]:
+        """Obtener el registro de un conductor (cargándolo de la BD si no está)"""
+        record = self._records.get(driver_id)
+        if record is None and db is not None:
+            driver = db.query(Driver).options(
+                joinedload(Driver.user), joinedload(Driver.vehicle)
+            ).filter(Driver.id == driver_id).first()
+            if driver is not None:
+                record = self.upsert_driver(driver)
+        return record
+
+    def get_by_user(self, user_id: int, db: Optional[Session] = None) -> Optional[LiveDriverRecord]:
+        """Obtener el registro del conductor asociado a un usuario"""
+        driver_id = self._by_user.get(user_id)
+        if driver_id is not None:
+            return self._records.get(driver_id)
+        if db is None:
+            return None
+        driver = db.query(Driver).options(
+            joinedload(Driver.user), joinedload(Driver.vehicle)
+        ).filter(Driver.user_id == user_id).first()
+        return self.upsert_driver(driver) if driver is not None else None
+
+    def online_drivers(self) -> List[LiveDriverRecord]:
+        """Conductores online"""
+        self.ensure_loaded()
+        with self._lock:
+            return [record for record in self._records.values() if record.is_online]
+
+    def dispatch_candidates(self) -> List[LiveDriverRecord]:
+        """Conductores online, disponibles y con ubicación conocida"""
+        self.ensure_loaded()
+        with self._lock:
+            return [
+                record for record in self._records.values()
+                if record.is_online and record.is_available and record.has_location
+            ]
+
+    def nearby(self, lat: float, lng: float, radius_km: float,
+               available_only: bool = False) -> List[Tuple[LiveDriverRecord, float]]:
+        """Conductores online dentro del radio, ordenados por distancia"""
+        self.ensure_loaded()
+        with self._lock:
+            matches = self._index.within_radius(
+                lat, lng, radius_km, predicate=self._online_predicate(available_only)
+            )
+            return [(self._records[driver_id], distance) for driver_id, distance in matches]
+
+    def nearest(self, lat: float, lng: float, count: int, max_radius_km: float = 50,
+                available_only: bool = False) -> List[Tuple[LiveDriverRecord, float]]:
+        """Los N conductores online más cercanos"""
+        self.ensure_loaded()
+        with self._lock:
+            matches = self._index.nearest(
+                lat, lng, count, max_radius_km, predicate=self._online_predicate(available_only)
+            )
+            return [(self._records[driver_id], distance) for driver_id, distance in matches]
+
+    def in_bounds(self, south: float, west: float, north: float, east: float) -> List[LiveDriverRecord]:
+        """Conductores online con ubicación dentro de un rectángulo del mapa"""
+        self.ensure_loaded()
+        with self._lock:
+            matches = self._index.within_bounds(
+                south, west, north, east, predicate=self._online_predicate(False)
+            )
+            return [self._records[driver_id] for driver_id, _, _ in matches]
+
+    def _online_predicate(self, available_only: bool):
+        records = self._records
+
+        def predicate(driver_id: int) -> bool:
+            record = records[driver_id]
+            return record.is_online and (record.is_available or not available_only)
+        return predicate
+
+    def upsert_driver(self, driver: Driver) -> LiveDriverRecord:
+        """Actualizar el registro local con los datos de un Driver de la BD"""
+        with self._lock:
+            return self._apply_state(driver.id, driver_state(driver))
+
+    def update_fix(self, driver_id: int, lat: float, lng: float, accuracy: Optional[float] = None,
+                   speed: Optional[float] = None, heading: Optional[float] = None,
+                   fix_time: Optional[datetime] = None):
+        """Registrar una nueva posición (se ignoran posiciones más antiguas)"""
+        with self._lock:
+            record = self._records.get(driver_id)
+            if record is None:
+                record = self._records[driver_id] = LiveDriverRecord(driver_id)
+            if record.fix_time is not None and fix_time is not None and fix_time < record.fix_time:
+                return
+            record.lat = lat
+            record.lng = lng
+            record.accuracy = accuracy
+            record.speed = speed
+            record.heading = heading
+            record.fix_time = fix_time
+            self._index.update(driver_id, lat, lng)
+
+    def publish_driver(self, driver: Driver):
+        """Actualizar el registro y difundirlo al resto de workers"""
+        self.upsert_driver(driver)
+        tracking_bus.publish_driver_state(driver.id, _serialize_state(driver_state(driver)))
+
+    def _apply_state(self, driver_id: int, state: Dict[str, Any]) -> LiveDriverRecord:
+        record = self._records.get(driver_id)
+        if record is None:
+            record = self._records[driver_id] = LiveDriverRecord(driver_id)
+
+        location = state.pop("current_location", None)
+        fix_time = state.pop("last_location_update", None)
+        for field, value in state.items():
+            setattr(record, field, value)
+        if record.user_id is not None:
+            self._by_user[record.user_id] = driver_id
+
+        if location and location.get("lat") is not None and record.fix_time is None:
+            record.lat = location.get("lat")
+            record.lng = location.get("lng")
+            record.accuracy = location.get("accuracy")
+            record.speed = location.get("speed")
+            record.heading = location.get("heading")
+            record.fix_time = fix_time
+            self._index.update(driver_id, record.lat, record.lng)
+        return record
+
+    def _on_location_message(self, message: Dict[str, Any]):
+        location = message["location"]
+        timestamp = location.get("timestamp")
+        self.update_fix(
+            message["driver_id"],
+            location["lat"],
+            location["lng"],
+            accuracy=location.get("accuracy"),
+            speed=location.get("speed"),
+            heading=location.get("heading"),
+            fix_time=datetime.fromisoformat(timestamp) if timestamp else None
+        )
+
+    def _on_driver_message(self, message: Dict[str, Any]):
+        state = dict(message)
+        driver_id = state.pop("driver_id")
+        for field in ("updated_at", "last_location_update"):
+            if state.get(field):
+                state[field] = datetime.fromisoformat(state[field])
+        with self._lock:
+            self._apply_state(driver_id, state)
+
+
+def driver_state(driver: Driver) -> Dict[str, Any]:
+    """Extraer los datos de presentación y estado de un Driver"""
+    return {
+        "user_id": driver.user_id,
+        "name": driver.user.full_name if driver.user else "Conductor",
+        "phone": driver.phone,
+        "vehicle_brand": driver.vehicle.brand if driver.vehicle else None,
+        "vehicle_model": driver.vehicle.model if driver.vehicle else None,
+        "vehicle_plate": driver.vehicle.plate if driver.vehicle else None,
+        "is_online": driver.is_online,
+        "is_available": driver.is_available,
+        "is_delivering": driver.is_delivering,
+        "location_update_interval": driver.location_update_interval,
+        "updated_at": driver.updated_at,
+        "current_location": driver.current_location,
+        "last_location_update": driver.last_location_update
+    }
+
+
+def _serialize_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    # La ubicación viaja por el canal de ubicaciones, no con el estado
+    state.pop("current_location", None)
+    state.pop("last_location_update", None)
+    if state.get("updated_at"):
+        state["updated_at"] = state["updated_at"].isoformat()
+    return state
+
+
+# Instancia global del almacén de conductores en vivo
+live_driver_store = LiveDriverStore()
+tracking_bus.add_listener(CHANNEL_LOCATION, live_driver_store._on_location_message)
+tracking_bus.add_listener(CHANNEL_DRIVER, live_driver_store._on_driver_message)
@@ -1,7 +1,7 @@
 """
 Modelos para el sistema de tracking en tiempo real
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, JSON, Text, Float
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, JSON, Text, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from core.database import Base
@@ -45,23 +45,27 @@ class Driver(Base):
 class DeliveryTracking(Base):
     """Modelo para seguimiento de entregas"""
     __tablename__ = "delivery_tracking"
+    __table_args__ = (
+        # Entregas recientes por conductor (estadísticas de 30 días)
+        Index("ix_delivery_tracking_driver_assigned", "driver_id", "assigned_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
     driver_id = Column(Integer, ForeignKey("drivers.id"), nullable=False, index=True)
     
     # Estado de la entrega
-    status = Column(String(50), default="assigned", nullable=False)  # assigned, started, in_progress, completed, failed
+    status = Column(String(50), default="assigned", nullable=False, index=True)  # assigned, started, in_progress, completed, failed
     priority = Column(String(20), default="normal", nullable=False)  # low, normal, high, urgent
     
     # Timestamps
     assigned_at = Column(DateTime, default=func.now(), nullable=False)
     started_at = Column(DateTime, nullable=True)
-    completed_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True, index=True)
     
     # Ubicación de entrega
     delivery_address = Column(JSON, nullable=True)  # Dirección completa
-    delivery_coordinates = Column(JSON, nullable=True)  # {"lat": 40.7128, "lng": -74.0060}
+    delivery_coordinates = Column(JSON, nullable=True)  # {"lat": 40.7128, "lng": -74.0060, "source": "explicit" | "geocoder" | "zip"}
     
     # Estimaciones
     estimated_arrival = Column(DateTime, nullable=True)
@@ -82,8 +86,15 @@ class DeliveryTracking(Base):
     location_updates = relationship("LocationUpdate", back_populates="delivery")
 
 class LocationUpdate(Base):
-    """Modelo para historial de ubicaciones"""
+    """
+    Modelo para historial de ubicaciones
+    - En PostgreSQL la tabla está particionada por rango de timestamp
+      (ver core/migrations.py); la PK física es (id, timestamp)
+    """
     __tablename__ = "location_updates"
+    __table_args__ = (
+        Index("ix_location_updates_driver_timestamp", "driver_id", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     driver_id = Column(Integer, ForeignKey("drivers.id"), nullable=False, index=True)
@@ -97,12 +108,62 @@ class LocationUpdate(Base):
     heading = Column(Float, nullable=True)  # Dirección en grados
     
     # Timestamp
-    timestamp = Column(DateTime, default=func.now(), nullable=False)
+    timestamp = Column(DateTime, default=func.now(), nullable=False, index=True)
     
     # Relaciones
     driver = relationship("Driver", back_populates="location_updates")
     delivery = relationship("DeliveryTracking", back_populates="location_updates")
 
+class LocationRollup(Base):
+    """Resumen compactado de ubicaciones expiradas (por entrega, o por conductor y día)"""
+    __tablename__ = "location_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    driver_id = Column(Integer, ForeignKey("drivers.id"), nullable=False, index=True)
+    delivery_id = Column(Integer, ForeignKey("delivery_tracking.id"), nullable=True, index=True)
+    
+    # Periodo cubierto por el resumen
+    period_start = Column(DateTime, nullable=False)
+    period_end = Column(DateTime, nullable=False)
+    
+    # Resumen del recorrido
+    point_count = Column(Integer, nullable=False)
+    distance_km = Column(Float, nullable=False)
+    avg_speed = Column(Float, nullable=True)  # km/h
+    max_speed = Column(Float, nullable=True)  # km/h
+    path = Column(JSON, nullable=True)  # Ruta simplificada [[lat, lng], ...]
+    
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+
+class DriverStats(Base):
+    """Contadores de entregas por conductor (se mantienen al asignar y al cambiar de estado)"""
+    __tablename__ = "driver_stats"
+    
+    driver_id = Column(Integer, ForeignKey("drivers.id"), primary_key=True)
+    total_deliveries = Column(Integer, default=0, nullable=False)
+    completed_deliveries = Column(Integer, default=0, nullable=False)
+    failed_deliveries = Column(Integer, default=0, nullable=False)
+    
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
+class GeocodeCache(Base):
+    """Caché permanente de direcciones normalizadas resueltas por el geocodificador externo"""
+    __tablename__ = "geocode_cache"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    address_key = Column(String(500), unique=True, nullable=False, index=True)
+    postcode = Column(String(10), nullable=True, index=True)
+    
+    # Resultado (NULL si el geocodificador no encontró la dirección)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    source = Column(String(50), nullable=False)  # nombre del geocodificador
+    
+    # Uso
+    hits = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    last_used_at = Column(DateTime, nullable=True)
+
 class DriverSession(Base):
     """Modelo para sesiones activas de conductores"""
     __tablename__ = "driver_sessions"
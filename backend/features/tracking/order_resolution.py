@@ -0,0 +1,148 @@
+"""
+Caché de resolución de números de orden
+
+Las entradas de tracking para clientes (REST y WebSocket) reciben un número
+de orden (id local o número de WooCommerce) y necesitan la entrega activa y
+su conductor. La resolución se guarda en memoria para las entregas activas:
+
+- se llena al asignar una entrega (evento "assigned" del canal de entregas,
+  recibido por todos los workers) o en el primer acceso
+- se invalida cuando la entrega termina (completed/failed) o la orden recibe
+  una nueva asignación
+
+Las órdenes sin entrega activa se resuelven siempre contra la BD.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import desc
+from typing import Any, Dict, Optional
+import threading
+
+from core.config import settings
+from features.ecommerce.models import Order
+from features.tracking.models import DeliveryTracking
+from features.tracking.broker import CHANNEL_DELIVERY
+from features.tracking.events import tracking_bus
+
+# Estados de entrega que siguen activos
+ACTIVE_DELIVERY_STATUSES = ["assigned", "started", "in_progress"]
+
+
+class OrderResolution:
+    """Orden, entrega y conductor que corresponden a un número de orden"""
+
+    __slots__ = ("order_id", "woocommerce_order_id", "delivery_id", "driver_id")
+
+    def __init__(self, order_id: int, woocommerce_order_id: Optional[int],
+                 delivery_id: Optional[int], driver_id: Optional[int]):
+        self.order_id = order_id
+        self.woocommerce_order_id = woocommerce_order_id
+        self.delivery_id = delivery_id
+        self.driver_id = driver_id
+
+
+class OrderResolutionCache:
+    """Resolución número de orden -> (orden, entrega, conductor) de las entregas activas"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._by_order_id: Dict[int, OrderResolution] = {}
+        self._by_woocommerce_id: Dict[int, OrderResolution] = {}
+        self._lock = threading.Lock()
+        # Se incrementa con cada invalidación para descartar lecturas de la BD a mitad
+        self._version = 0
+
+        # Contadores
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def resolve(self, order_number: Any, db: Session, woocommerce: bool = False) -> Optional[OrderResolution]:
+        """
+        Resolver un número de orden
+        - woocommerce=False: id local de la orden; True: número de orden de WooCommerce
+        - Retorna None si la orden no existe; delivery_id/driver_id son None sin entrega
+        - Lanza ValueError si el número no es un entero
+        """
+        number = int(order_number)
+        index = self._by_woocommerce_id if woocommerce else self._by_order_id
+        with self._lock:
+            resolution = index.get(number)
+            if resolution is not None:
+                self.hits += 1
+                return resolution
+            self.misses += 1
+            version = self._version
+
+        criteria = Order.woocommerce_order_id == number if woocommerce else Order.id == number
+        order = db.query(Order.id, Order.woocommerce_order_id).filter(criteria).first()
+        if order is None:
+            return None
+        # La entrega más reciente de la orden (tras una entrega fallida puede haber otra)
+        delivery = db.query(
+            DeliveryTracking.id, DeliveryTracking.driver_id, DeliveryTracking.status
+        ).filter(
+            DeliveryTracking.order_id == order.id
+        ).order_by(desc(DeliveryTracking.id)).first()
+
+        if delivery is None:
+            return OrderResolution(order.id, order.woocommerce_order_id, None, None)
+        resolution = OrderResolution(order.id, order.woocommerce_order_id, delivery.id, delivery.driver_id)
+        if delivery.status in ACTIVE_DELIVERY_STATUSES:
+            with self._lock:
+                if version == self._version:
+                    self._store(resolution)
+        return resolution
+
+    def remember(self, order_id: int, woocommerce_order_id: Optional[int], delivery_id: int, driver_id: int):
+        """Guardar la resolución de una entrega recién asignada"""
+        with self._lock:
+            self._version += 1
+            self._discard(order_id)
+            self._store(OrderResolution(order_id, woocommerce_order_id, delivery_id, driver_id))
+
+    def invalidate_delivery(self, delivery_id: int):
+        """Olvidar la resolución de una entrega que terminó"""
+        with self._lock:
+            self._version += 1
+            for resolution in list(self._by_order_id.values()):
+                if resolution.delivery_id == delivery_id:
+                    self._discard(resolution.order_id)
+                    self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._by_order_id),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations
+        }
+
+    def _store(self, resolution: OrderResolution):
+        self._discard(resolution.order_id)
+        if len(self._by_order_id) >= self.max_entries:
+            # Descartar la entrada más antigua
+            self._discard(next(iter(self._by_order_id)))
+        self._by_order_id[resolution.order_id] = resolution
+        if resolution.woocommerce_order_id is not None:
+            self._by_woocommerce_id[resolution.woocommerce_order_id] = resolution
+
+    def _discard(self, order_id: int):
+        resolution = self._by_order_id.pop(order_id, None)
+        if resolution is not None and resolution.woocommerce_order_id is not None:
+            self._by_woocommerce_id.pop(resolution.woocommerce_order_id, None)
+
+    def _on_delivery_message(self, message: Dict[str, Any]):
+        event_type = message.get("type")
+        if event_type == "assigned":
+            # Nueva asignación (en este u otro worker): reemplaza la entrega anterior de la orden
+            self.remember(message["order_id"], message.get("woocommerce_order_id"),
+                          message["delivery_id"], message["driver_id"])
+        elif event_type == "status_update" and message.get("status") not in ACTIVE_DELIVERY_STATUSES:
+            self.invalidate_delivery(message["delivery_id"])
+
+
+# Instancia global de la caché de resolución de órdenes
+order_resolver = OrderResolutionCache(max_entries=settings.ORDER_RESOLUTION_CACHE_SIZE)
+tracking_bus.add_listener(CHANNEL_DELIVERY, order_resolver._on_delivery_message)
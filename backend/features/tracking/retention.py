@@ -0,0 +1,250 @@
+"""
+Mantenimiento del historial de ubicaciones
+
+- Crea por adelantado las particiones de location_updates (PostgreSQL)
+- Compacta los puntos expirados en location_rollups (un resumen por
+  entrega, o por conductor y día si el punto no tenía entrega)
+- En PostgreSQL elimina particiones completas con DROP TABLE (también la
+  partición location_updates_legacy de la conversión, cuando todo su rango
+  queda fuera de la retención) y solo borra por día en la partición
+  DEFAULT; en otras BD borra por día
+- Desactivado por defecto (LOCATION_RETENTION_DAYS=0)
+"""
+from sqlalchemy import delete, insert, select, table, column, text
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import logging
+
+from core.config import settings
+from core.database import SessionLocal, engine
+from core.migrations import (
+    LOCATION_DEFAULT_PARTITION, is_postgres, ensure_location_partitions,
+    list_location_partitions, period_start
+)
+from features.tracking.models import LocationUpdate, LocationRollup
+from features.tracking.geo import haversine_km
+from features.tracking.simplify import simplify_track
+
+logger = logging.getLogger(__name__)
+
+# Clave del advisory lock que evita que dos workers ejecuten el mantenimiento a la vez
+MAINTENANCE_LOCK_KEY = 734201
+# Resúmenes insertados por sentencia
+ROLLUP_BATCH_SIZE = 1000
+# Filas leídas por bloque al compactar
+ROLLUP_FETCH_SIZE = 5000
+# Columnas leídas al compactar
+ROLLUP_COLUMNS = ("driver_id", "delivery_id", "latitude", "longitude", "speed", "timestamp")
+# Simplificación de la ruta guardada en cada resumen
+ROLLUP_PATH_TOLERANCE_M = 25
+ROLLUP_PATH_MAX_POINTS = 200
+
+
+class LocationRetentionJob:
+    """Tarea periódica de particiones, compactación y retención del historial"""
+
+    def __init__(self, retention_days: int = 0, interval_seconds: int = 3600):
+        self.retention_days = retention_days
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+        # Contadores de la última ejecución
+        self.last_run: Optional[datetime] = None
+        self.last_result: Dict[str, Any] = {}
+
+    async def start(self):
+        """Iniciar la tarea periódica"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Detener la tarea periódica"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error(f"Error en mantenimiento del historial de ubicaciones: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Ejecutar un ciclo completo de mantenimiento"""
+        now = now or datetime.utcnow()
+        result = {"partitions_created": [], "partitions_dropped": [], "rows_deleted": 0, "rollups": 0}
+
+        if is_postgres():
+            with engine.begin() as connection:
+                if not _try_lock(connection):
+                    return result
+                result["partitions_created"] = ensure_location_partitions(connection)
+
+        if self.retention_days > 0:
+            cutoff = now - timedelta(days=self.retention_days)
+            if is_postgres():
+                # Las particiones solo se eliminan completas
+                cutoff = period_start(cutoff)
+                self._drop_expired_partitions(cutoff, result)
+            self._delete_expired_rows(cutoff, result)
+
+        self.last_run = now
+        self.last_result = result
+        if result["partitions_dropped"] or result["rows_deleted"]:
+            logger.info(
+                f"Historial de ubicaciones compactado: {result['rollups']} resúmenes, "
+                f"particiones eliminadas {result['partitions_dropped']}, filas borradas {result['rows_deleted']}"
+            )
+        return result
+
+    def _drop_expired_partitions(self, cutoff: datetime, result: Dict[str, Any]):
+        """Compactar y eliminar las particiones que terminan antes del corte"""
+        with engine.connect() as connection:
+            partitions = list_location_partitions(connection)
+
+        for name, lower, upper in partitions:
+            if name == LOCATION_DEFAULT_PARTITION or upper is None or upper > cutoff:
+                continue
+
+            db = SessionLocal()
+            try:
+                # Resúmenes y DROP en la misma transacción: o se hacen ambos o ninguno
+                if not _try_lock(db):
+                    return
+                result["rollups"] += compact_location_range(db, lower, upper, source=name)
+                db.execute(text(f"DROP TABLE {name}"))
+                db.commit()
+                result["partitions_dropped"].append(name)
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+    def _delete_expired_rows(self, cutoff: datetime, result: Dict[str, Any]):
+        """
+        Compactar y borrar por días las filas anteriores al corte
+        - En PostgreSQL solo en la partición DEFAULT: las demás (incluida la
+          legacy) se eliminan completas en _drop_expired_partitions
+        """
+        source = LOCATION_DEFAULT_PARTITION if is_postgres() else None
+        locations = LocationUpdate.__table__
+        if source is not None:
+            locations = table(source, column("timestamp"))
+
+        db = SessionLocal()
+        try:
+            oldest = db.execute(
+                select(locations.c.timestamp).where(locations.c.timestamp < cutoff)
+                .order_by(locations.c.timestamp.asc()).limit(1)
+            ).scalar()
+            if oldest is None:
+                return
+
+            day = oldest.replace(hour=0, minute=0, second=0, microsecond=0)
+            while day < cutoff:
+                day_end = min(day + timedelta(days=1), cutoff)
+                if is_postgres() and not _try_lock(db):
+                    return
+                result["rollups"] += compact_location_range(db, day, day_end, source=source)
+                result["rows_deleted"] += db.execute(
+                    delete(locations).where(locations.c.timestamp >= day, locations.c.timestamp < day_end)
+                ).rowcount
+                db.commit()
+                day = day_end
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+def compact_location_range(db: Session, start: Optional[datetime], end: datetime,
+                           source: Optional[str] = None) -> int:
+    """
+    Crear los resúmenes de los puntos con timestamp en [start, end)
+    - source: leer de una partición concreta en lugar de location_updates
+    - No hace commit; retorna el número de resúmenes insertados
+    """
+    locations = LocationUpdate.__table__
+    if source is not None:
+        locations = table(source, *(column(name) for name in ROLLUP_COLUMNS))
+
+    query = select(*(locations.c[name] for name in ROLLUP_COLUMNS)).where(locations.c.timestamp < end)
+    if start is not None:
+        query = query.where(locations.c.timestamp >= start)
+    query = query.order_by(locations.c.driver_id, locations.c.delivery_id, locations.c.timestamp)
+    rows = db.execute(query.execution_options(yield_per=ROLLUP_FETCH_SIZE))
+
+    pending: List[Dict[str, Any]] = []
+    total = 0
+    group_key = None
+    points: List[Dict[str, Any]] = []
+
+    for row in rows:
+        # Sin entrega: un resumen por conductor y día
+        day = row.timestamp.date() if row.delivery_id is None else None
+        key = (row.driver_id, row.delivery_id, day)
+        if key != group_key and points:
+            pending.append(_summarize(points))
+            points = []
+        group_key = key
+        points.append({
+            "driver_id": row.driver_id,
+            "delivery_id": row.delivery_id,
+            "latitude": row.latitude,
+            "longitude": row.longitude,
+            "speed": row.speed,
+            "timestamp": row.timestamp
+        })
+
+        if len(pending) >= ROLLUP_BATCH_SIZE:
+            db.execute(insert(LocationRollup), pending)
+            total += len(pending)
+            pending = []
+
+    if points:
+        pending.append(_summarize(points))
+    if pending:
+        db.execute(insert(LocationRollup), pending)
+        total += len(pending)
+    return total
+
+
+def _summarize(points: List[Dict[str, Any]]) -> Dict[str, Any]:
+    distance = sum(
+        haversine_km(previous["latitude"], previous["longitude"], point["latitude"], point["longitude"])
+        for previous, point in zip(points, points[1:])
+    )
+    speeds = [point["speed"] for point in points if point["speed"] is not None]
+    path = simplify_track(points, tolerance_m=ROLLUP_PATH_TOLERANCE_M, max_points=ROLLUP_PATH_MAX_POINTS)
+
+    return {
+        "driver_id": points[0]["driver_id"],
+        "delivery_id": points[0]["delivery_id"],
+        "period_start": points[0]["timestamp"],
+        "period_end": points[-1]["timestamp"],
+        "point_count": len(points),
+        "distance_km": round(distance, 3),
+        "avg_speed": round(sum(speeds) / len(speeds), 2) if speeds else None,
+        "max_speed": max(speeds) if speeds else None,
+        "path": [[point["latitude"], point["longitude"]] for point in path]
+    }
+
+
+def _try_lock(connection) -> bool:
+    """Advisory lock de transacción (se libera en commit/rollback)"""
+    return bool(connection.execute(
+        text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY}
+    ).scalar())
+
+
+# Instancia global del mantenimiento del historial
+location_retention = LocationRetentionJob(
+    retention_days=settings.LOCATION_RETENTION_DAYS,
+    interval_seconds=settings.LOCATION_MAINTENANCE_INTERVAL
+)
@@ -0,0 +1,262 @@
+"""
+Orden de visita de las entregas pendientes de un conductor
+
+Con varias entregas asignadas, el orden por assigned_at suele obligar a
+cruzar la zona varias veces. El planificador calcula un recorrido abierto
+desde la posición en vivo del conductor:
+
+1. matriz de distancias entre todos los puntos en una sola pasada (numpy)
+2. vecino más cercano como solución inicial
+3. mejora 2-opt (invertir tramos mientras acorten el recorrido)
+
+El orden se guarda por conductor hasta que cambian sus entregas (nueva
+asignación o entrega terminada, en cualquier worker) o vence ROUTE_PLAN_TTL;
+las llegadas estimadas se recalculan en cada consulta desde la posición
+actual con la velocidad suavizada del motor de ETA.
+"""
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+import threading
+import time
+
+import numpy as np
+
+from core.config import settings
+from features.tracking.models import DeliveryTracking
+from features.tracking.broker import CHANNEL_DELIVERY
+from features.tracking.events import tracking_bus
+from features.tracking.eta import eta_engine
+from features.tracking.geo import haversine_km, haversine_km_matrix
+from features.tracking.live_store import live_driver_store
+
+# Estados de entrega que siguen pendientes de visitar
+ACTIVE_DELIVERY_STATUSES = ["assigned", "started", "in_progress"]
+# Pasadas máximas de 2-opt (cada una prueba todos los tramos)
+MAX_TWO_OPT_PASSES = 50
+# Mejora mínima (km) para aceptar una inversión
+TWO_OPT_EPSILON_KM = 1e-6
+
+
+class CachedPlan:
+    """Orden de visita calculado para un conductor"""
+
+    __slots__ = ("stops", "unrouted", "origin", "computed_at", "expires")
+
+    def __init__(self, stops: List[Dict[str, Any]], unrouted: List[int],
+                 origin: Optional[Tuple[float, float]], ttl: float):
+        self.stops = stops
+        self.unrouted = unrouted
+        self.origin = origin
+        self.computed_at = datetime.utcnow()
+        self.expires = time.monotonic() + ttl
+
+
+class RoutePlanner:
+    """Planificación y caché por conductor del orden de visita de sus entregas"""
+
+    def __init__(self, ttl: float = 300.0, stop_minutes: float = 4.0):
+        self.ttl = ttl
+        self.stop_minutes = stop_minutes
+
+        self._plans: Dict[int, CachedPlan] = {}
+        # Se incrementa por conductor con cada invalidación para descartar cálculos a mitad
+        self._versions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+        # Contadores
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.last_plan_ms = 0.0
+
+    def plan(self, driver_id: int, db: Session) -> Dict[str, Any]:
+        """
+        Orden de visita de las entregas activas del conductor
+        - Parte de su posición en vivo (o de la entrega más antigua si no hay posición)
+        - Retorna las paradas con distancia y llegada estimada acumuladas; las
+          entregas sin coordenadas se listan aparte en "unrouted"
+        """
+        with self._lock:
+            cached = self._plans.get(driver_id)
+            if cached is not None and time.monotonic() < cached.expires:
+                self.hits += 1
+            else:
+                cached = None
+                self.misses += 1
+                version = self._versions.get(driver_id, 0)
+
+        if cached is None:
+            cached = self._compute(driver_id, db)
+            with self._lock:
+                if self._versions.get(driver_id, 0) == version:
+                    self._plans[driver_id] = cached
+
+        return self._with_etas(driver_id, cached)
+
+    def invalidate(self, driver_id: int):
+        """Descartar el plan de un conductor"""
+        with self._lock:
+            self._versions[driver_id] = self._versions.get(driver_id, 0) + 1
+            if self._plans.pop(driver_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "plans": len(self._plans),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "last_plan_ms": round(self.last_plan_ms, 2)
+        }
+
+    def _compute(self, driver_id: int, db: Session) -> CachedPlan:
+        started = time.perf_counter()
+        deliveries = db.query(DeliveryTracking).filter(
+            DeliveryTracking.driver_id == driver_id,
+            DeliveryTracking.status.in_(ACTIVE_DELIVERY_STATUSES)
+        ).order_by(DeliveryTracking.assigned_at).all()
+
+        stops, unrouted = [], []
+        for delivery in deliveries:
+            coordinates = delivery.delivery_coordinates or {}
+            if coordinates.get("lat") is None or coordinates.get("lng") is None:
+                unrouted.append(delivery.id)
+                continue
+            stops.append({
+                "delivery_id": delivery.id,
+                "order_id": delivery.order_id,
+                "status": delivery.status,
+                "priority": delivery.priority,
+                "customer_name": delivery.customer_name,
+                "delivery_address": delivery.delivery_address,
+                "coordinates": {"lat": coordinates["lat"], "lng": coordinates["lng"]}
+            })
+
+        record = live_driver_store.get(driver_id, db)
+        origin = (record.lat, record.lng) if record is not None and record.has_location else None
+
+        if len(stops) > 1:
+            points = [origin] if origin is not None else []
+            points += [(stop["coordinates"]["lat"], stop["coordinates"]["lng"]) for stop in stops]
+            order = optimize_open_route(np.array(points, dtype=float))
+            if origin is not None:
+                # El índice 0 es la posición del conductor
+                order = [index - 1 for index in order[1:]]
+            stops = [stops[index] for index in order]
+
+        self.last_plan_ms = (time.perf_counter() - started) * 1000
+        return CachedPlan(stops, unrouted, origin, self.ttl)
+
+    def _with_etas(self, driver_id: int, cached: CachedPlan) -> Dict[str, Any]:
+        """Distancias y llegadas estimadas desde la posición actual (el orden no cambia)"""
+        record = live_driver_store.get(driver_id)
+        if record is not None and record.has_location:
+            position = (record.lat, record.lng)
+        else:
+            position = cached.origin
+        speed_kmh = eta_engine.driver_speed(driver_id)
+        now = datetime.utcnow()
+
+        stops = []
+        previous = position
+        cumulative_km = 0.0
+        elapsed_minutes = 0.0
+        for sequence, stop in enumerate(cached.stops, start=1):
+            point = (stop["coordinates"]["lat"], stop["coordinates"]["lng"])
+            leg_km = haversine_km(*previous, *point) * eta_engine.road_factor if previous is not None else 0.0
+            cumulative_km += leg_km
+            elapsed_minutes += leg_km / speed_kmh * 60
+            stops.append({
+                **stop,
+                "sequence": sequence,
+                "leg_distance_km": round(leg_km, 2),
+                "cumulative_distance_km": round(cumulative_km, 2),
+                "estimated_arrival": (now + timedelta(minutes=elapsed_minutes)).isoformat()
+            })
+            # Tiempo de entrega en la puerta antes de seguir a la siguiente parada
+            elapsed_minutes += self.stop_minutes
+            previous = point
+
+        return {
+            "driver_id": driver_id,
+            "origin": {"lat": position[0], "lng": position[1]} if position is not None else None,
+            "speed_kmh": round(speed_kmh, 1),
+            "stop_minutes": self.stop_minutes,
+            "total_stops": len(stops),
+            "total_distance_km": round(cumulative_km, 2),
+            "total_duration_minutes": round(elapsed_minutes, 1),
+            "stops": stops,
+            "unrouted": cached.unrouted,
+            "computed_at": cached.computed_at.isoformat()
+        }
+
+    def _on_delivery_message(self, message: Dict[str, Any]):
+        event_type = message.get("type")
+        if event_type == "assigned":
+            self.invalidate(message["driver_id"])
+        elif event_type == "status_update":
+            # Solo cambia el plan si la entrega está en alguno
+            delivery_id = message["delivery_id"]
+            with self._lock:
+                driver_ids = [
+                    driver_id for driver_id, plan in self._plans.items()
+                    if any(stop["delivery_id"] == delivery_id for stop in plan.stops)
+                    or delivery_id in plan.unrouted
+                ]
+            for driver_id in driver_ids:
+                self.invalidate(driver_id)
+
+
+def optimize_open_route(points: np.ndarray) -> List[int]:
+    """
+    Orden de visita de un recorrido abierto que empieza en points[0]
+    - points: arreglo (n, 2) de [lat, lng]
+    - Vecino más cercano y luego 2-opt; retorna los índices empezando por 0
+    """
+    distances = haversine_km_matrix(points[:, 0], points[:, 1])
+    count = len(points)
+
+    # 1. Vecino más cercano desde el punto de partida
+    path = [0]
+    visited = np.zeros(count, dtype=bool)
+    visited[0] = True
+    for _ in range(count - 1):
+        candidates = np.where(visited, np.inf, distances[path[-1]])
+        following = int(np.argmin(candidates))
+        path.append(following)
+        visited[following] = True
+
+    # 2. 2-opt: invertir path[i..j] si acorta el recorrido (el inicio queda fijo)
+    path = np.array(path)
+    for _ in range(MAX_TWO_OPT_PASSES):
+        improved = False
+        for i in range(1, count - 1):
+            before, first = path[i - 1], path[i]
+            ends = np.arange(i + 1, count)
+            last = path[ends]
+            has_next = ends + 1 < count
+            after = path[np.minimum(ends + 1, count - 1)]
+            # Un recorrido abierto no tiene arista después del último punto
+            delta = (
+                distances[before, last] - distances[before, first]
+                + np.where(has_next, distances[first, after] - distances[last, after], 0.0)
+            )
+            best = int(np.argmin(delta))
+            if delta[best] < -TWO_OPT_EPSILON_KM:
+                j = ends[best]
+                path[i:j + 1] = path[i:j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+
+    return [int(index) for index in path]
+
+
+# Instancia global del planificador de rutas
+route_planner = RoutePlanner(
+    ttl=settings.ROUTE_PLAN_TTL,
+    stop_minutes=settings.ROUTE_STOP_MINUTES
+)
+tracking_bus.add_listener(CHANNEL_DELIVERY, route_planner._on_delivery_message)
@@ -1,11 +1,12 @@
 """
 Rutas para el sistema de tracking
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func, desc
+from sqlalchemy import and_
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
 import json
 
@@ -15,6 +16,24 @@ from features.users.models import User
 from features.tracking.models import Driver, DeliveryTracking, LocationUpdate
 from features.ecommerce.models import Order
 from features.tracking.services import DriverService, LocationService, DeliveryTrackingService
+from features.tracking.events import tracking_bus
+from features.tracking.ingest import location_ingest
+from features.tracking.driver_channel import driver_channels
+from features.tracking.connections import connection_manager, CLOSE_TRY_AGAIN_LATER
+from features.tracking.dashboard import DashboardService, dashboard_cache
+from features.tracking.geocoding import address_geocoder
+from features.tracking.geofence import geofence_monitor
+from features.tracking.gps_filter import gps_filter
+from features.tracking.live_map import live_map_hub
+from features.tracking.live_store import live_driver_store
+from features.tracking.order_resolution import order_resolver
+from features.tracking.route_planner import route_planner
+from features.tracking.sampling import sampling_controller
+from features.tracking.streams import order_streams
+from features.tracking.export import LocationExportService, EXPORT_FORMATS
+from features.tracking.encoding import (
+    BINARY_MEDIA_TYPE, resolve_track_format, encode_track_polyline, encode_track_binary
+)
 from features.tracking.schemas import (
     DriverActivateRequest, DriverResponse, DriverUpdateRequest,
     LocationUpdateRequest, LocationUpdateResponse, DriverStatusUpdateRequest,
@@ -194,7 +213,11 @@ async def update_driver_status(
             is_delivering=updated_driver.is_delivering,
             current_location=updated_driver.current_location,
             last_update=updated_driver.updated_at,
-            status_message="Estado actualizado correctamente"
+            status_message="Estado actualizado correctamente",
+            location_update_interval=(
+                sampling_controller.current_interval(updated_driver.id)
+                or updated_driver.location_update_interval
+            )
         )
         
     except HTTPException:
@@ -295,7 +318,8 @@ async def update_driver_location(
             timestamp=result["timestamp"],
             location=result["location"],
             distance_from_destination=result.get("distance_from_destination"),
-            estimated_arrival=result.get("estimated_arrival")
+            estimated_arrival=result.get("estimated_arrival"),
+            location_update_interval=result.get("location_update_interval")
         )
         
     except HTTPException:
@@ -309,6 +333,11 @@ async def update_driver_location(
 @tracking_router.get("/drivers/location/history")
 async def get_location_history(
     hours: int = Query(24, ge=1, le=168, description="Horas de historial a obtener"),
+    tolerance_m: Optional[float] = Query(None, ge=0, le=5000, description="Tolerancia de simplificación en metros"),
+    max_points: Optional[int] = Query(None, ge=2, le=50000, description="Número máximo de puntos"),
+    bucket_seconds: Optional[int] = Query(None, ge=1, le=3600, description="Un punto por ventana de N segundos"),
+    format: Optional[str] = Query(None, pattern="^(json|polyline|binary)$", description="Codificación de la respuesta"),
+    accept: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -316,6 +345,8 @@ async def get_location_history(
     Obtener historial de ubicaciones del conductor
     - Últimas N horas de ubicaciones
     - Para análisis de rutas
+    - Simplificación opcional en servidor (tolerance_m, max_points, bucket_seconds)
+    - Codificación compacta con format=polyline|binary o el header Accept
     """
     try:
         # Verificar que el usuario es conductor
@@ -332,14 +363,56 @@ async def get_location_history(
                 detail="Perfil de conductor no encontrado"
             )
         
-        history = LocationService.get_driver_location_history(driver.id, hours, db)
+        history = LocationService.get_driver_location_history(
+            driver.id, hours, db,
+            tolerance_m=tolerance_m, max_points=max_points, bucket_seconds=bucket_seconds
+        )
         
-        return {
+        return _track_response(history, resolve_track_format(format, accept), "location_history", {
             "driver_id": driver.id,
             "hours_requested": hours,
-            "total_points": len(history),
-            "location_history": history
-        }
+            "simplified": any(value is not None for value in (tolerance_m, max_points, bucket_seconds))
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error interno: {str(e)}"
+        )
+
+@tracking_router.get("/drivers/location/export")
+async def export_location_history(
+    hours: int = Query(24, ge=1, le=24 * 90, description="Horas de historial a exportar"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Formato de exportación"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Exportar historial de ubicaciones del conductor en streaming
+    - NDJSON o CSV por bloques, sin cargar todo el rango en memoria
+    """
+    try:
+        # Verificar que el usuario es conductor
+        if not current_user.role or current_user.role.name != "driver":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="El usuario debe tener rol 'driver'"
+            )
+        
+        driver = DriverService.get_driver_by_user_id(current_user.id, db)
+        if not driver:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Perfil de conductor no encontrado"
+            )
+        
+        start = datetime.utcnow() - timedelta(hours=hours)
+        return _export_response(
+            LocationExportService.stream(format, start, driver_id=driver.id),
+            format, LocationExportService.filename(f"driver_{driver.id}_locations", format, start)
+        )
         
     except HTTPException:
         raise
@@ -367,7 +440,8 @@ async def get_current_location(
                 detail="El usuario debe tener rol 'driver'"
             )
         
-        driver = DriverService.get_driver_by_user_id(current_user.id, db)
+        # Leer del almacén en vivo (la BD solo se consulta si el conductor no está cargado)
+        driver = live_driver_store.get_by_user(current_user.id, db)
         if not driver:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -375,18 +449,14 @@ async def get_current_location(
             )
         
         return DriverLocationResponse(
-            driver_id=driver.id,
-            driver_name=driver.user.full_name if driver.user else "Conductor",
+            driver_id=driver.driver_id,
+            driver_name=driver.name,
             driver_phone=driver.phone,
             is_online=driver.is_online,
             is_delivering=driver.is_delivering,
-            current_location=driver.current_location,
-            last_update=driver.last_location_update or driver.updated_at,
-            vehicle_info={
-                "brand": driver.vehicle.brand if driver.vehicle else None,
-                "model": driver.vehicle.model if driver.vehicle else None,
-                "plate": driver.vehicle.plate if driver.vehicle else None
-            } if driver.vehicle else None,
+            current_location=driver.location(),
+            last_update=driver.fix_time or driver.updated_at,
+            vehicle_info=driver.vehicle_info(),
             estimated_arrival=None,  # Se calculará cuando haya entrega
             status_message="Ubicación actual"
         )
@@ -410,28 +480,30 @@ async def get_driver_location_for_customer(
     - Para mostrar en OpenStreetMap
     """
     try:
-        # Buscar orden por número
+        # Orden, entrega y conductor desde la caché de resolución
         try:
-            order_id = int(order_number)
+            resolution = order_resolver.resolve(order_number, db)
         except ValueError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Número de orden inválido"
             )
         
-        order = db.query(Order).filter(Order.id == order_id).first()
-        if not order:
+        if not resolution:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Orden no encontrada"
             )
         
-        # Buscar tracking de entrega
         delivery = db.query(DeliveryTracking).filter(
-            DeliveryTracking.order_id == order_id
-        ).first()
+            DeliveryTracking.id == resolution.delivery_id
+        ).first() if resolution.delivery_id else None
         
-        if not delivery or not delivery.driver:
+        # Datos del conductor desde el almacén en vivo
+        driver = live_driver_store.get(resolution.driver_id, db) if delivery else None
+        
+        if not driver:
+            order = db.query(Order).filter(Order.id == resolution.order_id).first()
             return {
                 "order_number": order_number,
                 "driver": None,
@@ -440,29 +512,28 @@ async def get_driver_location_for_customer(
                 "message": "No hay conductor asignado"
             }
         
-        driver = delivery.driver
+        delivery_address = delivery.delivery_address
+        if not delivery_address:
+            order = db.query(Order).filter(Order.id == resolution.order_id).first()
+            delivery_address = order.shipping_address or {}
         
         return {
             "order_number": order_number,
             "driver": {
-                "driver_id": driver.id,
-                "driver_name": driver.user.full_name if driver.user else "Conductor",
+                "driver_id": driver.driver_id,
+                "driver_name": driver.name,
                 "driver_phone": driver.phone,
                 "is_online": driver.is_online,
                 "is_delivering": driver.is_delivering,
-                "current_location": driver.current_location,
-                "last_update": driver.last_location_update,
-                "vehicle_info": {
-                    "brand": driver.vehicle.brand if driver.vehicle else None,
-                    "model": driver.vehicle.model if driver.vehicle else None,
-                    "plate": driver.vehicle.plate if driver.vehicle else None
-                } if driver.vehicle else None,
+                "current_location": driver.location(),
+                "last_update": driver.fix_time,
+                "vehicle_info": driver.vehicle_info(),
                 "estimated_arrival": delivery.estimated_arrival,
                 "status": delivery.status
             },
-            "delivery_address": delivery.delivery_address or order.shipping_address or {},
+            "delivery_address": delivery_address,
             "tracking_enabled": True,
-            "last_update": driver.last_location_update or delivery.updated_at
+            "last_update": driver.fix_time or delivery.last_location_update
         }
         
     except HTTPException:
@@ -482,6 +553,7 @@ async def get_all_drivers_locations(
     Obtener ubicaciones de todos los conductores (solo admins)
     - Para mostrar en mapa de administración
     - Solo conductores online
+    - Para actualizaciones en vivo usar el WebSocket /ws/admin/map
     """
     try:
         # Solo admins pueden ver ubicaciones de todos los conductores
@@ -491,25 +563,19 @@ async def get_all_drivers_locations(
                 detail="Solo administradores pueden ver ubicaciones de conductores"
             )
         
-        # Obtener solo conductores online
-        drivers = db.query(Driver).filter(
-            Driver.is_online == True
-        ).all()
+        # Obtener solo conductores online (desde el almacén en vivo, sin consultar la BD)
+        drivers = live_driver_store.online_drivers()
         
         drivers_locations = []
         for driver in drivers:
-            if driver.current_location:  # Solo si tiene ubicación
+            if driver.has_location:  # Solo si tiene ubicación
                 drivers_locations.append({
-                    "driver_id": driver.id,
-                    "driver_name": driver.user.full_name if driver.user else "Conductor",
-                    "current_location": driver.current_location,
+                    "driver_id": driver.driver_id,
+                    "driver_name": driver.name,
+                    "current_location": driver.location(),
                     "is_delivering": driver.is_delivering,
-                    "last_update": driver.last_location_update,
-                    "vehicle_info": {
-                        "brand": driver.vehicle.brand if driver.vehicle else None,
-                        "model": driver.vehicle.model if driver.vehicle else None,
-                        "plate": driver.vehicle.plate if driver.vehicle else None
-                    } if driver.vehicle else None
+                    "last_update": driver.fix_time,
+                    "vehicle_info": driver.vehicle_info()
                 })
         
         return {
@@ -527,6 +593,79 @@ async def get_all_drivers_locations(
             detail=f"Error interno: {str(e)}"
         )
 
+@tracking_router.get("/drivers/nearby")
+async def get_nearby_drivers(
+    lat: float = Query(..., ge=-90, le=90, description="Latitud del punto de referencia"),
+    lng: float = Query(..., ge=-180, le=180, description="Longitud del punto de referencia"),
+    radius_km: float = Query(3.0, gt=0, le=100, description="Radio de búsqueda en km"),
+    available_only: bool = Query(False, description="Solo conductores disponibles"),
+    limit: int = Query(50, ge=1, le=500, description="Número máximo de resultados"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Conductores online dentro de un radio (solo admins)
+    - Usa el índice espacial en memoria, sin recorrer toda la flota
+    - Ordenados por distancia
+    """
+    try:
+        if not current_user.role or current_user.role.name != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Solo administradores pueden buscar conductores cercanos"
+            )
+        
+        matches = live_driver_store.nearby(lat, lng, radius_km, available_only)
+        
+        return {
+            "center": {"lat": lat, "lng": lng},
+            "radius_km": radius_km,
+            "total": len(matches),
+            "drivers": [_build_nearby_driver(driver, distance) for driver, distance in matches[:limit]]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error interno: {str(e)}"
+        )
+
+@tracking_router.get("/drivers/nearest")
+async def get_nearest_drivers(
+    lat: float = Query(..., ge=-90, le=90, description="Latitud del punto de referencia"),
+    lng: float = Query(..., ge=-180, le=180, description="Longitud del punto de referencia"),
+    count: int = Query(5, ge=1, le=100, description="Número de conductores a retornar"),
+    max_radius_km: float = Query(50.0, gt=0, le=50, description="Radio máximo de búsqueda en km"),
+    available_only: bool = Query(True, description="Solo conductores disponibles"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Los N conductores online más cercanos a un punto (solo admins)
+    """
+    try:
+        if not current_user.role or current_user.role.name != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Solo administradores pueden buscar conductores cercanos"
+            )
+        
+        matches = live_driver_store.nearest(lat, lng, count, max_radius_km, available_only)
+        
+        return {
+            "center": {"lat": lat, "lng": lng},
+            "total": len(matches),
+            "drivers": [_build_nearby_driver(driver, distance) for driver, distance in matches]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error interno: {str(e)}"
+        )
+
 # === FUNCIONALIDAD 3: GESTIÓN DE ENTREGAS ===
 
 @tracking_router.post("/deliveries/assign", response_model=DeliveryTrackingResponse)
@@ -539,6 +678,7 @@ async def assign_delivery(
     Asignar entrega a conductor
     - Solo admins pueden asignar entregas
     - Verificar disponibilidad del conductor
+    - Con auto_assign se elige el conductor más adecuado (distancia, carga y prioridad)
     - Crear tracking de entrega
     """
     try:
@@ -549,7 +689,12 @@ async def assign_delivery(
                 detail="Solo administradores pueden asignar entregas"
             )
         
-        delivery = DeliveryTrackingService.assign_delivery(delivery_data, db)
+        # La geocodificación puede llamar a un servicio externo: fuera del event loop
+        # y antes de que assign_delivery bloquee la orden
+        coordinates = await asyncio.to_thread(
+            DeliveryTrackingService.resolve_delivery_coordinates, delivery_data, db
+        )
+        delivery = DeliveryTrackingService.assign_delivery(delivery_data, db, coordinates)
         
         if not delivery:
             raise HTTPException(
@@ -608,6 +753,52 @@ async def get_driver_deliveries(
             detail=f"Error interno: {str(e)}"
         )
 
+@tracking_router.get("/drivers/deliveries/plan")
+async def get_driver_delivery_plan(
+    driver_id: Optional[int] = Query(None, description="Conductor (solo admins; por defecto el propio)"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Orden de visita sugerido para las entregas activas del conductor
+    - Parte de la posición en vivo del conductor
+    - Vecino más cercano + 2-opt sobre la matriz de distancias
+    - Llegada estimada acumulada de cada parada
+    - Conductores: sus entregas; admins: las de cualquier conductor con driver_id
+    """
+    try:
+        is_admin = current_user.role and current_user.role.name == "admin"
+        if is_admin and driver_id is not None:
+            driver = DriverService.get_driver_by_id(driver_id, db)
+        elif current_user.role and current_user.role.name == "driver":
+            driver = DriverService.get_driver_by_user_id(current_user.id, db)
+            if driver and driver_id is not None and driver_id != driver.id:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="No tiene acceso a las entregas de otro conductor"
+                )
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Se requiere rol 'driver' o driver_id como administrador"
+            )
+        
+        if not driver:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conductor no encontrado"
+            )
+        
+        return route_planner.plan(driver.id, db)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error interno: {str(e)}"
+        )
+
 @tracking_router.put("/deliveries/{delivery_id}/status", response_model=DeliveryTrackingResponse)
 async def update_delivery_status(
     delivery_id: int,
@@ -669,6 +860,58 @@ async def update_delivery_status(
             detail=f"Error interno: {str(e)}"
         )
 
+@tracking_router.get("/deliveries/{delivery_id}/route")
+async def get_delivery_route(
+    delivery_id: int,
+    tolerance_m: Optional[float] = Query(None, ge=0, le=5000, description="Tolerancia de simplificación en metros"),
+    max_points: Optional[int] = Query(None, ge=2, le=50000, description="Número máximo de puntos"),
+    bucket_seconds: Optional[int] = Query(None, ge=1, le=3600, description="Un punto por ventana de N segundos"),
+    format: Optional[str] = Query(None, pattern="^(json|polyline|binary)$", description="Codificación de la respuesta"),
+    accept: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Ruta recorrida durante una entrega (para reproducirla en el mapa)
+    - Admins o el conductor asignado
+    - Misma simplificación y codificación que el historial de ubicaciones
+    """
+    try:
+        delivery = db.query(DeliveryTracking).filter(DeliveryTracking.id == delivery_id).first()
+        if not delivery:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Entrega no encontrada"
+            )
+        
+        is_admin = current_user.role and current_user.role.name == "admin"
+        if not is_admin:
+            driver = DriverService.get_driver_by_user_id(current_user.id, db)
+            if not driver or driver.id != delivery.driver_id:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="No tiene acceso a la ruta de esta entrega"
+                )
+        
+        route = LocationService.get_delivery_route(
+            delivery_id, db,
+            tolerance_m=tolerance_m, max_points=max_points, bucket_seconds=bucket_seconds
+        )
+        
+        return _track_response(route, resolve_track_format(format, accept), "route", {
+            "delivery_id": delivery.id,
+            "driver_id": delivery.driver_id,
+            "status": delivery.status
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error interno: {str(e)}"
+        )
+
 # === FUNCIONALIDAD 4: TRACKING PARA CLIENTES ===
 
 @tracking_router.get("/tracking/{order_number}", response_model=TrackingOrderResponse)
@@ -683,28 +926,27 @@ async def track_order(
     - NO requiere autenticación
     """
     try:
-        # Buscar orden por número (asumiendo que order_number es el ID)
+        # Orden, entrega y conductor desde la caché de resolución (order_number es el ID)
         try:
-            order_id = int(order_number)
+            resolution = order_resolver.resolve(order_number, db)
         except ValueError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Número de orden inválido"
             )
         
-        order = db.query(Order).filter(Order.id == order_id).first()
-        if not order:
+        if not resolution:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Orden no encontrada"
             )
         
-        # Buscar tracking de entrega
         delivery = db.query(DeliveryTracking).filter(
-            DeliveryTracking.order_id == order_id
-        ).first()
+            DeliveryTracking.id == resolution.delivery_id
+        ).first() if resolution.delivery_id else None
         
         if not delivery:
+            order = db.query(Order).filter(Order.id == resolution.order_id).first()
             return TrackingOrderResponse(
                 order_id=order.id,
                 order_number=str(order.id),
@@ -716,35 +958,37 @@ async def track_order(
                 last_update=order.updated_at
             )
         
-        # Obtener información del conductor
+        # Información del conductor desde el almacén en vivo
         driver_info = None
-        if delivery.driver:
+        driver = live_driver_store.get(resolution.driver_id, db)
+        if driver:
             driver_info = {
-                "driver_id": delivery.driver.id,
-                "driver_name": delivery.driver.user.full_name if delivery.driver.user else "Conductor",
-                "driver_phone": delivery.driver.phone,
-                "is_online": delivery.driver.is_online,
-                "is_delivering": delivery.driver.is_delivering,
-                "current_location": delivery.driver.current_location,
-                "last_update": delivery.driver.last_location_update,
-                "vehicle_info": {
-                    "brand": delivery.driver.vehicle.brand if delivery.driver.vehicle else None,
-                    "model": delivery.driver.vehicle.model if delivery.driver.vehicle else None,
-                    "plate": delivery.driver.vehicle.plate if delivery.driver.vehicle else None
-                } if delivery.driver.vehicle else None,
+                "driver_id": driver.driver_id,
+                "driver_name": driver.name,
+                "driver_phone": driver.phone,
+                "is_online": driver.is_online,
+                "is_delivering": driver.is_delivering,
+                "current_location": driver.location(),
+                "last_update": driver.fix_time,
+                "vehicle_info": driver.vehicle_info(),
                 "estimated_arrival": delivery.estimated_arrival,
                 "status_message": f"Estado: {delivery.status}"
             }
         
+        delivery_address = delivery.delivery_address
+        if not delivery_address:
+            order = db.query(Order).filter(Order.id == resolution.order_id).first()
+            delivery_address = order.shipping_address or {}
+        
         return TrackingOrderResponse(
-            order_id=order.id,
-            order_number=str(order.id),
+            order_id=resolution.order_id,
+            order_number=str(resolution.order_id),
             status=delivery.status,
             driver=driver_info,
-            delivery_address=delivery.delivery_address or order.shipping_address or {},
+            delivery_address=delivery_address,
             estimated_arrival=delivery.estimated_arrival,
             tracking_enabled=True,
-            last_update=delivery.last_location_update or delivery.updated_at
+            last_update=delivery.last_location_update or delivery.assigned_at
         )
         
     except HTTPException:
@@ -782,16 +1026,13 @@ async def get_all_drivers(
         
         drivers, total = DriverService.get_all_drivers(db, skip, limit, online_only, available_only)
         
-        # Construir respuestas
-        driver_responses = []
+        # Construir respuestas (estadísticas de toda la página en una consulta)
+        driver_responses = await _build_driver_responses(drivers, db)
         online_count = 0
         available_count = 0
         delivering_count = 0
         
         for driver in drivers:
-            response = await _build_driver_response(driver, db)
-            driver_responses.append(response)
-            
             if driver.is_online:
                 online_count += 1
             if driver.is_available:
@@ -815,6 +1056,44 @@ async def get_all_drivers(
             detail=f"Error interno: {str(e)}"
         )
 
+@tracking_router.get("/admin/locations/export")
+async def export_fleet_locations(
+    start: datetime = Query(..., description="Inicio del rango (UTC)"),
+    end: Optional[datetime] = Query(None, description="Fin del rango (UTC, exclusivo)"),
+    driver_id: Optional[int] = Query(None, description="Filtrar por conductor"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Formato de exportación"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Exportar el historial de ubicaciones de toda la flota (solo admins)
+    - Rango de fechas arbitrario, emitido en streaming (NDJSON o CSV)
+    """
+    try:
+        if not current_user.role or current_user.role.name != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Solo administradores pueden exportar el historial de la flota"
+            )
+        
+        if end is not None and end <= start:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El fin del rango debe ser posterior al inicio"
+            )
+        
+        return _export_response(
+            LocationExportService.stream(format, start, end, driver_id),
+            format, LocationExportService.filename("fleet_locations", format, start)
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error interno: {str(e)}"
+        )
+
 @tracking_router.get("/admin/dashboard", response_model=AdminDashboardResponse)
 async def get_admin_dashboard(
     current_user: User = Depends(get_current_user),
@@ -824,6 +1103,7 @@ async def get_admin_dashboard(
     Dashboard de administración
     - Estadísticas generales
     - Conductores y entregas activas
+    - Se sirve desde caché; los cambios de estado la invalidan
     """
     try:
         # Solo admins pueden ver el dashboard
@@ -833,45 +1113,28 @@ async def get_admin_dashboard(
                 detail="Solo administradores pueden ver el dashboard"
             )
         
-        # Estadísticas generales
-        total_drivers = db.query(Driver).count()
-        online_drivers = db.query(Driver).filter(Driver.is_online == True).count()
-        available_drivers = db.query(Driver).filter(Driver.is_available == True).count()
-        delivering_drivers = db.query(Driver).filter(Driver.is_delivering == True).count()
-        
-        total_deliveries = db.query(DeliveryTracking).count()
-        active_deliveries = db.query(DeliveryTracking).filter(
-            DeliveryTracking.status.in_(["assigned", "started", "in_progress"])
-        ).count()
+        cached = dashboard_cache.get()
+        if cached is not None:
+            return cached
+        version = dashboard_cache.version()
         
-        # Entregas completadas hoy
-        today = datetime.utcnow().date()
-        completed_deliveries_today = db.query(DeliveryTracking).filter(
-            and_(
-                DeliveryTracking.status == "completed",
-                func.date(DeliveryTracking.completed_at) == today
-            )
-        ).count()
+        # Estadísticas generales (una sola consulta)
+        counters = DashboardService.get_counters(db)
         
-        # Conductores recientes (últimos 10)
-        recent_drivers = db.query(Driver).order_by(desc(Driver.created_at)).limit(10).all()
-        driver_responses = [await _build_driver_response(driver, db) for driver in recent_drivers]
+        # Conductores y entregas recientes (últimos 10, con relaciones precargadas)
+        recent_drivers = DashboardService.get_recent_drivers(db)
+        driver_responses = await _build_driver_responses(recent_drivers, db)
         
-        # Entregas recientes (últimas 10)
-        recent_deliveries = db.query(DeliveryTracking).order_by(desc(DeliveryTracking.assigned_at)).limit(10).all()
+        recent_deliveries = DashboardService.get_recent_deliveries(db)
         delivery_responses = [await _build_delivery_response(delivery, db) for delivery in recent_deliveries]
         
-        return AdminDashboardResponse(
-            total_drivers=total_drivers,
-            online_drivers=online_drivers,
-            available_drivers=available_drivers,
-            delivering_drivers=delivering_drivers,
-            total_deliveries=total_deliveries,
-            active_deliveries=active_deliveries,
-            completed_deliveries_today=completed_deliveries_today,
+        dashboard = AdminDashboardResponse(
+            **counters,
             drivers=driver_responses,
             recent_deliveries=delivery_responses
         )
+        dashboard_cache.set(dashboard, version)
+        return dashboard
         
     except HTTPException:
         raise
@@ -883,7 +1146,13 @@ async def get_admin_dashboard(
 
 # === FUNCIONES AUXILIARES ===
 
-async def _build_driver_response(driver: Driver, db: Session) -> DriverResponse:
+async def _build_driver_responses(drivers: List[Driver], db: Session) -> List[DriverResponse]:
+    """Construir respuestas de varios conductores con una sola consulta de estadísticas"""
+    stats = DriverService.get_drivers_stats([driver.id for driver in drivers], db)
+    return [await _build_driver_response(driver, db, stats[driver.id]) for driver in drivers]
+
+async def _build_driver_response(driver: Driver, db: Session,
+                                 stats: Optional[dict] = None) -> DriverResponse:
     """Construir respuesta completa del conductor"""
     # Obtener información del usuario
     user_info = {
@@ -906,7 +1175,8 @@ async def _build_driver_response(driver: Driver, db: Session) -> DriverResponse:
         }
     
     # Obtener estadísticas
-    stats = DriverService.get_driver_stats(driver.id, db)
+    if stats is None:
+        stats = DriverService.get_driver_stats(driver.id, db)
     
     return DriverResponse(
         id=driver.id,
@@ -931,6 +1201,39 @@ async def _build_driver_response(driver: Driver, db: Session) -> DriverResponse:
         success_rate=stats.get("success_rate", 0.0)
     )
 
+def _export_response(chunks, export_format: str, filename: str) -> StreamingResponse:
+    """Respuesta en streaming para una exportación de ubicaciones"""
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _track_response(points: list, track_format: str, json_key: str, meta: dict):
+    """Serializar una trayectoria en el formato pedido (json, polyline o binary)"""
+    if track_format == "binary":
+        return Response(
+            content=encode_track_binary(points),
+            media_type=BINARY_MEDIA_TYPE,
+            headers={"X-Track-Points": str(len(points))}
+        )
+    if track_format == "polyline":
+        return {**meta, "total_points": len(points), "track": encode_track_polyline(points)}
+    return {**meta, "total_points": len(points), json_key: points}
+
+def _build_nearby_driver(driver, distance_km: float) -> dict:
+    """Construir respuesta de conductor cercano desde el almacén en vivo"""
+    return {
+        "driver_id": driver.driver_id,
+        "driver_name": driver.name,
+        "distance_km": round(distance_km, 3),
+        "is_available": driver.is_available,
+        "is_delivering": driver.is_delivering,
+        "current_location": driver.location(),
+        "last_update": driver.fix_time,
+        "vehicle_info": driver.vehicle_info()
+    }
+
 async def _build_delivery_response(delivery: DeliveryTracking, db: Session) -> DeliveryTrackingResponse:
     """Construir respuesta completa de entrega"""
     # Obtener información del conductor
@@ -984,281 +1287,231 @@ async def _build_delivery_response(delivery: DeliveryTracking, db: Session) -> D
 
 # ===== WEBSOCKET PARA TRACKING EN TIEMPO REAL =====
 
-# Diccionario para almacenar conexiones WebSocket activas
-active_connections: dict = {}
-
 @tracking_router.websocket("/ws/tracking/{order_number}")
-async def websocket_tracking(websocket: WebSocket, order_number: str):
+async def websocket_tracking(
+    websocket: WebSocket,
+    order_number: str,
+    v: int = Query(1, ge=1, le=2),
+    since: Optional[int] = Query(None, ge=0),
+    stream: Optional[str] = Query(None)
+):
     """
     WebSocket para tracking en tiempo real de órdenes
     - Cliente se conecta con número de orden
-    - Recibe ubicación del conductor cada 5 segundos
-    - Desconexión automática cuando conductor llega
+    - Recibe la ubicación del conductor cada vez que cambia (sin polling a la BD)
+    - Desconexión automática cuando la entrega se completa
+    - v=1: payload completo en cada cambio
+    - v=2: snapshot inicial y luego solo los campos modificados con número de
+      secuencia; reconectar con ?v=2&stream=<id>&since=<seq> reenvía solo lo perdido
+    - Conexiones limitadas por orden y por worker; los clientes que no consumen
+      sus mensajes a tiempo se desconectan (código 1013)
     """
     await websocket.accept()
     
-    # Agregar conexión a la lista activa
-    if order_number not in active_connections:
-        active_connections[order_number] = []
-    active_connections[order_number].append(websocket)
+    connection = connection_manager.connect(websocket, order_number)
+    if connection is None:
+        try:
+            await websocket.send_json({
+                "error": "Demasiadas conexiones, intente más tarde",
+                "order_number": order_number
+            })
+            await websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+        except Exception as send_error:
+            print(f"Error sending connection limit message: {send_error}")
+        return
     
+    # Resolver orden, entrega y conductor una sola vez al conectar (desde caché si la entrega está activa)
+    resolved = False
+    db = next(get_db())
     try:
-        while True:
-            # Buscar información de la orden y conductor
-            db = next(get_db())
-            try:
-                # Buscar orden por número
-                order = db.query(Order).filter(
-                    Order.woocommerce_order_id == order_number
-                ).first()
-                
-                if not order:
-                    await websocket.send_json({
-                        "error": "Orden no encontrada",
-                        "order_number": order_number
-                    })
-                    break
-                
-                # Buscar tracking de entrega
-                delivery = db.query(DeliveryTracking).filter(
-                    DeliveryTracking.order_id == order.id
-                ).first()
-                
-                if not delivery:
-                    await websocket.send_json({
-                        "error": "Entrega no asignada",
-                        "order_number": order_number
-                    })
-                    break
-                
-                # Buscar conductor
-                driver = db.query(Driver).filter(
-                    Driver.id == delivery.driver_id
-                ).first()
-                
-                if not driver:
-                    await websocket.send_json({
-                        "error": "Conductor no encontrado",
-                        "order_number": order_number
-                    })
-                    break
-                
-                # Preparar datos de ubicación
-                location_data = {
-                    "order_number": order_number,
-                    "driver_id": driver.id,
-                    "driver_name": driver.user.full_name if driver.user else "Conductor",
-                    "driver_phone": driver.phone,
-                    "is_online": driver.is_online,
-                    "is_delivering": driver.is_delivering,
-                    "current_location": driver.current_location,
-                    "last_update": driver.last_location_update.isoformat() if driver.last_location_update else None,
-                    "delivery_status": delivery.status,
-                    "estimated_arrival": delivery.estimated_arrival.isoformat() if delivery.estimated_arrival else None,
-                    "distance_remaining": delivery.distance_remaining,
-                    "vehicle_info": {
-                        "brand": driver.vehicle.brand,
-                        "model": driver.vehicle.model,
-                        "plate": driver.vehicle.plate
-                    } if driver.vehicle else None,
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-                
-                # Enviar datos al cliente
-                try:
-                    await websocket.send_json(location_data)
-                except Exception as send_error:
-                    print(f"Error sending location data: {send_error}")
-                    break
-                
-                # Verificar si la entrega está completada
-                if delivery.status == "completed":
-                    try:
-                        await websocket.send_json({
-                            "message": "Entrega completada",
-                            "status": "completed",
-                            "timestamp": datetime.utcnow().isoformat()
-                        })
-                    except Exception as send_error:
-                        print(f"Error sending completion message: {send_error}")
-                    break
-                
-            except Exception as e:
-                try:
-                    await websocket.send_json({
-                        "error": f"Error interno: {str(e)}",
-                        "timestamp": datetime.utcnow().isoformat()
-                    })
-                except Exception as send_error:
-                    print(f"Error sending error message: {send_error}")
-                    break
-            finally:
-                db.close()
+        try:
+            resolution = order_resolver.resolve(order_number, db, woocommerce=True)
+        except ValueError:
+            resolution = None
+        
+        if not resolution:
+            await websocket.send_json({
+                "error": "Orden no encontrada",
+                "order_number": order_number
+            })
+            await websocket.close()
+            return
+        
+        if not resolution.delivery_id:
+            await websocket.send_json({
+                "error": "Entrega no asignada",
+                "order_number": order_number
+            })
+            await websocket.close()
+            return
+        
+        # Con el flujo de la orden ya abierto en este worker no se consulta la BD
+        order_stream = order_streams.get(resolution.delivery_id)
+        if order_stream is None or order_stream.driver_id != resolution.driver_id:
+            delivery = db.query(DeliveryTracking).filter(
+                DeliveryTracking.id == resolution.delivery_id
+            ).first()
+            driver = live_driver_store.get(resolution.driver_id, db)
             
-            # Esperar 5 segundos antes de la siguiente actualización
-            await asyncio.sleep(5)
+            if not driver:
+                await websocket.send_json({
+                    "error": "Conductor no encontrado",
+                    "order_number": order_number
+                })
+                await websocket.close()
+                return
             
-    except WebSocketDisconnect:
-        pass
+            order_stream = order_streams.open(order_number, delivery.id, driver.driver_id, {
+                "order_number": order_number,
+                "driver_id": driver.driver_id,
+                "driver_name": driver.name,
+                "driver_phone": driver.phone,
+                "is_online": driver.is_online,
+                "is_delivering": driver.is_delivering,
+                "current_location": driver.location(),
+                "last_update": driver.fix_time.isoformat() if driver.fix_time else None,
+                "delivery_status": delivery.status,
+                "estimated_arrival": delivery.estimated_arrival.isoformat() if delivery.estimated_arrival else None,
+                "distance_remaining": delivery.distance_remaining,
+                "vehicle_info": driver.vehicle_info(),
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        resolved = True
+    except Exception as e:
+        try:
+            await websocket.send_json({
+                "error": f"Error interno: {str(e)}",
+                "timestamp": datetime.utcnow().isoformat()
+            })
+            await websocket.close()
+        except Exception as send_error:
+            print(f"Error sending error message: {send_error}")
+        return
     finally:
-        # Remover conexión de la lista activa
-        if order_number in active_connections:
-            active_connections[order_number].remove(websocket)
-            if not active_connections[order_number]:
-                del active_connections[order_number]
-
-@tracking_router.websocket("/ws/driver/{driver_id}")
-async def websocket_driver_location(websocket: WebSocket, driver_id: int):
-    """
-    WebSocket para que el conductor envíe su ubicación en tiempo real
-    - Conductor se conecta con su ID
-    - Envía ubicación cada 30 segundos
-    - Backend actualiza base de datos y notifica a clientes
-    """
-    await websocket.accept()
+        db.close()
+        if not resolved:
+            connection_manager.disconnect(connection)
+    
+    queue = order_stream.subscribe(on_overflow=connection.record_overflow)
+    connection.queue = queue
     
     try:
-        while True:
-            # Recibir datos de ubicación del conductor
-            data = await websocket.receive_json()
+        # Estado inicial: snapshot completo o, en v2, solo los cambios perdidos
+        sent_seq = order_stream.seq
+        try:
+            if v >= 2:
+                missed = order_stream.replay_since(stream, since) if since is not None else None
+                if missed is None:
+                    await connection.send_text(order_stream.snapshot_message())
+                else:
+                    await connection.send_text(order_stream.resume_message())
+                    for message in missed:
+                        await connection.send_text(message)
+            else:
+                await connection.send_json(order_stream.state)
+        except Exception as send_error:
+            print(f"Error sending location data: {send_error}")
+            return
+        
+        while not order_stream.completed:
+            # Esperar al siguiente cambio de la orden, la desconexión o la expulsión del cliente
+            item = await connection.next_item()
+            if item is None:
+                break
             
-            # Validar datos recibidos
-            if not all(key in data for key in ["latitude", "longitude"]):
-                try:
-                    await websocket.send_json({
-                        "error": "Datos de ubicación incompletos",
-                        "required": ["latitude", "longitude"]
-                    })
-                except Exception as send_error:
-                    print(f"Error sending validation error: {send_error}")
-                    break
+            kind, seq, message = item
+            if seq <= sent_seq:
+                # Ya incluido en el snapshot inicial
                 continue
             
-            # Actualizar ubicación en base de datos
-            db = next(get_db())
+            # Enviar datos al cliente
             try:
-                # Buscar conductor
-                driver = db.query(Driver).filter(Driver.id == driver_id).first()
-                if not driver:
-                    try:
-                        await websocket.send_json({
-                            "error": "Conductor no encontrado"
-                        })
-                    except Exception as send_error:
-                        print(f"Error sending driver not found: {send_error}")
-                        break
-                    continue
-                
-                # Actualizar ubicación del conductor
-                driver.current_location = {
-                    "lat": data["latitude"],
-                    "lng": data["longitude"],
-                    "accuracy": data.get("accuracy", 0),
-                    "speed": data.get("speed", 0),
-                    "heading": data.get("heading", 0)
-                }
-                driver.last_location_update = datetime.utcnow()
-                
-                # Crear registro de ubicación
-                location_update = LocationUpdate(
-                    driver_id=driver_id,
-                    latitude=data["latitude"],
-                    longitude=data["longitude"],
-                    accuracy=data.get("accuracy"),
-                    speed=data.get("speed"),
-                    heading=data.get("heading")
-                )
-                db.add(location_update)
-                
-                # Actualizar distancia restante si hay entrega activa
-                active_delivery = db.query(DeliveryTracking).filter(
-                    DeliveryTracking.driver_id == driver_id,
-                    DeliveryTracking.status.in_(["assigned", "started", "in_progress"])
-                ).first()
-                
-                if active_delivery and active_delivery.delivery_coordinates:
-                    # Calcular distancia restante
-                    from features.tracking.services import LocationService
-                    distance = LocationService._calculate_distance(
-                        data["latitude"], data["longitude"],
-                        active_delivery.delivery_coordinates["lat"],
-                        active_delivery.delivery_coordinates["lng"]
+                if v >= 2:
+                    await connection.send_text(
+                        order_stream.snapshot_message() if kind == "resync" else message
                     )
-                    active_delivery.distance_remaining = distance
-                    active_delivery.last_location_update = datetime.utcnow()
-                
-                db.commit()
-                
-                # Notificar a clientes conectados
-                await notify_clients_about_location_update(driver_id, driver.current_location)
-                
-                # Confirmar recepción al conductor
-                try:
-                    await websocket.send_json({
-                        "success": True,
-                        "message": "Ubicación actualizada",
-                        "timestamp": datetime.utcnow().isoformat(),
-                        "location": driver.current_location
-                    })
-                except Exception as send_error:
-                    print(f"Error sending location confirmation: {send_error}")
-                    break
-                
-            except Exception as e:
-                db.rollback()
-                try:
-                    await websocket.send_json({
-                        "error": f"Error actualizando ubicación: {str(e)}"
-                    })
-                except Exception as send_error:
-                    print(f"Error sending database error: {send_error}")
-                    break
-            finally:
-                db.close()
-            
-            # Esperar 30 segundos antes de la siguiente actualización
-            await asyncio.sleep(30)
+                    sent_seq = order_stream.seq if kind == "resync" else seq
+                else:
+                    # v1: un único payload completo con el estado más reciente
+                    while not queue.empty():
+                        queue.get_nowait()
+                    await connection.send_json(order_stream.state)
+                    sent_seq = order_stream.seq
+            except Exception as send_error:
+                print(f"Error sending location data: {send_error}")
+                break
+        
+        # Verificar si la entrega está completada
+        if order_stream.completed:
+            try:
+                await connection.send_json({
+                    "type": "completed",
+                    "seq": order_stream.seq,
+                    "message": "Entrega completada",
+                    "status": "completed",
+                    "timestamp": datetime.utcnow().isoformat()
+                })
+            except Exception as send_error:
+                print(f"Error sending completion message: {send_error}")
             
     except WebSocketDisconnect:
         pass
+    finally:
+        order_stream.unsubscribe(queue)
+        connection_manager.disconnect(connection)
+        if connection.evicted.is_set():
+            await connection.close()
 
-async def notify_clients_about_location_update(driver_id: int, location_data: dict):
+@tracking_router.websocket("/ws/driver/{driver_id}")
+async def websocket_driver_location(websocket: WebSocket, driver_id: int):
     """
-    Notificar a todos los clientes conectados sobre actualización de ubicación
+    WebSocket para que el conductor envíe su ubicación en tiempo real
+    - Conductor se conecta con su ID y recibe su intervalo en un mensaje "config"
+    - Los pings que llegan antes del intervalo se agrupan (solo se guarda el último)
+    - Un cambio de location_update_interval se envía al conductor como nuevo "config"
     """
-    # Buscar órdenes activas de este conductor
-    db = next(get_db())
-    try:
-        active_deliveries = db.query(DeliveryTracking).filter(
-            DeliveryTracking.driver_id == driver_id,
-            DeliveryTracking.status.in_(["assigned", "started", "in_progress"])
-        ).all()
-        
-        for delivery in active_deliveries:
-            order_number = delivery.order.woocommerce_order_id if delivery.order else None
-            if order_number and order_number in active_connections:
-                # Enviar actualización a todos los clientes conectados a esta orden
-                for websocket in active_connections[order_number]:
-                    try:
-                        await websocket.send_json({
-                            "type": "location_update",
-                            "driver_id": driver_id,
-                            "location": location_data,
-                            "timestamp": datetime.utcnow().isoformat()
-                        })
-                    except:
-                        # Remover conexión si falla
-                        active_connections[order_number].remove(websocket)
-    finally:
-        db.close()
+    await websocket.accept()
+    await driver_channels.serve(websocket, driver_id)
+
+@tracking_router.websocket("/ws/admin/map")
+async def websocket_admin_map(websocket: WebSocket, token: str = Query(...)):
+    """
+    WebSocket del mapa de administración
+    - Autenticación con ?token=<access token> de un administrador
+    - El cliente envía {"type": "subscribe", "bbox": [sur, oeste, norte, este], "zoom": z}
+      al conectar y cada vez que mueve el mapa
+    - Recibe solo los conductores dentro del rectángulo (clusters con zoom bajo)
+      y luego únicamente los cambios, una vez por intervalo
+    """
+    await websocket.accept()
+    await live_map_hub.serve(websocket, token)
+
+def _local_connection_stats() -> dict:
+    """Conexiones WebSocket de este worker (se reportan al resto vía broker)"""
+    clients = connection_manager.stats()
+    return {
+        "orders_tracking": connection_manager.orders(),
+        "total_clients": clients["connections"],
+        "clients": clients,
+        "order_streams": order_streams.stats(),
+        "drivers": driver_channels.stats(),
+        "ingest": location_ingest.stats(),
+        "gps_filter": gps_filter.stats(),
+        "geocoding": address_geocoder.stats(),
+        "dashboard_cache": dashboard_cache.stats(),
+        "geofences": geofence_monitor.stats(),
+        "order_resolution": order_resolver.stats(),
+        "route_plans": route_planner.stats(),
+        "live_map": live_map_hub.stats(),
+        "sampling": sampling_controller.stats()
+    }
+
+tracking_bus.set_stats_provider(_local_connection_stats)
 
 @tracking_router.get("/ws/status")
 async def get_websocket_status():
     """
     Obtener estado de las conexiones WebSocket activas
+    - Agrega las conexiones de todos los workers
     """
-    return {
-        "active_connections": len(active_connections),
-        "orders_tracking": list(active_connections.keys()),
-        "total_clients": sum(len(clients) for clients in active_connections.values())
-    }
+    return tracking_bus.cluster_status()
@@ -0,0 +1,164 @@
+"""
+Intervalo de reporte de ubicación adaptativo
+
+El intervalo de cada conductor se elige según su estado y su velocidad en
+lugar del location_update_interval fijo:
+
+- offline             no se esperan pings (OFFLINE_INTERVAL)
+- idle                disponible, sin entrega: intervalo largo
+- en_route            con entrega: un ping cada ~N metros según la velocidad
+- near_destination    dentro del radio de aproximación: intervalo mínimo
+
+Se evalúa en cada ping (en el worker que lo recibe) y en cada cambio de
+estado del conductor. Solo cuando el intervalo cambia de forma apreciable
+se publica en el canal tracking_driver como "sampling_interval"; el canal
+WebSocket del conductor lo envía como mensaje "config".
+"""
+from typing import Any, Dict, Optional
+import logging
+import threading
+
+from core.config import settings
+from features.tracking.events import tracking_bus
+from features.tracking.eta import eta_engine
+from features.tracking.geofence import geofence_monitor
+from features.tracking.live_store import live_driver_store, LiveDriverRecord
+
+logger = logging.getLogger(__name__)
+
+OFFLINE_INTERVAL = 300
+# Cambio relativo mínimo del intervalo para notificarlo al conductor
+CHANGE_THRESHOLD = 0.25
+SAMPLING_STATES = ("offline", "idle", "en_route", "near_destination")
+
+
+class DriverSample:
+    """Última posición y velocidad evaluadas de un conductor"""
+
+    __slots__ = ("lat", "lng", "speed_kmh")
+
+    def __init__(self, lat: float, lng: float, speed_kmh: Optional[float]):
+        self.lat = lat
+        self.lng = lng
+        self.speed_kmh = speed_kmh
+
+
+class SamplingController:
+    """Calcula y difunde el intervalo de reporte de cada conductor"""
+
+    def __init__(self, enabled: bool = True, idle_interval: int = 60, en_route_max_interval: int = 30,
+                 min_interval: int = 5, target_distance_m: float = 150, near_radius_m: float = 500):
+        self.enabled = enabled
+        self.idle_interval = idle_interval
+        self.en_route_max_interval = en_route_max_interval
+        self.min_interval = min_interval
+        self.target_distance_m = target_distance_m
+        self.near_radius_m = near_radius_m
+
+        self._samples: Dict[int, DriverSample] = {}
+        self._lock = threading.Lock()
+
+        # Contadores
+        self.evaluations = 0
+        self.changes = 0
+
+    def observe(self, driver_id: int, lat: float, lng: float, speed: Optional[float] = None):
+        """Evaluar el intervalo con un ping nuevo (velocidad en km/h)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._samples[driver_id] = DriverSample(lat, lng, speed)
+        self._evaluate(driver_id)
+
+    def refresh(self, driver_id: int) -> Optional[int]:
+        """Reevaluar tras un cambio de estado del conductor; retorna el intervalo vigente"""
+        if not self.enabled:
+            return None
+        self._evaluate(driver_id)
+        return self.current_interval(driver_id)
+
+    def current_interval(self, driver_id: int) -> Optional[int]:
+        """Intervalo adaptativo vigente (de cualquier worker), o None si no hay"""
+        if not self.enabled:
+            return None
+        record = live_driver_store.get(driver_id)
+        return record.sampling_interval if record is not None else None
+
+    def interval_for(self, state: str, speed_kmh: Optional[float] = None) -> int:
+        """Intervalo en segundos para un estado y una velocidad"""
+        if state == "offline":
+            return OFFLINE_INTERVAL
+        if state == "idle":
+            return self.idle_interval
+        if state == "near_destination":
+            return self.min_interval
+        if not speed_kmh or speed_kmh <= 0:
+            return self.en_route_max_interval
+        # Segundos para recorrer la distancia objetivo a la velocidad actual
+        interval = self.target_distance_m / (speed_kmh / 3.6)
+        return int(round(min(max(interval, self.min_interval), self.en_route_max_interval)))
+
+    def stats(self) -> Dict[str, Any]:
+        states = {state: 0 for state in SAMPLING_STATES}
+        with self._lock:
+            driver_ids = list(self._samples)
+        for driver_id in driver_ids:
+            record = live_driver_store.get(driver_id)
+            if record is not None and record.sampling_state in states:
+                states[record.sampling_state] += 1
+        return {
+            "enabled": self.enabled,
+            "drivers": len(driver_ids),
+            "states": states,
+            "evaluations": self.evaluations,
+            "changes": self.changes
+        }
+
+    def _evaluate(self, driver_id: int):
+        record = live_driver_store.get(driver_id)
+        if record is None:
+            return
+        with self._lock:
+            sample = self._samples.get(driver_id)
+        self.evaluations += 1
+
+        state = self._classify(driver_id, record, sample)
+        speed_kmh = sample.speed_kmh if sample is not None and sample.speed_kmh is not None else None
+        if speed_kmh is None and state == "en_route":
+            speed_kmh = eta_engine.driver_speed(driver_id)
+        interval = self.interval_for(state, speed_kmh)
+
+        current = record.sampling_interval
+        if state == record.sampling_state and current and abs(interval - current) / current < CHANGE_THRESHOLD:
+            return
+
+        self.changes += 1
+        # Llega a todos los workers: almacén en vivo y canal WebSocket del conductor
+        tracking_bus.publish_driver_state(driver_id, {
+            "sampling_interval": interval,
+            "sampling_state": state
+        })
+
+    def _classify(self, driver_id: int, record: LiveDriverRecord, sample: Optional[DriverSample]) -> str:
+        if not record.is_online:
+            return "offline"
+        if not record.is_delivering:
+            return "idle"
+        lat = sample.lat if sample is not None else record.lat
+        lng = sample.lng if sample is not None else record.lng
+        if lat is not None and lng is not None:
+            distance = geofence_monitor.distance_to_destination(driver_id, lat, lng)
+            if distance is not None and distance <= self.near_radius_m:
+                return "near_destination"
+        return "en_route"
+
+
+# Instancia global del control de muestreo
+sampling_controller = SamplingController(
+    enabled=settings.ADAPTIVE_SAMPLING_ENABLED,
+    idle_interval=settings.SAMPLING_IDLE_INTERVAL,
+    en_route_max_interval=settings.SAMPLING_EN_ROUTE_MAX_INTERVAL,
+    min_interval=settings.SAMPLING_MIN_INTERVAL,
+    target_distance_m=settings.SAMPLING_TARGET_DISTANCE_M,
+    near_radius_m=settings.GEOFENCE_ARRIVING_RADIUS_M
+)
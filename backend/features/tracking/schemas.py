@@ -107,6 +107,7 @@ class LocationUpdateResponse(BaseModel):
     location: LocationData
     distance_from_destination: Optional[float] = None
     estimated_arrival: Optional[datetime] = None
+    location_update_interval: Optional[int] = None
 
 class DriverStatusUpdateRequest(BaseModel):
     """Solicitud de actualización de estado"""
@@ -123,11 +124,14 @@ class DriverStatusResponse(BaseModel):
     current_location: Optional[LocationData]
     last_update: datetime
     status_message: str
+    location_update_interval: Optional[int] = None
 
 class DeliveryTrackingCreate(BaseModel):
     """Solicitud para crear tracking de entrega"""
     order_id: int = Field(..., description="ID de la orden")
-    driver_id: int = Field(..., description="ID del conductor")
+    driver_id: Optional[int] = Field(None, description="ID del conductor (omitir con auto_assign)")
+    auto_assign: bool = Field(False, description="Seleccionar automáticamente el mejor conductor disponible")
+    delivery_coordinates: Optional[LocationData] = Field(None, description="Coordenadas del destino")
     priority: DeliveryPriority = Field(DeliveryPriority.NORMAL, description="Prioridad de la entrega")
     delivery_notes: Optional[str] = Field(None, description="Notas de entrega")
     estimated_duration: Optional[int] = Field(None, ge=1, description="Duración estimada en minutos")
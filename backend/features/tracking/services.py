@@ -1,17 +1,27 @@
 """
 Servicios para el sistema de tracking
 """
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import and_, or_, desc, func
 from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime, timedelta
 import logging
-import math
 
 from features.tracking.models import Driver, DeliveryTracking, LocationUpdate, DriverSession
 from features.users.models import User
 from features.vehicles.models import Vehicle
 from features.ecommerce.models import Order
+from features.tracking.dispatch import dispatch_engine
+from features.tracking.driver_stats import DriverStatsService
+from features.tracking.eta import eta_engine
+from features.tracking.geocoding import address_geocoder, SOURCE_EXPLICIT
+from features.tracking.geofence import geofence_monitor
+from features.tracking.events import tracking_bus
+from features.tracking.geo import haversine_km
+from features.tracking.ingest import location_ingest
+from features.tracking.live_store import live_driver_store
+from features.tracking.sampling import sampling_controller
+from features.tracking.simplify import downsample_by_time, simplify_track
 from features.tracking.schemas import (
     DriverActivateRequest, DriverUpdateRequest, LocationUpdateRequest,
     DeliveryTrackingCreate, DeliveryStatusUpdate
@@ -53,6 +63,7 @@ class DriverService:
             db.add(driver)
             db.commit()
             db.refresh(driver)
+            live_driver_store.publish_driver(driver)
             
             logger.info(f"Conductor activado: User ID {user_id}, Driver ID {driver.id}")
             return driver
@@ -97,6 +108,7 @@ class DriverService:
             driver.updated_at = datetime.utcnow()
             db.commit()
             db.refresh(driver)
+            live_driver_store.publish_driver(driver)
             
             return driver
             
@@ -122,6 +134,8 @@ class DriverService:
             driver.updated_at = datetime.utcnow()
             db.commit()
             db.refresh(driver)
+            live_driver_store.publish_driver(driver)
+            sampling_controller.refresh(driver.id)
             
             return driver
             
@@ -133,7 +147,7 @@ class DriverService:
     @staticmethod
     def get_all_drivers(db: Session, skip: int = 0, limit: int = 100, 
                        online_only: bool = False, available_only: bool = False) -> Tuple[List[Driver], int]:
-        """Obtener todos los conductores con filtros"""
+        """Obtener todos los conductores con filtros (usuario y vehículo precargados)"""
         query = db.query(Driver)
         
         if online_only:
@@ -142,49 +156,25 @@ class DriverService:
             query = query.filter(Driver.is_available == True)
         
         total = query.count()
-        drivers = query.offset(skip).limit(limit).all()
+        drivers = query.options(
+            selectinload(Driver.user),
+            selectinload(Driver.vehicle)
+        ).order_by(Driver.id).offset(skip).limit(limit).all()
         
         return drivers, total
     
     @staticmethod
     def get_driver_stats(driver_id: int, db: Session) -> Dict[str, Any]:
         """Obtener estadísticas del conductor"""
-        try:
-            driver = db.query(Driver).filter(Driver.id == driver_id).first()
-            if not driver:
-                return {}
-            
-            # Estadísticas de entregas
-            total_deliveries = db.query(DeliveryTracking).filter(DeliveryTracking.driver_id == driver_id).count()
-            completed_deliveries = db.query(DeliveryTracking).filter(
-                and_(DeliveryTracking.driver_id == driver_id, DeliveryTracking.status == "completed")
-            ).count()
-            failed_deliveries = db.query(DeliveryTracking).filter(
-                and_(DeliveryTracking.driver_id == driver_id, DeliveryTracking.status == "failed")
-            ).count()
-            
-            success_rate = (completed_deliveries / total_deliveries * 100) if total_deliveries > 0 else 0
-            
-            # Entregas de los últimos 30 días
-            thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-            recent_deliveries = db.query(DeliveryTracking).filter(
-                and_(
-                    DeliveryTracking.driver_id == driver_id,
-                    DeliveryTracking.assigned_at >= thirty_days_ago
-                )
-            ).count()
-            
-            return {
-                "total_deliveries": total_deliveries,
-                "completed_deliveries": completed_deliveries,
-                "failed_deliveries": failed_deliveries,
-                "success_rate": round(success_rate, 2),
-                "recent_deliveries_30_days": recent_deliveries
-            }
-            
-        except Exception as e:
-            logger.error(f"Error obteniendo estadísticas del conductor: {str(e)}")
-            return {}
+        return DriverService.get_drivers_stats([driver_id], db).get(driver_id, {})
+    
+    @staticmethod
+    def get_drivers_stats(driver_ids: List[int], db: Session) -> Dict[int, Dict[str, Any]]:
+        """
+        Estadísticas de varios conductores desde los contadores de driver_stats
+        - Los conductores sin entregas reciben contadores en cero
+        """
+        return DriverStatsService.get_stats(driver_ids, db)
 
 class LocationService:
     """Servicio para gestión de ubicaciones"""
@@ -192,58 +182,28 @@ class LocationService:
     @staticmethod
     def update_driver_location(driver_id: int, location_data: LocationUpdateRequest, 
                               delivery_id: Optional[int] = None, db: Session = None) -> Dict[str, Any]:
-        """Actualizar ubicación del conductor"""
+        """
+        Actualizar ubicación del conductor
+        - El ping se encola en la ingesta por lotes y se confirma de inmediato
+        - La ingesta notifica a los clientes y actualiza el almacén en vivo
+        - La ETA sale del motor en memoria (features.tracking.eta)
+        - El llamador debe haber validado que el conductor existe
+        """
         try:
-            driver = db.query(Driver).filter(Driver.id == driver_id).first()
-            if not driver:
-                return {"success": False, "message": "Conductor no encontrado"}
-            
-            # Crear registro de actualización de ubicación
-            location_update = LocationUpdate(
-                driver_id=driver_id,
-                delivery_id=delivery_id,
-                latitude=location_data.latitude,
-                longitude=location_data.longitude,
+            current_location = location_ingest.submit(
+                driver_id,
+                location_data.latitude,
+                location_data.longitude,
                 accuracy=location_data.accuracy,
                 speed=location_data.speed,
-                heading=location_data.heading
+                heading=location_data.heading,
+                delivery_id=delivery_id
             )
             
-            db.add(location_update)
-            
-            # Actualizar ubicación actual del conductor
-            driver.current_location = {
-                "lat": location_data.latitude,
-                "lng": location_data.longitude,
-                "accuracy": location_data.accuracy,
-                "speed": location_data.speed,
-                "heading": location_data.heading,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            driver.last_location_update = datetime.utcnow()
-            
-            db.commit()
-            
-            # Calcular distancia a destino si hay entrega activa
-            distance_from_destination = None
-            estimated_arrival = None
-            
-            if delivery_id:
-                delivery = db.query(DeliveryTracking).filter(DeliveryTracking.id == delivery_id).first()
-                if delivery and delivery.delivery_coordinates:
-                    dest_lat = delivery.delivery_coordinates.get("lat")
-                    dest_lng = delivery.delivery_coordinates.get("lng")
-                    if dest_lat and dest_lng:
-                        distance_from_destination = LocationService._calculate_distance(
-                            location_data.latitude, location_data.longitude,
-                            dest_lat, dest_lng
-                        )
-                        
-                        # Estimar tiempo de llegada basado en distancia y velocidad
-                        if location_data.speed and location_data.speed > 0:
-                            estimated_arrival = datetime.utcnow() + timedelta(
-                                hours=distance_from_destination / location_data.speed
-                            )
+            # Distancia y llegada estimada con el modelo de velocidad suavizado (sin consultar la BD)
+            distance_from_destination, estimated_arrival = eta_engine.estimate(
+                driver_id, location_data.latitude, location_data.longitude, delivery_id=delivery_id
+            )
             
             return {
                 "success": True,
@@ -257,79 +217,133 @@ class LocationService:
                     "heading": location_data.heading
                 },
                 "distance_from_destination": distance_from_destination,
-                "estimated_arrival": estimated_arrival
+                "estimated_arrival": estimated_arrival,
+                "location_update_interval": sampling_controller.current_interval(driver_id)
             }
             
         except Exception as e:
             logger.error(f"Error actualizando ubicación: {str(e)}")
-            db.rollback()
             return {"success": False, "message": f"Error: {str(e)}"}
     
     @staticmethod
-    def get_driver_location_history(driver_id: int, hours: int = 24, db: Session = None) -> List[Dict[str, Any]]:
-        """Obtener historial de ubicaciones del conductor"""
+    def get_driver_location_history(driver_id: int, hours: int = 24, db: Session = None,
+                                    tolerance_m: Optional[float] = None,
+                                    max_points: Optional[int] = None,
+                                    bucket_seconds: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Obtener historial de ubicaciones del conductor
+        - bucket_seconds: un punto por ventana de tiempo
+        - tolerance_m / max_points: simplificación Douglas-Peucker de la ruta
+        """
         try:
             since = datetime.utcnow() - timedelta(hours=hours)
             
-            updates = db.query(LocationUpdate).filter(
-                and_(
-                    LocationUpdate.driver_id == driver_id,
-                    LocationUpdate.timestamp >= since
-                )
-            ).order_by(LocationUpdate.timestamp.desc()).all()
-            
-            return [
-                {
-                    "latitude": update.latitude,
-                    "longitude": update.longitude,
-                    "accuracy": update.accuracy,
-                    "speed": update.speed,
-                    "heading": update.heading,
-                    "timestamp": update.timestamp
-                }
-                for update in updates
-            ]
+            history = LocationService._load_track(
+                db, [LocationUpdate.driver_id == driver_id, LocationUpdate.timestamp >= since],
+                tolerance_m, max_points, bucket_seconds
+            )
+            
+            # Más reciente primero, como el historial sin simplificar
+            history.reverse()
+            return history
             
         except Exception as e:
             logger.error(f"Error obteniendo historial de ubicaciones: {str(e)}")
             return []
     
     @staticmethod
-    def _calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        """Calcular distancia entre dos puntos en kilómetros (fórmula de Haversine)"""
-        R = 6371  # Radio de la Tierra en kilómetros
-        
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        
-        a = (math.sin(dlat/2) * math.sin(dlat/2) + 
-             math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * 
-             math.sin(dlon/2) * math.sin(dlon/2))
+    def get_delivery_route(delivery_id: int, db: Session,
+                           tolerance_m: Optional[float] = None,
+                           max_points: Optional[int] = None,
+                           bucket_seconds: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Obtener la ruta recorrida en una entrega (orden cronológico)"""
+        try:
+            return LocationService._load_track(
+                db, [LocationUpdate.delivery_id == delivery_id],
+                tolerance_m, max_points, bucket_seconds
+            )
+            
+        except Exception as e:
+            logger.error(f"Error obteniendo ruta de la entrega: {str(e)}")
+            return []
+    
+    @staticmethod
+    def _load_track(db: Session, criteria: List[Any], tolerance_m: Optional[float],
+                    max_points: Optional[int], bucket_seconds: Optional[int]) -> List[Dict[str, Any]]:
+        """Cargar puntos en orden cronológico y aplicar la simplificación pedida"""
+        updates = db.query(
+            LocationUpdate.latitude, LocationUpdate.longitude, LocationUpdate.accuracy,
+            LocationUpdate.speed, LocationUpdate.heading, LocationUpdate.timestamp
+        ).filter(and_(*criteria)).order_by(LocationUpdate.timestamp.asc()).all()
         
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        distance = R * c
+        track = [
+            {
+                "latitude": update.latitude,
+                "longitude": update.longitude,
+                "accuracy": update.accuracy,
+                "speed": update.speed,
+                "heading": update.heading,
+                "timestamp": update.timestamp
+            }
+            for update in updates
+        ]
         
-        return round(distance, 2)
+        if bucket_seconds:
+            track = downsample_by_time(track, bucket_seconds)
+        if tolerance_m is not None or max_points is not None:
+            track = simplify_track(track, tolerance_m=tolerance_m, max_points=max_points)
+        return track
+    
+    @staticmethod
+    def _calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+        """Calcular distancia entre dos puntos en kilómetros (fórmula de Haversine)"""
+        return round(haversine_km(lat1, lon1, lat2, lon2), 2)
 
 class DeliveryTrackingService:
     """Servicio para gestión de entregas"""
     
     @staticmethod
-    def assign_delivery(delivery_data: DeliveryTrackingCreate, db: Session) -> Optional[DeliveryTracking]:
-        """Asignar entrega a conductor"""
+    def resolve_delivery_coordinates(delivery_data: DeliveryTrackingCreate,
+                                     db: Session) -> Optional[Dict[str, Any]]:
+        """
+        Coordenadas de destino de una nueva entrega: las indicadas o geocodificadas
+        desde la dirección de envío de la orden
+        - Puede llamar al geocodificador externo: se ejecuta antes de bloquear filas
+          (y desde las rutas, fuera del event loop)
+        """
+        if delivery_data.delivery_coordinates:
+            return {
+                "lat": delivery_data.delivery_coordinates.lat,
+                "lng": delivery_data.delivery_coordinates.lng,
+                "source": SOURCE_EXPLICIT
+            }
+        
+        shipping_address = db.query(Order.shipping_address).filter(
+            Order.id == delivery_data.order_id
+        ).scalar()
+        return address_geocoder.resolve(shipping_address)
+    
+    @staticmethod
+    def assign_delivery(delivery_data: DeliveryTrackingCreate, db: Session,
+                        coordinates: Optional[Dict[str, Any]] = None) -> Optional[DeliveryTracking]:
+        """
+        Asignar entrega a conductor
+        - Con auto_assign se elige el mejor conductor disponible
+        - La fila del conductor se bloquea hasta el commit para evitar dobles asignaciones
+        - coordinates: destino ya resuelto con resolve_delivery_coordinates; si no
+          se indica se resuelve aquí, antes de bloquear la orden
+        """
         try:
-            # Verificar que la orden existe
-            order = db.query(Order).filter(Order.id == delivery_data.order_id).first()
-            if not order:
-                raise ValueError("Orden no encontrada")
+            if delivery_data.driver_id is None and not delivery_data.auto_assign:
+                raise ValueError("Debe indicar driver_id o usar auto_assign")
             
-            # Verificar que el conductor existe y está disponible
-            driver = db.query(Driver).filter(Driver.id == delivery_data.driver_id).first()
-            if not driver:
-                raise ValueError("Conductor no encontrado")
+            if coordinates is None:
+                coordinates = DeliveryTrackingService.resolve_delivery_coordinates(delivery_data, db)
             
-            if not driver.is_available:
-                raise ValueError("Conductor no está disponible")
+            # Verificar que la orden existe (bloqueada para evitar dos entregas de la misma orden)
+            order = db.query(Order).filter(Order.id == delivery_data.order_id).with_for_update().first()
+            if not order:
+                raise ValueError("Orden no encontrada")
             
             # Verificar que no hay entrega activa para esta orden
             existing_delivery = db.query(DeliveryTracking).filter(
@@ -342,25 +356,39 @@ class DeliveryTrackingService:
             if existing_delivery:
                 raise ValueError("La orden ya tiene una entrega asignada")
             
+            if delivery_data.driver_id is not None:
+                # Verificar que el conductor existe y está disponible
+                driver = db.query(Driver).filter(
+                    Driver.id == delivery_data.driver_id
+                ).with_for_update().first()
+                if not driver:
+                    raise ValueError("Conductor no encontrado")
+                
+                if not driver.is_available:
+                    raise ValueError("Conductor no está disponible")
+            else:
+                if not coordinates:
+                    raise ValueError("No se pudo ubicar la dirección de entrega para la asignación automática")
+                
+                driver = dispatch_engine.claim_best_driver(coordinates["lat"], coordinates["lng"], db)
+                if not driver:
+                    raise ValueError("No hay conductores disponibles cerca de la entrega")
+            
             # Crear tracking de entrega
             delivery_tracking = DeliveryTracking(
                 order_id=delivery_data.order_id,
-                driver_id=delivery_data.driver_id,
+                driver_id=driver.id,
                 priority=delivery_data.priority.value,
                 delivery_notes=delivery_data.delivery_notes,
                 estimated_duration=delivery_data.estimated_duration,
                 customer_name=order.customer_name,
                 customer_phone=order.customer_phone,
-                delivery_address=order.shipping_address
+                delivery_address=order.shipping_address,
+                delivery_coordinates=coordinates
             )
             
-            # Extraer coordenadas de la dirección de envío si está disponible
-            if order.shipping_address:
-                # Aquí podrías geocodificar la dirección para obtener coordenadas
-                # Por ahora lo dejamos como None
-                delivery_tracking.delivery_coordinates = None
-            
             db.add(delivery_tracking)
+            DriverStatsService.record_assignment(driver.id, db)
             
             # Marcar conductor como ocupado
             driver.is_available = False
@@ -368,8 +396,21 @@ class DeliveryTrackingService:
             
             db.commit()
             db.refresh(delivery_tracking)
-            
-            logger.info(f"Entrega asignada: Order ID {delivery_data.order_id}, Driver ID {delivery_data.driver_id}")
+            geofence_monitor.register(delivery_tracking.id, driver.id, coordinates)
+            live_driver_store.publish_driver(driver)
+            sampling_controller.refresh(driver.id)
+            
+            # Resolución de la orden y geocercas de la entrega en todos los workers
+            tracking_bus.publish_delivery_event(delivery_tracking.id, {
+                "type": "assigned",
+                "order_id": order.id,
+                "woocommerce_order_id": order.woocommerce_order_id,
+                "driver_id": driver.id,
+                "status": delivery_tracking.status,
+                "delivery_coordinates": coordinates
+            })
+            
+            logger.info(f"Entrega asignada: Order ID {delivery_data.order_id}, Driver ID {driver.id}")
             return delivery_tracking
             
         except Exception as e:
@@ -393,12 +434,17 @@ class DeliveryTrackingService:
                               db: Session) -> Optional[DeliveryTracking]:
         """Actualizar estado de entrega"""
         try:
-            delivery = db.query(DeliveryTracking).filter(DeliveryTracking.id == delivery_id).first()
+            # Fila bloqueada: dos cambios simultáneos no cuentan dos veces la misma transición
+            delivery = db.query(DeliveryTracking).filter(
+                DeliveryTracking.id == delivery_id
+            ).with_for_update().first()
             if not delivery:
                 return None
             
             old_status = delivery.status
             delivery.status = status_update.status.value
+            DriverStatsService.record_status_change(delivery.driver_id, old_status, delivery.status, db)
+            driver = None
             
             # Actualizar timestamps según el estado
             if status_update.status.value == "started" and not delivery.started_at:
@@ -420,6 +466,17 @@ class DeliveryTrackingService:
             
             db.commit()
             db.refresh(delivery)
+            if driver:
+                live_driver_store.publish_driver(driver)
+                sampling_controller.refresh(driver.id)
+            
+            # Notificar a los clientes que siguen la entrega
+            tracking_bus.publish_delivery_event(delivery.id, {
+                "type": "status_update",
+                "delivery_id": delivery.id,
+                "status": delivery.status,
+                "estimated_arrival": delivery.estimated_arrival.isoformat() if delivery.estimated_arrival else None
+            })
             
             logger.info(f"Estado de entrega actualizado: {old_status} -> {status_update.status.value}")
             return delivery
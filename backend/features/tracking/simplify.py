@@ -0,0 +1,129 @@
+"""
+Simplificación de trayectorias para el historial de ubicaciones
+
+- Reducción por ventanas de tiempo (un punto por intervalo)
+- Douglas-Peucker con tolerancia en metros y/o número máximo de puntos
+"""
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+
+import numpy as np
+
+from features.tracking.geo import EARTH_RADIUS_KM
+
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+
+
+def downsample_by_time(points: List[Dict[str, Any]], bucket_seconds: int,
+                       time_key: str = "timestamp") -> List[Dict[str, Any]]:
+    """
+    Conservar el último punto de cada ventana de `bucket_seconds`
+    - Los puntos deben venir en orden cronológico
+    """
+    if bucket_seconds <= 0 or len(points) < 3:
+        return points
+
+    result: List[Dict[str, Any]] = []
+    current_bucket = None
+    for point in points:
+        bucket = int(_epoch(point[time_key]) // bucket_seconds)
+        if bucket == current_bucket:
+            result[-1] = point
+        else:
+            result.append(point)
+            current_bucket = bucket
+
+    # El primer punto se conserva para no recortar el inicio de la ruta
+    if result[0] is not points[0]:
+        result.insert(0, points[0])
+    return result
+
+
+def simplify_track(points: List[Dict[str, Any]], tolerance_m: Optional[float] = None,
+                   max_points: Optional[int] = None, lat_key: str = "latitude",
+                   lng_key: str = "longitude") -> List[Dict[str, Any]]:
+    """
+    Simplificar una trayectoria con Douglas-Peucker
+    - tolerance_m: desviación máxima permitida respecto a la ruta original
+    - max_points: conservar solo los N puntos más significativos
+    - Los puntos deben venir en orden cronológico; siempre se conservan los extremos
+    """
+    if len(points) < 3 or (tolerance_m is None and max_points is None):
+        return points
+
+    lats = np.fromiter((point[lat_key] for point in points), dtype=float, count=len(points))
+    lngs = np.fromiter((point[lng_key] for point in points), dtype=float, count=len(points))
+    significance = douglas_peucker_significance(lats, lngs, floor_m=tolerance_m or 0.0)
+
+    keep = np.ones(len(points), dtype=bool)
+    if tolerance_m is not None:
+        keep &= significance > tolerance_m
+    if max_points is not None and keep.sum() > max_points:
+        # Umbral de significancia que deja exactamente max_points candidatos
+        candidates = np.flatnonzero(keep)
+        ranked = candidates[np.argsort(-significance[candidates], kind="stable")]
+        keep[:] = False
+        keep[ranked[:max(max_points, 2)]] = True
+
+    keep[0] = keep[-1] = True
+    return [points[i] for i in np.flatnonzero(keep)]
+
+
+def douglas_peucker_significance(lats: np.ndarray, lngs: np.ndarray,
+                                 floor_m: float = 0.0) -> np.ndarray:
+    """
+    Significancia (metros) de cada punto según Douglas-Peucker
+    - Un punto se conserva con tolerancia T si su significancia es mayor que T
+    - Los extremos tienen significancia infinita
+    - Los tramos por debajo de floor_m no se subdividen (sus puntos quedan en 0)
+    """
+    count = len(lats)
+    significance = np.zeros(count)
+    significance[0] = significance[-1] = np.inf
+    if count < 3:
+        return significance
+
+    # Proyección equirectangular local a metros
+    mean_lat = np.radians(lats.mean())
+    x = np.radians(lngs) * EARTH_RADIUS_M * np.cos(mean_lat)
+    y = np.radians(lats) * EARTH_RADIUS_M
+
+    stack = [(0, count - 1, np.inf)]
+    while stack:
+        start, end, parent = stack.pop()
+        if end - start < 2:
+            continue
+
+        distances = _segment_distances(x, y, start, end)
+        index = int(np.argmax(distances))
+        split = start + 1 + index
+        # La significancia de un punto nunca supera la del segmento que lo contiene
+        value = min(float(distances[index]), parent)
+        significance[split] = value
+        if value <= floor_m:
+            continue
+
+        stack.append((start, split, value))
+        stack.append((split, end, value))
+
+    return significance
+
+
+def _segment_distances(x: np.ndarray, y: np.ndarray, start: int, end: int) -> np.ndarray:
+    """Distancia de los puntos intermedios al segmento start-end"""
+    px, py = x[start + 1:end], y[start + 1:end]
+    ax, ay, bx, by = x[start], y[start], x[end], y[end]
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+
+    if length_sq == 0:
+        return np.hypot(px - ax, py - ay)
+
+    t = np.clip(((px - ax) * dx + (py - ay) * dy) / length_sq, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def _epoch(value: Any) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(value).timestamp()
@@ -0,0 +1,171 @@
+"""
+Índice espacial de rejilla para consultas de conductores cercanos
+
+Divide el mapa en celdas de tamaño fijo (en grados); una consulta por
+radio solo revisa las celdas que cubren el círculo, por lo que su costo
+depende de la densidad local y no del tamaño total de la flota. Si el
+círculo cubre más celdas de las que hay ocupadas (radios grandes o flota
+dispersa) se recorren solo las ocupadas.
+"""
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import math
+
+from features.tracking.geo import haversine_km
+
+# Kilómetros por grado de latitud
+KM_PER_DEGREE = 111.32
+
+Cell = Tuple[int, int]
+
+
+class SpatialGridIndex:
+    """Rejilla de celdas lat/lng -> ids de conductores"""
+
+    def __init__(self, cell_size_deg: float = 0.01):
+        self.cell_size_deg = cell_size_deg
+        self._cells: Dict[Cell, Set[int]] = {}
+        self._positions: Dict[int, Tuple[float, float, Cell]] = {}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def update(self, item_id: int, lat: float, lng: float):
+        """Insertar o mover un elemento"""
+        cell = self._cell(lat, lng)
+        previous = self._positions.get(item_id)
+        if previous is not None and previous[2] != cell:
+            self._discard(item_id, previous[2])
+        self._cells.setdefault(cell, set()).add(item_id)
+        self._positions[item_id] = (lat, lng, cell)
+
+    def remove(self, item_id: int):
+        """Eliminar un elemento del índice"""
+        previous = self._positions.pop(item_id, None)
+        if previous is not None:
+            self._discard(item_id, previous[2])
+
+    def within_radius(self, lat: float, lng: float, radius_km: float,
+                      predicate: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, float]]:
+        """Elementos dentro del radio, ordenados por distancia: [(id, distancia_km)]"""
+        lat_cells = math.ceil(radius_km / KM_PER_DEGREE / self.cell_size_deg)
+        lng_cells = math.ceil(radius_km / self._km_per_degree_lng(lat) / self.cell_size_deg)
+        center_lat, center_lng = self._cell(lat, lng)
+
+        if (2 * lat_cells + 1) * (2 * lng_cells + 1) > len(self._cells):
+            return self._scan_occupied(lat, lng, radius_km, predicate)
+
+        results = []
+        for cell_lat in range(center_lat - lat_cells, center_lat + lat_cells + 1):
+            for cell_lng in range(center_lng - lng_cells, center_lng + lng_cells + 1):
+                results.extend(self._scan_cell((cell_lat, cell_lng), lat, lng, radius_km, predicate))
+
+        results.sort(key=lambda item: item[1])
+        return results
+
+    def nearest(self, lat: float, lng: float, count: int, max_radius_km: float = 50,
+                predicate: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, float]]:
+        """
+        Los N elementos más cercanos dentro de max_radius_km
+        - Recorre anillos de celdas crecientes y se detiene en cuanto el
+          anillo siguiente ya no puede contener un resultado más cercano
+        - Si los anillos cubren más celdas de las ocupadas, recorre solo las ocupadas
+        """
+        center_lat, center_lng = self._cell(lat, lng)
+        # Distancia mínima garantizada que cubre cada anillo adicional
+        ring_km = self.cell_size_deg * min(KM_PER_DEGREE, self._km_per_degree_lng(lat))
+        max_rings = math.ceil(max_radius_km / ring_km) + 1
+
+        if (2 * max_rings + 1) ** 2 > len(self._cells):
+            return self._scan_occupied(lat, lng, max_radius_km, predicate)[:count]
+
+        found: List[Tuple[int, float]] = []
+        for ring in range(max_rings + 1):
+            for cell in self._ring_cells(center_lat, center_lng, ring):
+                found.extend(self._scan_cell(cell, lat, lng, max_radius_km, predicate))
+            if len(found) >= count:
+                found.sort(key=lambda item: item[1])
+                if found[count - 1][1] <= ring * ring_km:
+                    break
+
+        found.sort(key=lambda item: item[1])
+        return found[:count]
+
+    def within_bounds(self, south: float, west: float, north: float, east: float,
+                      predicate: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, float, float]]:
+        """
+        Elementos dentro de un rectángulo: [(id, lat, lng)]
+        - west > east indica un rectángulo que cruza el antimeridiano
+        - Si el rectángulo cubre más celdas de las ocupadas se recorren solo las ocupadas
+        """
+        if west > east:
+            return (self.within_bounds(south, west, north, 180.0, predicate)
+                    + self.within_bounds(south, -180.0, north, east, predicate))
+
+        min_lat, min_lng = self._cell(south, west)
+        max_lat, max_lng = self._cell(north, east)
+        if (max_lat - min_lat + 1) * (max_lng - min_lng + 1) > len(self._cells):
+            cells = [
+                cell for cell in self._cells
+                if min_lat <= cell[0] <= max_lat and min_lng <= cell[1] <= max_lng
+            ]
+        else:
+            cells = [
+                (cell_lat, cell_lng)
+                for cell_lat in range(min_lat, max_lat + 1)
+                for cell_lng in range(min_lng, max_lng + 1)
+            ]
+
+        results = []
+        for cell in cells:
+            for item_id in self._cells.get(cell, ()):
+                if predicate is not None and not predicate(item_id):
+                    continue
+                item_lat, item_lng, _ = self._positions[item_id]
+                if south <= item_lat <= north and west <= item_lng <= east:
+                    results.append((item_id, item_lat, item_lng))
+        return results
+
+    def _scan_cell(self, cell: Cell, lat: float, lng: float, radius_km: float,
+                   predicate: Optional[Callable[[int], bool]]) -> List[Tuple[int, float]]:
+        results = []
+        for item_id in self._cells.get(cell, ()):
+            if predicate is not None and not predicate(item_id):
+                continue
+            item_lat, item_lng, _ = self._positions[item_id]
+            distance = haversine_km(lat, lng, item_lat, item_lng)
+            if distance <= radius_km:
+                results.append((item_id, distance))
+        return results
+
+    def _scan_occupied(self, lat: float, lng: float, radius_km: float,
+                       predicate: Optional[Callable[[int], bool]]) -> List[Tuple[int, float]]:
+        """Todas las celdas ocupadas, ordenadas por distancia (costo según la flota, no el radio)"""
+        results = []
+        for cell in list(self._cells):
+            results.extend(self._scan_cell(cell, lat, lng, radius_km, predicate))
+        results.sort(key=lambda item: item[1])
+        return results
+
+    def _ring_cells(self, center_lat: int, center_lng: int, ring: int):
+        if ring == 0:
+            yield (center_lat, center_lng)
+            return
+        for offset in range(-ring, ring + 1):
+            yield (center_lat - ring, center_lng + offset)
+            yield (center_lat + ring, center_lng + offset)
+        for offset in range(-ring + 1, ring):
+            yield (center_lat + offset, center_lng - ring)
+            yield (center_lat + offset, center_lng + ring)
+
+    def _cell(self, lat: float, lng: float) -> Cell:
+        return (math.floor(lat / self.cell_size_deg), math.floor(lng / self.cell_size_deg))
+
+    def _km_per_degree_lng(self, lat: float) -> float:
+        return max(KM_PER_DEGREE * math.cos(math.radians(min(abs(lat), 89.0))), 0.01)
+
+    def _discard(self, item_id: int, cell: Cell):
+        items = self._cells.get(cell)
+        if items is not None:
+            items.discard(item_id)
+            if not items:
+                del self._cells[cell]
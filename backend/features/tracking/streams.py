@@ -0,0 +1,216 @@
+"""
+Flujos de tracking por orden con números de secuencia y reanudación
+
+Cada entrega con clientes conectados tiene un único OrderStream por worker:
+se suscribe una vez al bus, aplica los eventos al estado de la orden y
+publica solo los campos que cambiaron con un número de secuencia creciente.
+Los últimos cambios se guardan en un buffer para que un cliente que se
+reconecta con `?since=<seq>` reciba únicamente lo que se perdió.
+
+Protocolo v2 (mensajes JSON):
+    {"type": "snapshot", "v": 2, "stream": id, "seq": n, "data": {...}}
+    {"type": "resume", "v": 2, "stream": id, "seq": n}
+    {"type": "delta", "seq": n, "ts": iso, "changes": {...}}
+"""
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import json
+import logging
+import secrets
+
+from features.tracking.events import tracking_bus
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 2
+# Cambios recientes guardados por orden para reanudar conexiones
+REPLAY_BUFFER_SIZE = 256
+# Segundos que se conserva un flujo sin clientes (para reconexiones)
+STREAM_IDLE_TTL = 120
+# Mensajes pendientes por cliente antes de forzar una resincronización
+CLIENT_QUEUE_SIZE = 100
+
+# Elementos de la cola de cada cliente: ("delta", seq, mensaje) o ("resync", seq, None)
+StreamItem = Tuple[str, int, Optional[str]]
+
+
+class OrderStream:
+    """Estado, secuencia y buffer de reanudación de una orden"""
+
+    def __init__(self, order_number: str, delivery_id: int, driver_id: int, state: Dict[str, Any],
+                 on_idle: Callable[["OrderStream"], None]):
+        self.order_number = order_number
+        self.delivery_id = delivery_id
+        self.driver_id = driver_id
+        self.stream_id = secrets.token_hex(4)
+        self.seq = 0
+        self.state = state
+        self.completed = state.get("delivery_status") == "completed"
+        # cola de cada cliente -> función que se avisa cuando la cola se desborda
+        self.subscribers: Dict[asyncio.Queue, Optional[Callable[[int], None]]] = {}
+
+        self._replay: Deque[Tuple[int, str]] = deque(maxlen=REPLAY_BUFFER_SIZE)
+        self._on_idle = on_idle
+        self._idle_handle: Optional[asyncio.TimerHandle] = None
+        self._bus_queue = tracking_bus.subscribe(delivery_id, driver_id)
+        self._task = asyncio.create_task(self._pump())
+
+    def subscribe(self, on_overflow: Optional[Callable[[int], None]] = None) -> asyncio.Queue:
+        """
+        Registrar un cliente; recibe los cambios posteriores a este momento
+        - on_overflow(descartados) se invoca cada vez que su cola se desborda
+        """
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        queue: asyncio.Queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.subscribers[queue] = on_overflow
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        """Quitar un cliente; sin clientes el flujo se cierra tras STREAM_IDLE_TTL"""
+        self.subscribers.pop(queue, None)
+        if not self.subscribers and self._idle_handle is None:
+            loop = asyncio.get_running_loop()
+            self._idle_handle = loop.call_later(STREAM_IDLE_TTL, self._on_idle, self)
+
+    def snapshot_message(self) -> str:
+        return json.dumps({
+            "type": "snapshot",
+            "v": PROTOCOL_VERSION,
+            "stream": self.stream_id,
+            "seq": self.seq,
+            "data": self.state
+        })
+
+    def resume_message(self) -> str:
+        return json.dumps({
+            "type": "resume",
+            "v": PROTOCOL_VERSION,
+            "stream": self.stream_id,
+            "seq": self.seq
+        })
+
+    def replay_since(self, stream_id: Optional[str], since: int) -> Optional[List[str]]:
+        """
+        Cambios posteriores a `since` si siguen en el buffer
+        - None si el cliente debe recibir un snapshot completo
+        """
+        if stream_id != self.stream_id or since > self.seq:
+            return None
+        oldest = self._replay[0][0] if self._replay else self.seq + 1
+        if since < oldest - 1:
+            return None
+        return [message for seq, message in self._replay if seq > since]
+
+    def apply(self, event: Dict[str, Any]):
+        """Aplicar un evento del bus y difundir los campos que cambiaron"""
+        previous = dict(self.state)
+        apply_tracking_event(self.state, event)
+        changes = {
+            key: value for key, value in self.state.items()
+            if key != "timestamp" and previous.get(key) != value
+        }
+        if not changes:
+            return
+
+        self.seq += 1
+        self.completed = self.state.get("delivery_status") == "completed"
+        message = json.dumps({
+            "type": "delta",
+            "seq": self.seq,
+            "ts": self.state["timestamp"],
+            "changes": changes
+        })
+        self._replay.append((self.seq, message))
+
+        for queue, on_overflow in list(self.subscribers.items()):
+            if queue.full():
+                # Cliente lento: descartar lo pendiente y enviarle un snapshot
+                dropped = queue.qsize()
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("resync", self.seq, None))
+                if on_overflow is not None:
+                    on_overflow(dropped)
+            else:
+                queue.put_nowait(("delta", self.seq, message))
+
+    def close(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        self._task.cancel()
+        tracking_bus.unsubscribe(self.delivery_id, self._bus_queue)
+
+    async def _pump(self):
+        while True:
+            event = await self._bus_queue.get()
+            try:
+                self.apply(event)
+            except Exception as e:
+                logger.error(f"Error aplicando evento a la orden {self.order_number}: {str(e)}")
+
+
+class OrderStreamRegistry:
+    """Flujos activos de este worker indexados por entrega"""
+
+    def __init__(self):
+        self._streams: Dict[int, OrderStream] = {}
+
+    def get(self, delivery_id: int) -> Optional[OrderStream]:
+        return self._streams.get(delivery_id)
+
+    def open(self, order_number: str, delivery_id: int, driver_id: int,
+             state: Dict[str, Any]) -> OrderStream:
+        """Obtener el flujo de la entrega o crearlo con el estado inicial"""
+        stream = self._streams.get(delivery_id)
+        if stream is None or stream.driver_id != driver_id:
+            if stream is not None:
+                stream.close()
+            stream = OrderStream(order_number, delivery_id, driver_id, state, self._close_idle)
+            self._streams[delivery_id] = stream
+        return stream
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "streams": len(self._streams),
+            "replay_buffered": sum(len(stream._replay) for stream in self._streams.values())
+        }
+
+    def _close_idle(self, stream: OrderStream):
+        if stream.subscribers:
+            return
+        stream.close()
+        if self._streams.get(stream.delivery_id) is stream:
+            del self._streams[stream.delivery_id]
+
+
+def apply_tracking_event(location_data: Dict[str, Any], event: Dict[str, Any]):
+    """Aplicar un evento del bus al payload de tracking del cliente"""
+    if event["type"] == "location_update":
+        location_data["current_location"] = event["location"]
+        location_data["is_online"] = True
+        if event.get("last_update"):
+            location_data["last_update"] = event["last_update"]
+        if "distance_remaining" in event:
+            location_data["distance_remaining"] = event["distance_remaining"]
+    elif event["type"] == "delivery_update":
+        if "distance_remaining" in event:
+            location_data["distance_remaining"] = event["distance_remaining"]
+        if event.get("estimated_arrival"):
+            location_data["estimated_arrival"] = event["estimated_arrival"]
+    elif event["type"] == "geofence":
+        location_data["geofence"] = {"event": event["event"], "zone": event["zone"]}
+    elif event["type"] == "status_update":
+        location_data["delivery_status"] = event["status"]
+        if event.get("estimated_arrival"):
+            location_data["estimated_arrival"] = event["estimated_arrival"]
+
+    location_data["timestamp"] = datetime.utcnow().isoformat()
+
+
+# Instancia global de flujos por orden
+order_streams = OrderStreamRegistry()
@@ -0,0 +1,84 @@
+"""
+Centroides de los códigos postales de la zona de entrega (NJ)
+
+Coordenadas aproximadas (lat, lng) del centro de cada ZIP; cubren los
+códigos de ShippingService.valid_zip_codes. Se usan como geocodificación
+local cuando la dirección no está en la caché.
+"""
+from typing import Dict, Tuple
+
+ZIP_CENTROIDS: Dict[str, Tuple[float, float]] = {
+    # Monmouth
+    "07701": (40.3527, -74.0790),  # Red Bank
+    "07702": (40.3284, -74.0594),  # Shrewsbury
+    "07703": (40.3165, -74.0397),  # Fort Monmouth
+    "07704": (40.3598, -74.0390),  # Fair Haven
+    "07711": (40.2370, -74.0067),  # Allenhurst
+    "07712": (40.2480, -74.0490),  # Asbury Park / Ocean
+    "07716": (40.4062, -74.0290),  # Atlantic Highlands
+    "07717": (40.1920, -74.0160),  # Avon by the Sea
+    "07718": (40.4184, -74.0859),  # Belford
+    "07719": (40.1680, -74.0730),  # Belmar / Wall
+    "07720": (40.2020, -74.0120),  # Bradley Beach
+    "07721": (40.4370, -74.2360),  # Cliffwood
+    "07722": (40.2930, -74.1680),  # Colts Neck
+    "07723": (40.2510, -73.9970),  # Deal
+    "07724": (40.2980, -74.0740),  # Eatontown
+    "07726": (40.2800, -74.3430),  # Englishtown / Manalapan
+    "07727": (40.2010, -74.1690),  # Farmingdale
+    "07728": (40.2270, -74.2750),  # Freehold
+    "07730": (40.4220, -74.1770),  # Hazlet
+    "07731": (40.1490, -74.2070),  # Howell
+    "07733": (40.3750, -74.1720),  # Holmdel
+    "07734": (40.4430, -74.1320),  # Keansburg
+    "07737": (40.4140, -74.0630),  # Leonardo
+    "07738": (40.3390, -74.1250),  # Lincroft
+    "07739": (40.3370, -74.0400),  # Little Silver
+    "07740": (40.2970, -73.9920),  # Long Branch
+    "07746": (40.3170, -74.2580),  # Marlboro
+    "07747": (40.4120, -74.2340),  # Matawan / Aberdeen
+    "07748": (40.3950, -74.1150),  # Middletown
+    "07750": (40.3330, -73.9820),  # Monmouth Beach
+    "07751": (40.3590, -74.2610),  # Morganville
+    "07753": (40.2090, -74.0430),  # Neptune
+    "07755": (40.2640, -74.0140),  # Oakhurst
+    "07756": (40.2120, -74.0070),  # Ocean Grove
+    "07757": (40.3160, -74.0170),  # Oceanport
+    "07758": (40.4320, -74.1000),  # Port Monmouth
+    "07760": (40.3700, -74.0020),  # Rumson
+    "07762": (40.1530, -74.0350),  # Spring Lake
+    "07764": (40.2890, -74.0180),  # West Long Branch
+    "08501": (40.1600, -74.5600),  # Allentown
+    "08510": (40.1920, -74.4300),  # Millstone
+    "08514": (40.1330, -74.4850),  # Cream Ridge
+    "08535": (40.2470, -74.4300),  # Perrineville
+    "08555": (40.2210, -74.4740),  # Roosevelt
+    "08720": (40.1380, -74.1010),  # Allenwood
+    "08730": (40.1070, -74.0620),  # Brielle
+    "08736": (40.1200, -74.0600),  # Manasquan
+    "08750": (40.1330, -74.0400),  # Sea Girt
+    # Ocean
+    "08527": (40.1090, -74.3530),  # Jackson
+    "08701": (40.0780, -74.2000),  # Lakewood
+    "08723": (40.0380, -74.1130),  # Brick
+    "08724": (40.0920, -74.1180),  # Brick (norte)
+    "08733": (40.0180, -74.3200),  # Lakehurst
+    "08735": (39.9730, -74.0700),  # Lavallette
+    "08738": (40.0330, -74.0550),  # Mantoloking
+    "08742": (40.0750, -74.0600),  # Point Pleasant
+    "08751": (39.9450, -74.0730),  # Seaside Heights
+    "08753": (39.9800, -74.1550),  # Toms River
+    "08755": (40.0150, -74.2260),  # Toms River (norte)
+    "08757": (39.9500, -74.2530),  # Toms River (sur)
+    "08759": (39.9600, -74.3500),  # Manchester
+    # Middlesex / Mercer
+    "08512": (40.3150, -74.5200),  # Cranbury
+    "08520": (40.2690, -74.5300),  # Hightstown / East Windsor
+    "08816": (40.4270, -74.4170),  # East Brunswick
+    "08828": (40.3770, -74.4250),  # Helmetta
+    "08831": (40.3200, -74.4300),  # Monroe
+    "08857": (40.3900, -74.3300),  # Old Bridge
+    "08872": (40.4630, -74.3480),  # Sayreville
+    "08879": (40.4650, -74.2750),  # South Amboy
+    "08884": (40.3920, -74.3900),  # Spotswood
+}
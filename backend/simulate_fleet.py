@@ -0,0 +1,655 @@
+#!/usr/bin/env python3
+"""
+Simulador de flota y prueba de carga del tracking
+
+Crea N conductores sintéticos que recorren rutas generadas y envían su
+ubicación por WebSocket (/tracking/ws/driver/{id}) o por HTTP
+(/tracking/drivers/location), y M clientes que siguen sus órdenes por
+/tracking/ws/tracking/{order_number}. Al terminar genera un reporte JSON
+comparable entre ejecuciones:
+
+- ingesta: pings enviados y confirmados por segundo, errores, 429
+- fan-out: mensajes recibidos por los clientes y latencia ping -> cliente (p50/p95/p99)
+- BD: consultas totales, por segundo y por ping persistido (solo en proceso)
+- memoria: RSS inicial, pico y final (solo en proceso)
+
+Por defecto levanta la API en este mismo proceso (uvicorn en un hilo) con
+la BD de DATABASE_URL, PostgreSQL o SQLite:
+
+    DATABASE_URL=sqlite:///./fleet_sim.db python simulate_fleet.py --drivers 200 --customers 400
+    python simulate_fleet.py --mode http --duration 120 --report reporte.json
+    python simulate_fleet.py --baseline reporte.json --tolerance 0.15
+
+Con --url se usa un servidor ya iniciado (misma BD y SECRET_KEY; con --mode
+http el servidor debe tener un RATE_LIMIT_REQUESTS_PER_MINUTE alto). Los
+datos sintéticos usan correos @fleet-sim.local y se borran con --cleanup.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+SIM_EMAIL_DOMAIN = "fleet-sim.local"
+# Números de orden de WooCommerce reservados para el simulador
+SIM_ORDER_BASE = 900000000
+# Distancia (m) a la que los conductores dan la vuelta antes del destino,
+# fuera del radio de llegada de las geocercas para que la entrega siga activa
+TURNAROUND_DISTANCE_M = 200
+# Envíos recordados por conductor para medir la latencia de fan-out
+SEND_HISTORY_SIZE = 256
+EARTH_RADIUS_M = 6371000.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulador de flota y prueba de carga del tracking")
+    parser.add_argument("--drivers", type=int, default=50, help="Conductores sintéticos")
+    parser.add_argument("--customers", type=int, default=100, help="Clientes siguiendo una orden")
+    parser.add_argument("--mode", choices=["ws", "http"], default="ws", help="Canal de los conductores")
+    parser.add_argument("--duration", type=float, default=60, help="Segundos de simulación")
+    parser.add_argument("--interval", type=float, default=2, help="Segundos entre pings de cada conductor")
+    parser.add_argument("--fixed-interval", action="store_true",
+                        help="Reportar siempre cada --interval (en proceso desactiva el muestreo adaptativo)")
+    parser.add_argument("--ramp", type=float, default=5, help="Segundos para conectar a todos los clientes")
+    parser.add_argument("--lat", type=float, default=40.7128, help="Latitud del centro de la zona")
+    parser.add_argument("--lng", type=float, default=-74.0060, help="Longitud del centro de la zona")
+    parser.add_argument("--radius-km", type=float, default=8, help="Radio de la zona de reparto")
+    parser.add_argument("--url", help="URL de un servidor ya iniciado (por defecto, en proceso)")
+    parser.add_argument("--seed", type=int, default=1, help="Semilla de las rutas")
+    parser.add_argument("--report", default="fleet_sim_report.json", help="Archivo del reporte")
+    parser.add_argument("--baseline", help="Reporte anterior con el que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento relativo tolerado")
+    parser.add_argument("--cleanup", action="store_true", help="Borrar los datos sintéticos al terminar")
+    return parser.parse_args()
+
+
+# ===== DATOS SINTÉTICOS =====
+
+def seed_fleet(drivers: int, customers: int, center: Tuple[float, float], radius_km: float,
+               interval: float, rng: random.Random) -> Dict[str, Any]:
+    """Crear conductores online y una entrega activa por cliente (reutiliza los existentes)"""
+    from core.database import SessionLocal
+    from core.security import create_access_token
+    from features.ecommerce.models import Order
+    from features.roles.models import Role
+    from features.tracking.models import Driver, DeliveryTracking
+    from features.users.models import User
+
+    db = SessionLocal()
+    try:
+        driver_role = db.query(Role).filter(Role.name == "driver").first()
+        if driver_role is None:
+            raise RuntimeError("No existe el rol 'driver' (ejecutar las migraciones)")
+
+        fleet = []
+        for index in range(drivers):
+            email = f"driver{index}@{SIM_EMAIL_DOMAIN}"
+            user = db.query(User).filter(User.email == email).first()
+            if user is None:
+                user = User(email=email, full_name=f"Conductor simulado {index}", phone="555-0000",
+                            role_id=driver_role.id)
+                db.add(user)
+                db.flush()
+            driver = db.query(Driver).filter(Driver.user_id == user.id).first()
+            if driver is None:
+                driver = Driver(user_id=user.id, phone=user.phone)
+                db.add(driver)
+            driver.is_online = True
+            driver.is_available = False
+            driver.is_delivering = True
+            driver.location_update_interval = max(1, int(round(interval)))
+            db.flush()
+            start = _random_point(center, radius_km, rng)
+            fleet.append({
+                "driver_id": driver.id,
+                "token": create_access_token({"sub": email}),
+                "start": start,
+                "destination": _random_point(center, radius_km, rng),
+                "speed_kmh": rng.uniform(25, 50),
+                "orders": []
+            })
+
+        orders = []
+        for index in range(customers):
+            member = fleet[index % len(fleet)]
+            order_number = SIM_ORDER_BASE + index
+            order = db.query(Order).filter(Order.woocommerce_order_id == order_number).first()
+            if order is None:
+                order = Order(woocommerce_order_id=order_number, customer_email=f"customer{index}@{SIM_EMAIL_DOMAIN}",
+                              customer_name=f"Cliente simulado {index}", subtotal=10, total=10,
+                              status="processing", shipping_address={})
+                db.add(order)
+                db.flush()
+            # Reiniciar la entrega por si una ejecución anterior la completó
+            db.query(DeliveryTracking).filter(DeliveryTracking.order_id == order.id).delete()
+            lat, lng = member["destination"]
+            db.add(DeliveryTracking(order_id=order.id, driver_id=member["driver_id"], status="started",
+                                    delivery_coordinates={"lat": lat, "lng": lng},
+                                    customer_name=order.customer_name))
+            member["orders"].append(str(order_number))
+            orders.append(str(order_number))
+
+        db.commit()
+        return {"drivers": fleet, "orders": orders}
+    finally:
+        db.close()
+
+
+def cleanup_fleet():
+    """Borrar todos los datos del simulador"""
+    from core.database import SessionLocal
+    from features.ecommerce.models import Order
+    from features.tracking.models import (
+        Driver, DeliveryTracking, DriverSession, DriverStats, LocationRollup, LocationUpdate
+    )
+    from features.users.models import User
+
+    db = SessionLocal()
+    try:
+        user_ids = [row[0] for row in db.query(User.id).filter(User.email.like(f"%@{SIM_EMAIL_DOMAIN}"))]
+        driver_ids = [row[0] for row in db.query(Driver.id).filter(Driver.user_id.in_(user_ids))]
+        order_ids = [row[0] for row in db.query(Order.id).filter(Order.woocommerce_order_id >= SIM_ORDER_BASE)]
+        for model in (LocationUpdate, LocationRollup, DriverSession, DriverStats, DeliveryTracking):
+            db.query(model).filter(model.driver_id.in_(driver_ids)).delete(synchronize_session=False)
+        db.query(DeliveryTracking).filter(DeliveryTracking.order_id.in_(order_ids)).delete(synchronize_session=False)
+        db.query(Driver).filter(Driver.id.in_(driver_ids)).delete(synchronize_session=False)
+        db.query(Order).filter(Order.id.in_(order_ids)).delete(synchronize_session=False)
+        db.query(User).filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+        db.commit()
+        print(f"🧹 Datos del simulador borrados: {len(driver_ids)} conductores, {len(order_ids)} órdenes")
+    finally:
+        db.close()
+
+
+def _random_point(center: Tuple[float, float], radius_km: float, rng: random.Random) -> Tuple[float, float]:
+    distance = radius_km * 1000 * math.sqrt(rng.random())
+    bearing = rng.uniform(0, 2 * math.pi)
+    return _offset(center, distance * math.cos(bearing), distance * math.sin(bearing))
+
+
+def _offset(point: Tuple[float, float], north_m: float, east_m: float) -> Tuple[float, float]:
+    lat, lng = point
+    return (
+        lat + math.degrees(north_m / EARTH_RADIUS_M),
+        lng + math.degrees(east_m / (EARTH_RADIUS_M * math.cos(math.radians(lat))))
+    )
+
+
+def _distance_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    x = math.radians(b[1] - a[1]) * math.cos(math.radians((a[0] + b[0]) / 2))
+    y = math.radians(b[0] - a[0])
+    return math.hypot(x, y) * EARTH_RADIUS_M
+
+
+# ===== RUTAS =====
+
+class SimulatedRoute:
+    """Ida y vuelta entre el inicio y un punto previo al destino, con una esquina intermedia"""
+
+    def __init__(self, start: Tuple[float, float], destination: Tuple[float, float], speed_kmh: float):
+        length = _distance_m(start, destination)
+        ratio = max(length - TURNAROUND_DISTANCE_M, 0) / length if length else 0
+        turnaround = (
+            start[0] + (destination[0] - start[0]) * ratio,
+            start[1] + (destination[1] - start[1]) * ratio
+        )
+        corner = (start[0], turnaround[1])
+        self.points = [start, corner, turnaround, corner, start]
+        self.legs = [_distance_m(a, b) for a, b in zip(self.points, self.points[1:])]
+        self.total_m = sum(self.legs) or 1.0
+        self.speed_ms = speed_kmh / 3.6
+
+    def position(self, elapsed: float) -> Tuple[float, float, float]:
+        """(lat, lng, rumbo) tras `elapsed` segundos"""
+        travelled = (elapsed * self.speed_ms) % self.total_m
+        for (a, b), leg in zip(zip(self.points, self.points[1:]), self.legs):
+            if travelled <= leg and leg > 0:
+                fraction = travelled / leg
+                lat = a[0] + (b[0] - a[0]) * fraction
+                lng = a[1] + (b[1] - a[1]) * fraction
+                heading = math.degrees(math.atan2(
+                    math.radians(b[1] - a[1]) * math.cos(math.radians(a[0])), math.radians(b[0] - a[0])
+                )) % 360
+                return lat, lng, heading
+            travelled -= leg
+        return self.points[0][0], self.points[0][1], 0.0
+
+
+# ===== MÉTRICAS =====
+
+class SimulationMetrics:
+    """Contadores del lado de los clientes simulados"""
+
+    def __init__(self):
+        self.pings_sent = 0
+        self.pings_accepted = 0
+        self.pings_filtered = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.config_changes = 0
+        self.fanout_messages = 0
+        self.reconnects = 0
+        self.latencies_ms: List[float] = []
+        # driver_id -> {(lat, lng): instante de envío}
+        self._sent: Dict[int, Dict[Tuple[float, float], float]] = {}
+
+    def record_send(self, driver_id: int, lat: float, lng: float):
+        self.pings_sent += 1
+        sent = self._sent.setdefault(driver_id, {})
+        sent[(round(lat, 6), round(lng, 6))] = time.perf_counter()
+        if len(sent) > SEND_HISTORY_SIZE:
+            del sent[next(iter(sent))]
+
+    def record_fanout(self, driver_id: Optional[int], location: Optional[Dict[str, Any]]):
+        self.fanout_messages += 1
+        if driver_id is None or not location or location.get("lat") is None:
+            return
+        sent_at = self._sent.get(driver_id, {}).get((round(location["lat"], 6), round(location["lng"], 6)))
+        if sent_at is not None:
+            self.latencies_ms.append((time.perf_counter() - sent_at) * 1000)
+
+
+class QueryCounter:
+    """Consultas SQL ejecutadas por el motor de la aplicación (solo en proceso)"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+class MemorySampler:
+    """RSS del proceso muestreado cada segundo (psutil si está instalado)"""
+
+    def __init__(self):
+        try:
+            import psutil
+            self._process = psutil.Process(os.getpid())
+        except ImportError:
+            self._process = None
+        self.start_mb = self.read_mb()
+        self.peak_mb = self.start_mb
+
+    def read_mb(self) -> float:
+        if self._process is not None:
+            return self._process.memory_info().rss / 1024 / 1024
+        # Sin psutil: pico de RSS del proceso (KB en Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    async def run(self):
+        while True:
+            self.peak_mb = max(self.peak_mb, self.read_mb())
+            await asyncio.sleep(1)
+
+
+# ===== CLIENTES SIMULADOS =====
+
+async def run_ws_driver(base_ws: str, member: Dict[str, Any], route: SimulatedRoute, args,
+                        metrics: SimulationMetrics, deadline: float):
+    import websockets
+
+    interval = args.interval
+    started = time.monotonic()
+    async with websockets.connect(f"{base_ws}/tracking/ws/driver/{member['driver_id']}") as websocket:
+        async def read_replies():
+            nonlocal interval
+            async for raw in websocket:
+                message = json.loads(raw)
+                if message.get("type") == "config":
+                    metrics.config_changes += 1
+                    if not args.fixed_interval:
+                        interval = message["location_update_interval"]
+                elif message.get("type") == "ack":
+                    metrics.pings_accepted += 1
+                    if message.get("location", {}).get("filtered"):
+                        metrics.pings_filtered += 1
+                elif message.get("type") == "error":
+                    metrics.errors += 1
+
+        # El primer mensaje es el intervalo vigente; enviar antes solo haría que el servidor agrupe pings
+        first = json.loads(await websocket.recv())
+        if first.get("type") != "config":
+            metrics.errors += 1
+            return
+        metrics.config_changes += 1
+        if not args.fixed_interval:
+            interval = first["location_update_interval"]
+
+        reader = asyncio.create_task(read_replies())
+        try:
+            while time.monotonic() < deadline:
+                lat, lng, heading = route.position(time.monotonic() - started)
+                await websocket.send(json.dumps({
+                    "latitude": lat, "longitude": lng, "accuracy": 5,
+                    "speed": route.speed_ms * 3.6, "heading": heading
+                }))
+                metrics.record_send(member["driver_id"], lat, lng)
+                await _sleep_until(interval, deadline)
+        finally:
+            reader.cancel()
+
+
+async def run_http_driver(client, member: Dict[str, Any], route: SimulatedRoute, args,
+                          metrics: SimulationMetrics, deadline: float):
+    headers = {"Authorization": f"Bearer {member['token']}"}
+    started = time.monotonic()
+    while time.monotonic() < deadline:
+        lat, lng, heading = route.position(time.monotonic() - started)
+        metrics.record_send(member["driver_id"], lat, lng)
+        try:
+            response = await client.post("/tracking/drivers/location", headers=headers, json={
+                "latitude": lat, "longitude": lng, "accuracy": 5,
+                "speed": route.speed_ms * 3.6, "heading": heading
+            })
+            if response.status_code == 200:
+                metrics.pings_accepted += 1
+            elif response.status_code == 429:
+                metrics.rate_limited += 1
+            else:
+                metrics.errors += 1
+        except Exception:
+            metrics.errors += 1
+        await _sleep_until(args.interval, deadline)
+
+
+async def run_customer(base_ws: str, order_number: str, metrics: SimulationMetrics, deadline: float):
+    import websockets
+
+    while time.monotonic() < deadline:
+        try:
+            async with websockets.connect(f"{base_ws}/tracking/ws/tracking/{order_number}") as websocket:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    raw = await asyncio.wait_for(websocket.recv(), timeout=remaining)
+                    message = json.loads(raw)
+                    if "error" in message:
+                        metrics.errors += 1
+                        break
+                    metrics.record_fanout(message.get("driver_id"), message.get("current_location"))
+        except asyncio.TimeoutError:
+            return
+        except Exception:
+            pass
+        # Entrega completada o conexión cerrada: reconectar
+        metrics.reconnects += 1
+        await asyncio.sleep(1)
+
+
+async def simulate(fleet: Dict[str, Any], base_url: str, args, metrics: SimulationMetrics,
+                   memory: Optional[MemorySampler]):
+    import httpx
+
+    rng = random.Random(args.seed)
+    base_ws = base_url.replace("http://", "ws://").replace("https://", "wss://")
+    deadline = time.monotonic() + args.ramp + args.duration
+    memory_task = asyncio.create_task(memory.run()) if memory is not None else None
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=10) as client:
+        tasks = []
+        for member in fleet["drivers"]:
+            route = SimulatedRoute(member["start"], member["destination"], member["speed_kmh"])
+            if args.mode == "ws":
+                coroutine = run_ws_driver(base_ws, member, route, args, metrics, deadline)
+            else:
+                coroutine = run_http_driver(client, member, route, args, metrics, deadline)
+            tasks.append(_delayed(rng.uniform(0, args.ramp), coroutine))
+        for order_number in fleet["orders"]:
+            tasks.append(_delayed(rng.uniform(0, args.ramp), run_customer(base_ws, order_number, metrics, deadline)))
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        metrics.errors += sum(1 for result in results if isinstance(result, Exception))
+
+    if memory_task is not None:
+        memory_task.cancel()
+
+
+async def _sleep_until(interval: float, deadline: float):
+    await asyncio.sleep(max(min(interval, deadline - time.monotonic()), 0))
+
+
+async def _delayed(delay: float, coroutine):
+    await asyncio.sleep(delay)
+    return await coroutine
+
+
+# ===== SERVIDOR EN PROCESO =====
+
+class LocalServer:
+    """API en un hilo con uvicorn en un puerto libre"""
+
+    def __init__(self):
+        import uvicorn
+        from app.main import app
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+# ===== REPORTE =====
+
+def build_report(args, metrics: SimulationMetrics, elapsed: float, database: str,
+                 server_stats: Optional[Dict[str, Any]], queries: Optional[int],
+                 memory: Optional[MemorySampler]) -> Dict[str, Any]:
+    latencies = sorted(metrics.latencies_ms)
+    persisted = server_stats["persisted"] if server_stats else None
+    return {
+        "scenario": {
+            "drivers": args.drivers,
+            "customers": args.customers,
+            "mode": args.mode,
+            "interval": args.interval,
+            "fixed_interval": args.fixed_interval,
+            "duration": args.duration,
+            "database": database,
+            "server": args.url or "in-process",
+            "started_at": datetime.utcnow().isoformat()
+        },
+        "ingest": {
+            "pings_sent": metrics.pings_sent,
+            "pings_accepted": metrics.pings_accepted,
+            "pings_filtered": metrics.pings_filtered,
+            "pings_per_second": round(metrics.pings_sent / elapsed, 2),
+            "accepted_per_second": round(metrics.pings_accepted / elapsed, 2),
+            "errors": metrics.errors,
+            "rate_limited": metrics.rate_limited,
+            "config_changes": metrics.config_changes,
+            "server": server_stats
+        },
+        "fanout": {
+            "messages": metrics.fanout_messages,
+            "messages_per_second": round(metrics.fanout_messages / elapsed, 2),
+            "reconnects": metrics.reconnects,
+            "latency_ms": {
+                "samples": len(latencies),
+                "p50": _percentile(latencies, 50),
+                "p95": _percentile(latencies, 95),
+                "p99": _percentile(latencies, 99),
+                "max": round(latencies[-1], 2) if latencies else None
+            }
+        },
+        "database": {
+            "queries": queries,
+            "queries_per_second": round(queries / elapsed, 2) if queries is not None else None,
+            "queries_per_persisted_ping": round(queries / persisted, 3) if queries is not None and persisted else None
+        },
+        "memory": {
+            "rss_start_mb": round(memory.start_mb, 1) if memory else None,
+            "rss_peak_mb": round(memory.peak_mb, 1) if memory else None,
+            "rss_end_mb": round(memory.read_mb(), 1) if memory else None
+        }
+    }
+
+
+# (ruta en el reporte, True si un valor mayor es mejor)
+COMPARED_METRICS = [
+    ("ingest.accepted_per_second", True),
+    ("fanout.messages_per_second", True),
+    ("fanout.latency_ms.p50", False),
+    ("fanout.latency_ms.p95", False),
+    ("fanout.latency_ms.p99", False),
+    ("database.queries_per_persisted_ping", False),
+    ("memory.rss_peak_mb", False)
+]
+
+
+def compare_reports(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Imprimir la comparación con un reporte anterior; retorna las regresiones"""
+    regressions = []
+    differences = [
+        key for key in ("drivers", "customers", "mode", "interval", "fixed_interval", "database")
+        if baseline.get("scenario", {}).get(key) != report["scenario"][key]
+    ]
+    if differences:
+        print(f"\n⚠️  Escenario distinto al del reporte anterior: {', '.join(differences)}")
+    print(f"\n{'métrica':40} {'anterior':>12} {'actual':>12} {'cambio':>9}")
+    for path, higher_is_better in COMPARED_METRICS:
+        previous, current = _lookup(baseline, path), _lookup(report, path)
+        if previous is None or current is None:
+            continue
+        change = (current - previous) / previous if previous else 0.0
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  ❌"
+            regressions.append(path)
+        print(f"{path:40} {previous:>12} {current:>12} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def _lookup(report: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = report
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value if isinstance(value, (int, float)) else None
+
+
+def _percentile(values: List[float], percentile: float) -> Optional[float]:
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, math.ceil(percentile / 100 * len(values)) - 1))
+    return round(values[index], 2)
+
+
+def print_summary(report: Dict[str, Any]):
+    ingest, fanout, database, memory = report["ingest"], report["fanout"], report["database"], report["memory"]
+    latency = fanout["latency_ms"]
+    print(f"\n📍 Ingesta: {ingest['pings_sent']} pings enviados ({ingest['pings_per_second']}/s), "
+          f"{ingest['pings_accepted']} aceptados, {ingest['errors']} errores, {ingest['rate_limited']} con 429")
+    print(f"📡 Fan-out: {fanout['messages']} mensajes ({fanout['messages_per_second']}/s), "
+          f"latencia p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms")
+    if database["queries"] is not None:
+        print(f"🗄️  BD: {database['queries']} consultas ({database['queries_per_second']}/s, "
+              f"{database['queries_per_persisted_ping']} por ping persistido)")
+    if memory["rss_peak_mb"] is not None:
+        print(f"💾 Memoria: {memory['rss_start_mb']} MB al inicio, pico {memory['rss_peak_mb']} MB")
+
+
+def main():
+    args = parse_args()
+    if args.drivers < 1:
+        sys.exit("Se requiere al menos un conductor")
+
+    server = None
+    queries = None
+    memory = None
+    ingest_before = None
+    if args.url is None:
+        from core.config import settings
+        # Todos los conductores HTTP comparten la IP local
+        settings.RATE_LIMIT_REQUESTS_PER_MINUTE = 10 ** 9
+        if args.fixed_interval:
+            # Los conductores reportan cada --interval (location_update_interval sembrado)
+            from features.tracking.sampling import sampling_controller
+            sampling_controller.enabled = False
+        server = LocalServer()
+        server.start()
+        base_url = server.url
+    else:
+        base_url = args.url.rstrip("/")
+
+    from core.database import engine
+
+    try:
+        rng = random.Random(args.seed)
+        fleet = seed_fleet(args.drivers, args.customers, (args.lat, args.lng), args.radius_km, args.interval, rng)
+        print(f"🚚 {args.drivers} conductores ({args.mode}) y {args.customers} clientes contra {base_url} "
+              f"durante {args.duration}s (BD {engine.dialect.name})")
+
+        if server is not None:
+            from features.tracking.ingest import location_ingest
+            ingest_before = location_ingest.stats()
+            counter = QueryCounter(engine)
+            memory = MemorySampler()
+
+        metrics = SimulationMetrics()
+        started = time.monotonic()
+        asyncio.run(simulate(fleet, base_url, args, metrics, memory))
+        elapsed = time.monotonic() - started
+
+        server_stats = None
+        if server is not None:
+            location_ingest.flush()
+            queries = counter.count
+            after = location_ingest.stats()
+            server_stats = {
+                key: after[key] - ingest_before[key]
+                for key in ("received", "persisted", "dropped", "filtered", "flushes")
+            }
+
+        report = build_report(args, metrics, elapsed, engine.dialect.name, server_stats, queries, memory)
+    finally:
+        if server is not None:
+            server.stop()
+        if args.cleanup:
+            cleanup_fleet()
+
+    print_summary(report)
+    with open(args.report, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"\n✅ Reporte guardado en {args.report}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_reports(report, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f"\n❌ Regresiones por encima del {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n✅ Sin regresiones")
+
+
+if __name__ == "__main__":
+    main()
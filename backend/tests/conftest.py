@@ -0,0 +1,71 @@
+"""
+Configuración común de las pruebas del backend
+
+Las variables de entorno se fijan antes de importar la aplicación: las
+pruebas usan una BD SQLite temporal y nunca la configurada en .env.
+"""
+import os
+import sys
+import tempfile
+
+TEST_DB_DIR = tempfile.mkdtemp(prefix="tracking-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DB_DIR, 'test.db')}"
+os.environ.setdefault("WC_BASE_URL", "http://woocommerce.test")
+os.environ.setdefault("WC_CONSUMER_KEY", "test")
+os.environ.setdefault("WC_CONSUMER_SECRET", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import core.migrations  # noqa: F401  (registra todos los modelos en Base.metadata)
+from core.database import Base, SessionLocal, engine
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def db():
+    """Sesión de BD; las tablas se vacían al terminar cada prueba"""
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        with engine.begin() as connection:
+            for table in reversed(Base.metadata.sorted_tables):
+                connection.execute(table.delete())
+
+
+@pytest.fixture
+def driver(db):
+    """Conductor con su usuario"""
+    from features.users.models import User
+    from features.tracking.models import Driver
+
+    user = User(email="driver@test.com", full_name="Driver Test", role_id=2)
+    db.add(user)
+    db.flush()
+    driver = Driver(user_id=user.id)
+    db.add(driver)
+    db.commit()
+    return driver
+
+
+@pytest.fixture
+def order(db):
+    """Orden de WooCommerce"""
+    from features.ecommerce.models import Order
+
+    order = Order(
+        woocommerce_order_id=12345, customer_name="Cliente", customer_email="cliente@test.com",
+        subtotal=10.0, total=10.0
+    )
+    db.add(order)
+    db.commit()
+    return order
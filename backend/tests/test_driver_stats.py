@@ -0,0 +1,158 @@
+"""
+Pruebas de los contadores de entregas por conductor (driver_stats)
+
+Los contadores se mantienen de forma incremental; cada prueba los compara
+con lo que se obtiene contando las filas de delivery_tracking.
+"""
+import pytest
+from sqlalchemy import func
+
+from features.ecommerce.models import Order
+from features.tracking.driver_stats import DriverStatsService
+from features.tracking.models import DeliveryTracking, DriverStats
+from features.tracking.schemas import DeliveryStatusUpdate, DeliveryTrackingCreate, LocationData
+from features.tracking.services import DeliveryTrackingService
+
+
+def _assign(db, driver):
+    order = Order(customer_name="Cliente", customer_email="cliente@test.com", subtotal=1.0, total=1.0)
+    db.add(order)
+    # La entrega anterior liberó (o no) al conductor; la prueba solo mide contadores
+    driver.is_available = True
+    db.commit()
+    return DeliveryTrackingService.assign_delivery(DeliveryTrackingCreate(
+        order_id=order.id, driver_id=driver.id, delivery_coordinates=LocationData(lat=40.0, lng=-74.0)
+    ), db)
+
+
+def _set_status(db, delivery, status):
+    DeliveryTrackingService.update_delivery_status(delivery.id, DeliveryStatusUpdate(status=status), db)
+
+
+def _stored(db, driver_id):
+    return DriverStatsService.get_stats([driver_id], db)[driver_id]
+
+
+def _actual(db, driver_id):
+    total, completed, failed = db.query(
+        func.count(),
+        func.count().filter(DeliveryTracking.status == "completed"),
+        func.count().filter(DeliveryTracking.status == "failed")
+    ).filter(DeliveryTracking.driver_id == driver_id).one()
+    return {"total_deliveries": total, "completed_deliveries": completed, "failed_deliveries": failed}
+
+
+def _assert_matches_source(db, driver_id):
+    stored = _stored(db, driver_id)
+    assert {key: stored[key] for key in ("total_deliveries", "completed_deliveries", "failed_deliveries")} \
+        == _actual(db, driver_id)
+
+
+def test_assignment_counts_delivery(db, driver):
+    _assign(db, driver)
+
+    assert _stored(db, driver.id)["total_deliveries"] == 1
+    _assert_matches_source(db, driver.id)
+
+
+def test_assigned_to_completed(db, driver):
+    delivery = _assign(db, driver)
+
+    for status in ("started", "in_progress", "completed"):
+        _set_status(db, delivery, status)
+
+    stats = _stored(db, driver.id)
+    assert (stats["completed_deliveries"], stats["failed_deliveries"]) == (1, 0)
+    assert stats["success_rate"] == 100.0
+    _assert_matches_source(db, driver.id)
+
+
+def test_assigned_to_failed(db, driver):
+    delivery = _assign(db, driver)
+
+    _set_status(db, delivery, "failed")
+
+    stats = _stored(db, driver.id)
+    assert (stats["completed_deliveries"], stats["failed_deliveries"]) == (0, 1)
+    assert stats["success_rate"] == 0.0
+    _assert_matches_source(db, driver.id)
+
+
+def test_repeated_status_update_is_counted_once(db, driver):
+    delivery = _assign(db, driver)
+
+    _set_status(db, delivery, "completed")
+    _set_status(db, delivery, "completed")
+
+    assert _stored(db, driver.id)["completed_deliveries"] == 1
+    _assert_matches_source(db, driver.id)
+
+
+def test_correcting_final_status_moves_the_count(db, driver):
+    delivery = _assign(db, driver)
+
+    _set_status(db, delivery, "failed")
+    _set_status(db, delivery, "completed")
+
+    stats = _stored(db, driver.id)
+    assert (stats["completed_deliveries"], stats["failed_deliveries"]) == (1, 0)
+    _assert_matches_source(db, driver.id)
+
+
+def test_mixed_history_matches_source(db, driver):
+    for status in ("completed", "failed", "completed", None):
+        delivery = _assign(db, driver)
+        if status is not None:
+            _set_status(db, delivery, status)
+
+    stats = _stored(db, driver.id)
+    assert stats["total_deliveries"] == 4
+    assert stats["success_rate"] == 50.0
+    _assert_matches_source(db, driver.id)
+
+
+def test_reconcile_restores_counts_from_source(db, driver):
+    for status in ("completed", "failed"):
+        _set_status(db, _assign(db, driver), status)
+
+    # Desvío: contadores corrompidos y una fila huérfana de un conductor sin entregas
+    row = db.query(DriverStats).filter(DriverStats.driver_id == driver.id).one()
+    row.total_deliveries, row.completed_deliveries, row.failed_deliveries = 10, 7, 0
+    db.add(DriverStats(driver_id=driver.id + 1000, total_deliveries=3, completed_deliveries=1, failed_deliveries=1))
+    db.commit()
+
+    assert DriverStatsService.reconcile(db) == 2
+
+    _assert_matches_source(db, driver.id)
+    orphan = _stored(db, driver.id + 1000)
+    assert (orphan["total_deliveries"], orphan["completed_deliveries"], orphan["failed_deliveries"]) == (0, 0, 0)
+    # Sin desvío no hay nada que corregir
+    assert DriverStatsService.reconcile(db) == 0
+
+
+def test_reconcile_creates_missing_rows(db, driver):
+    _set_status(db, _assign(db, driver), "completed")
+    db.query(DriverStats).delete()
+    db.commit()
+
+    assert DriverStatsService.reconcile(db) == 1
+    _assert_matches_source(db, driver.id)
+
+
+@pytest.mark.parametrize("old_status, new_status, expected", [
+    ("assigned", "completed", (1, 0)),
+    ("in_progress", "failed", (0, 1)),
+    ("completed", "failed", (0, 1)),
+    ("completed", "completed", (1, 0)),
+    ("assigned", "started", (0, 0)),
+])
+def test_record_status_change(db, driver, old_status, new_status, expected):
+    DriverStatsService.record_assignment(driver.id, db)
+    if old_status == "completed":
+        DriverStatsService.record_status_change(driver.id, "assigned", "completed", db)
+
+    DriverStatsService.record_status_change(driver.id, old_status, new_status, db)
+    db.commit()
+
+    stats = _stored(db, driver.id)
+    assert (stats["completed_deliveries"], stats["failed_deliveries"]) == expected
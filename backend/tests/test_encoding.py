@@ -0,0 +1,110 @@
+"""
+Pruebas de las codificaciones compactas de trayectorias
+"""
+from datetime import datetime, timedelta
+import calendar
+
+import numpy as np
+import pytest
+
+from features.tracking.encoding import (
+    decode_track_binary, encode_polyline, encode_track_binary, encode_track_polyline,
+    resolve_track_format
+)
+from features.tracking.simplify import simplify_track
+
+
+def _track():
+    start = datetime(2026, 1, 1, 12, 0)
+    return [
+        {"latitude": 40.26012, "longitude": -74.27021, "timestamp": start, "speed": 32.5, "heading": 90.0},
+        {"latitude": 40.26113, "longitude": -74.26587, "timestamp": start + timedelta(seconds=7), "speed": None, "heading": None},
+        {"latitude": 40.25871, "longitude": -74.26012, "timestamp": start + timedelta(seconds=19), "speed": 0.0, "heading": 0.0},
+        {"latitude": 40.24999, "longitude": -74.25001, "timestamp": start + timedelta(seconds=45), "speed": 48.1, "heading": 359.0},
+    ]
+
+
+def _decode_polyline(encoded):
+    """Decodificador de referencia del algoritmo polyline de Google"""
+    values, value, shift = [], 0, 0
+    for char in encoded:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    return np.cumsum(np.array(values).reshape(-1, 2), axis=0) / 1e5
+
+
+def test_polyline_matches_reference_example():
+    # Ejemplo de la documentación del formato
+    lats = np.array([38.5, 40.7, 43.252])
+    lngs = np.array([-120.2, -120.95, -126.453])
+
+    assert encode_polyline(lats, lngs) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_track_polyline_round_trip():
+    track = _track()
+
+    encoded = encode_track_polyline(track)
+
+    assert encoded["count"] == len(track)
+    np.testing.assert_allclose(
+        _decode_polyline(encoded["polyline"]),
+        [[point["latitude"], point["longitude"]] for point in track], atol=1e-5
+    )
+    # Timestamps naive en UTC
+    assert list(np.cumsum(encoded["timestamps"])) == [calendar.timegm(point["timestamp"].timetuple()) for point in track]
+    assert encoded["speed"] == [32.5, None, 0.0, 48.1]
+
+
+def test_binary_round_trip():
+    track = _track()
+
+    decoded = decode_track_binary(encode_track_binary(track))
+
+    assert len(decoded) == len(track)
+    for original, point in zip(track, decoded):
+        assert point["latitude"] == pytest.approx(original["latitude"], abs=1e-5)
+        assert point["longitude"] == pytest.approx(original["longitude"], abs=1e-5)
+        assert point["timestamp"] == original["timestamp"]
+        assert point["speed"] == original["speed"]
+        assert point["heading"] == original["heading"]
+
+
+def test_binary_round_trip_of_simplified_track():
+    start = datetime(2026, 1, 1)
+    track = [
+        {"latitude": 40.0 + i * 1e-4, "longitude": -74.0 + np.sin(i / 20) * 1e-3,
+         "timestamp": start + timedelta(seconds=5 * i), "speed": 20.0, "heading": None}
+        for i in range(500)
+    ]
+    simplified = simplify_track(track, tolerance_m=2)
+
+    decoded = decode_track_binary(encode_track_binary(simplified))
+
+    assert 2 <= len(decoded) < len(track)
+    assert [point["timestamp"] for point in decoded] == [point["timestamp"] for point in simplified]
+
+
+def test_binary_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        decode_track_binary(b"XYZ\x01\x00")
+
+
+def test_empty_track():
+    assert decode_track_binary(encode_track_binary([])) == []
+    assert encode_track_polyline([])["polyline"] == ""
+
+
+@pytest.mark.parametrize("format, accept, expected", [
+    ("polyline", "application/vnd.tracking.track", "polyline"),
+    (None, "application/vnd.tracking.track", "binary"),
+    (None, "application/octet-stream", "binary"),
+    (None, "application/vnd.tracking.polyline+json", "polyline"),
+    (None, None, "json"),
+])
+def test_resolve_track_format(format, accept, expected):
+    assert resolve_track_format(format, accept) == expected
@@ -0,0 +1,203 @@
+"""
+Pruebas de las geocercas de entrega
+"""
+import pytest
+
+from features.tracking import geofence
+from features.tracking.geocoding import SOURCE_EXPLICIT, SOURCE_GEOCODER, SOURCE_ZIP
+from features.tracking.geofence import GeofenceMonitor
+from features.tracking.models import DeliveryTracking
+
+STORE = (40.0, -74.0)
+# ~2,2 km al norte de la tienda
+DESTINATION = {"lat": 40.02, "lng": -74.0, "source": SOURCE_EXPLICIT}
+
+
+@pytest.fixture
+def events(monkeypatch):
+    """Eventos emitidos y cambios de estado pedidos por las geocercas"""
+    recorded = {"geofence": [], "status": []}
+    monkeypatch.setattr(geofence.tracking_bus, "publish_delivery_event",
+                        lambda delivery_id, event: recorded["geofence"].append(
+                            (delivery_id, event["event"], event["zone"])))
+    monkeypatch.setattr(geofence, "_advance_status",
+                        lambda delivery_id, status: recorded["status"].append((delivery_id, status)))
+    return recorded
+
+
+def _monitor(*drivers):
+    monitor = GeofenceMonitor(store_lat=STORE[0], store_lng=STORE[1])
+    # Conductores ya leídos de la BD: las pruebas solo usan geocercas registradas
+    monitor._loaded.update(drivers)
+    return monitor
+
+
+def _drive(monitor, driver_id, *latitudes):
+    for lat in latitudes:
+        monitor.check(driver_id, lat, -74.0)
+
+
+def test_store_departure_starts_delivery(events):
+    monitor = _monitor(1)
+    monitor.register(10, 1, DESTINATION)
+
+    _drive(monitor, 1, 40.0, 40.001, 40.004)
+
+    assert events["geofence"] == [(10, "departed", "store")]
+    assert events["status"] == [(10, "started")]
+
+
+def test_arriving_arrived_departed_sequence(events):
+    monitor = _monitor(1)
+    monitor.register(10, 1, DESTINATION, status="started")
+
+    # ~445 m, ~55 m y ~165 m pasado el destino
+    _drive(monitor, 1, 40.01, 40.016)
+    assert events["geofence"] == [(10, "arriving", "destination")]
+    _drive(monitor, 1, 40.0195)
+    assert events["geofence"][-1] == (10, "arrived", "destination")
+    # Dentro del radio de salida (histéresis) no sale
+    _drive(monitor, 1, 40.021)
+    assert len(events["geofence"]) == 2
+    _drive(monitor, 1, 40.0215)
+
+    assert events["geofence"][-1] == (10, "departed", "destination")
+    assert events["status"] == [(10, "completed")]
+    assert monitor.auto_completed == 1
+
+
+def test_entering_arrival_radius_directly_emits_both_events(events):
+    monitor = _monitor(1)
+    monitor.register(10, 1, DESTINATION, status="started")
+
+    _drive(monitor, 1, 40.02)
+
+    assert [event for _, event, _ in events["geofence"]] == ["arriving", "arrived"]
+
+
+@pytest.mark.parametrize("coordinates", [
+    {"lat": 40.02, "lng": -74.0, "source": SOURCE_ZIP},
+    # Entregas anteriores al campo "source"
+    {"lat": 40.02, "lng": -74.0},
+])
+def test_imprecise_destination_never_completes(events, coordinates):
+    monitor = _monitor(1)
+    monitor.register(10, 1, coordinates)
+
+    _drive(monitor, 1, 40.0, 40.004, 40.016, 40.02, 40.03, 40.02, 40.03)
+
+    # Solo la geocerca de la tienda está activa
+    assert events["geofence"] == [(10, "departed", "store")]
+    assert events["status"] == [(10, "started")]
+    assert monitor.auto_completed == 0
+
+
+def test_geocoded_destination_is_precise(events):
+    monitor = _monitor(1)
+    monitor.register(10, 1, {**DESTINATION, "source": SOURCE_GEOCODER}, status="started")
+
+    _drive(monitor, 1, 40.02, 40.03)
+
+    assert events["status"] == [(10, "completed")]
+
+
+def test_completed_fence_does_not_fire_again(events):
+    monitor = _monitor(1)
+    monitor.register(10, 1, DESTINATION, status="started")
+    _drive(monitor, 1, 40.02, 40.03)
+    fired = len(events["geofence"])
+
+    # El conductor vuelve a pasar por el destino
+    _drive(monitor, 1, 40.02, 40.03, 40.02)
+
+    assert len(events["geofence"]) == fired
+    assert events["status"] == [(10, "completed")]
+    assert monitor.distance_to_destination(1, 40.02, -74.0) is None
+
+
+def test_fences_are_per_delivery(events):
+    monitor = _monitor(1)
+    monitor.register(10, 1, DESTINATION, status="started")
+    monitor.register(11, 1, {"lat": 40.05, "lng": -74.0, "source": SOURCE_EXPLICIT}, status="started")
+
+    _drive(monitor, 1, 40.02, 40.03)
+
+    assert events["status"] == [(10, "completed")]
+    assert monitor.distance_to_destination(1, 40.05, -74.0) == pytest.approx(0)
+
+
+def test_delivery_finished_elsewhere_removes_its_fence(events):
+    monitor = _monitor(1)
+    monitor.register(10, 1, DESTINATION, status="started")
+    monitor.register(11, 1, DESTINATION, status="started")
+
+    monitor._on_delivery_message({"type": "status_update", "delivery_id": 10, "status": "in_progress"})
+    assert monitor.stats()["fences"] == 2
+
+    # Completada a mano en otro worker antes de llegar
+    monitor._on_delivery_message({"type": "status_update", "delivery_id": 10, "status": "completed"})
+    monitor._on_delivery_message({"type": "status_update", "delivery_id": 11, "status": "failed"})
+    _drive(monitor, 1, 40.02, 40.03)
+
+    assert monitor.stats()["fences"] == 0
+    assert events["geofence"] == [] and events["status"] == []
+
+
+def test_assigned_event_builds_fence(events):
+    monitor = _monitor(1)
+
+    monitor._on_delivery_message({
+        "type": "assigned", "delivery_id": 10, "order_id": 5, "woocommerce_order_id": 12345,
+        "driver_id": 1, "status": "assigned", "delivery_coordinates": DESTINATION
+    })
+    _drive(monitor, 1, 40.0, 40.004, 40.02)
+
+    assert [event for _, event, _ in events["geofence"]] == ["departed", "arriving", "arrived"]
+
+
+def test_assigned_event_keeps_state_of_registered_fence(events):
+    monitor = _monitor(1)
+    monitor.register(10, 1, DESTINATION, status="started")
+    _drive(monitor, 1, 40.02)
+
+    # El worker que asignó recibe su propio evento después de los primeros pings
+    monitor._on_delivery_message({
+        "type": "assigned", "delivery_id": 10, "driver_id": 1, "status": "assigned",
+        "delivery_coordinates": DESTINATION
+    })
+    _drive(monitor, 1, 40.02)
+
+    assert monitor.stats()["fences"] == 1
+    assert [event for _, event, _ in events["geofence"]] == ["arriving", "arrived"]
+
+
+def test_unknown_driver_is_loaded_from_database_once(events, db, driver, order):
+    db.add(DeliveryTracking(order_id=order.id, driver_id=driver.id, status="started",
+                            delivery_coordinates=DESTINATION))
+    db.commit()
+    monitor = GeofenceMonitor(store_lat=STORE[0], store_lng=STORE[1])
+
+    # Sin event loop la carga se hace en línea en el primer ping
+    _drive(monitor, driver.id, 40.0)
+    assert monitor.stats()["fences"] == 1
+
+    # Asignaciones posteriores llegan por el bus, no se vuelve a consultar la BD
+    db.add(DeliveryTracking(order_id=order.id, driver_id=driver.id, status="assigned",
+                            delivery_coordinates=DESTINATION))
+    db.commit()
+    _drive(monitor, driver.id, 40.0)
+    assert monitor.stats()["fences"] == 1
+
+
+def test_advance_status_only_moves_forward(db, driver, order):
+    delivery = DeliveryTracking(order_id=order.id, driver_id=driver.id, status="in_progress")
+    db.add(delivery)
+    db.commit()
+
+    geofence._advance_status(delivery.id, "started")
+    db.refresh(delivery)
+    assert delivery.status == "in_progress"
+
+    geofence._advance_status(delivery.id, "completed")
+    db.refresh(delivery)
+    assert delivery.status == "completed"
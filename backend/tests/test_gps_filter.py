@@ -0,0 +1,107 @@
+"""
+Pruebas del filtro de ruido GPS
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from features.tracking.gps_filter import GpsFilter, OUTLIER_RESET_COUNT
+
+START = datetime(2026, 1, 1, 12, 0)
+
+
+def _at(seconds):
+    return START + timedelta(seconds=seconds)
+
+
+def test_first_fix_is_accepted():
+    gps = GpsFilter()
+
+    assert gps.process(1, 40.0, -74.0, 5, _at(0)) == (None, 40.0, -74.0)
+    assert gps.stats()["accepted"] == 1
+
+
+def test_jitter_within_accuracy_is_dropped_until_keepalive():
+    gps = GpsFilter(keepalive_seconds=60)
+    gps.process(1, 40.0, -74.0, 10, _at(0))
+
+    # ~5 m con precisión de 10 m: teléfono quieto
+    assert gps.process(1, 40.00005, -74.0, 10, _at(10)) == ("jitter", 40.0, -74.0)
+    # Pasado el keepalive se acepta un punto aunque no se mueva
+    assert gps.process(1, 40.00005, -74.0, 10, _at(61))[0] is None
+    assert gps.stats()["rejected_jitter"] == 1
+
+
+def test_movement_beyond_accuracy_is_accepted():
+    gps = GpsFilter()
+    gps.process(1, 40.0, -74.0, 5, _at(0))
+
+    assert gps.process(1, 40.001, -74.0, 5, _at(10)) == (None, 40.001, -74.0)
+
+
+def test_impossible_jump_is_rejected_as_outlier():
+    gps = GpsFilter(max_speed_kmh=200)
+    gps.process(1, 40.0, -74.0, 5, _at(0))
+
+    # ~11 km en 10 s
+    reason, lat, lng = gps.process(1, 40.1, -74.0, 5, _at(10))
+
+    assert (reason, lat, lng) == ("outlier", 40.0, -74.0)
+    # El siguiente punto razonable se compara con el último aceptado
+    assert gps.process(1, 40.001, -74.0, 5, _at(20))[0] is None
+
+
+def test_repeated_jumps_reset_the_position():
+    gps = GpsFilter(max_speed_kmh=200)
+    gps.process(1, 40.0, -74.0, 5, _at(0))
+
+    reasons = [gps.process(1, 40.1, -74.0, 5, _at(10 + i))[0] for i in range(OUTLIER_RESET_COUNT)]
+
+    # El punto erróneo era el anterior: tras varios saltos seguidos se acepta el nuevo
+    assert reasons == ["outlier"] * (OUTLIER_RESET_COUNT - 1) + [None]
+    assert gps.process(1, 40.1005, -74.0, 5, _at(20))[0] is None
+
+
+def test_speed_allows_for_accuracy_of_both_fixes():
+    gps = GpsFilter(max_speed_kmh=100)
+    gps.process(1, 40.0, -74.0, 50, _at(0))
+
+    # ~111 m en 1 s (400 km/h), pero con 50 m de incertidumbre en cada punto solo ~11 m son reales
+    assert gps.process(1, 40.001, -74.0, 50, _at(1))[0] is None
+
+
+def test_old_or_duplicated_fix_is_stale():
+    gps = GpsFilter()
+    gps.process(1, 40.0, -74.0, 5, _at(10))
+
+    assert gps.process(1, 40.001, -74.0, 5, _at(10))[0] == "stale"
+    assert gps.process(1, 40.001, -74.0, 5, _at(5))[0] == "stale"
+    assert gps.stats()["rejected_stale"] == 2
+
+
+def test_drivers_are_filtered_independently():
+    gps = GpsFilter()
+    gps.process(1, 40.0, -74.0, 5, _at(0))
+
+    assert gps.process(2, 41.0, -74.0, 5, _at(0))[0] is None
+    assert gps.stats()["drivers"] == 2
+
+
+def test_disabled_filter_passes_everything():
+    gps = GpsFilter(enabled=False)
+    gps.process(1, 40.0, -74.0, 5, _at(10))
+
+    assert gps.process(1, 40.0, -74.0, 5, _at(0)) == (None, 40.0, -74.0)
+    assert gps.stats()["accepted"] == 0
+
+
+def test_smoothing_moves_towards_noisy_measurement():
+    gps = GpsFilter(smoothing=True, process_noise_ms=1.0)
+    gps.process(1, 40.0, -74.0, 5, _at(0))
+
+    # Medida imprecisa (50 m): la estimación avanza solo una parte del desplazamiento
+    reason, lat, lng = gps.process(1, 40.001, -74.0, 50, _at(10))
+
+    assert reason is None
+    assert 40.0 < lat < 40.001
+    assert lng == pytest.approx(-74.0)
@@ -0,0 +1,122 @@
+"""
+Pruebas del flush por lotes de la ingesta de ubicaciones
+"""
+from datetime import datetime, timedelta
+
+from features.tracking import ingest
+from features.tracking.ingest import LocationIngestBuffer, MAX_FLUSH_ATTEMPTS
+from features.tracking.models import DeliveryTracking, LocationUpdate
+
+
+def _ping(driver_id, seconds, delivery_id=None, lat=40.0, lng=-74.0):
+    return {
+        "driver_id": driver_id,
+        "delivery_id": delivery_id,
+        "latitude": lat,
+        "longitude": lng,
+        "accuracy": 5.0,
+        "speed": 20.0,
+        "heading": 90.0,
+        "timestamp": datetime(2026, 1, 1, 12, 0) + timedelta(seconds=seconds)
+    }
+
+
+class FailingSession:
+    """Sesión cuya BD no responde"""
+
+    def query(self, *args, **kwargs):
+        raise RuntimeError("BD no disponible")
+
+    execute = query
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_flush_persists_batch_and_latest_position(db, driver):
+    buffer = LocationIngestBuffer()
+    buffer._pending = [_ping(driver.id, 10, lat=40.1), _ping(driver.id, 0, lat=40.0)]
+
+    assert buffer.flush() == 2
+    assert buffer.pending_count() == 0
+    assert buffer.persisted == 2
+    assert db.query(LocationUpdate).count() == 2
+
+    db.refresh(driver)
+    # La posición actual es la del ping más reciente, no la del último encolado
+    assert driver.current_location["lat"] == 40.1
+    assert driver.last_location_update == datetime(2026, 1, 1, 12, 0, 10)
+
+
+def test_flush_attaches_en_route_delivery(db, driver, order):
+    oldest = DeliveryTracking(order_id=order.id, driver_id=driver.id, status="assigned",
+                              assigned_at=datetime(2026, 1, 1, 9, 0))
+    en_route = DeliveryTracking(order_id=order.id, driver_id=driver.id, status="started",
+                                assigned_at=datetime(2026, 1, 1, 10, 0))
+    db.add_all([oldest, en_route])
+    db.commit()
+
+    buffer = LocationIngestBuffer()
+    buffer._pending = [_ping(driver.id, 0), _ping(driver.id, 5, delivery_id=oldest.id)]
+    buffer.flush()
+
+    rows = db.query(LocationUpdate).order_by(LocationUpdate.timestamp).all()
+    assert [row.delivery_id for row in rows] == [en_route.id, oldest.id]
+
+
+def test_failed_flush_requeues_batch(monkeypatch, db, driver):
+    buffer = LocationIngestBuffer()
+    buffer._pending = [_ping(driver.id, 0), _ping(driver.id, 1)]
+
+    monkeypatch.setattr(ingest, "SessionLocal", FailingSession)
+    assert buffer.flush() == 0
+    assert buffer.pending_count() == 2
+    assert buffer.persisted == 0
+
+    # Los pings llegados durante el fallo quedan detrás de los reintentos
+    buffer._pending.append(_ping(driver.id, 2))
+    monkeypatch.undo()
+    assert buffer.flush() == 3
+    rows = db.query(LocationUpdate).order_by(LocationUpdate.id).all()
+    assert [row.timestamp.second for row in rows] == [0, 1, 2]
+
+
+def test_rejected_row_only_drops_itself(db, driver):
+    buffer = LocationIngestBuffer()
+    invalid = _ping(driver.id, 2)
+    invalid["latitude"] = None
+    buffer._pending = [_ping(driver.id, seconds) for seconds in (0, 1)] + [invalid] + [_ping(driver.id, 3)]
+
+    assert buffer.flush() == 3
+    assert buffer.rejected == 1
+    assert buffer.dropped == 0
+    assert buffer.pending_count() == 0
+    rows = db.query(LocationUpdate).order_by(LocationUpdate.timestamp).all()
+    assert [row.timestamp.second for row in rows] == [0, 1, 3]
+
+
+def test_requeue_drops_pings_after_max_attempts(monkeypatch, driver):
+    buffer = LocationIngestBuffer()
+    buffer._pending = [_ping(driver.id, 0)]
+    monkeypatch.setattr(ingest, "SessionLocal", FailingSession)
+
+    for _ in range(MAX_FLUSH_ATTEMPTS):
+        buffer.flush()
+
+    assert buffer.pending_count() == 0
+    assert buffer.dropped == 1
+
+
+def test_requeue_keeps_newest_pings_when_queue_is_full(monkeypatch, driver):
+    monkeypatch.setattr(ingest, "MAX_PENDING_PINGS", 2)
+    monkeypatch.setattr(ingest, "SessionLocal", FailingSession)
+    buffer = LocationIngestBuffer()
+    buffer._pending = [_ping(driver.id, seconds) for seconds in range(3)]
+
+    buffer.flush()
+
+    assert [row["timestamp"].second for row in buffer._pending] == [1, 2]
+    assert buffer.dropped == 1
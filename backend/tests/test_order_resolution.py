@@ -0,0 +1,105 @@
+"""
+Pruebas de la caché de resolución de números de orden
+"""
+import pytest
+
+from features.tracking.models import DeliveryTracking
+from features.tracking.order_resolution import OrderResolutionCache
+
+
+@pytest.fixture
+def delivery(db, driver, order):
+    delivery = DeliveryTracking(order_id=order.id, driver_id=driver.id, status="assigned")
+    db.add(delivery)
+    db.commit()
+    return delivery
+
+
+def test_active_delivery_is_cached(db, order, delivery):
+    cache = OrderResolutionCache()
+
+    first = cache.resolve(order.id, db)
+    second = cache.resolve(order.id, db)
+
+    assert (first.order_id, first.delivery_id, first.driver_id) == (order.id, delivery.id, delivery.driver_id)
+    assert second is first
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_resolves_by_woocommerce_number(db, order, delivery):
+    cache = OrderResolutionCache()
+
+    resolution = cache.resolve("12345", db, woocommerce=True)
+
+    assert resolution.order_id == order.id
+    # La misma entrada sirve para el id local
+    assert cache.resolve(order.id, db) is resolution
+
+
+def test_unknown_or_invalid_order(db):
+    cache = OrderResolutionCache()
+
+    assert cache.resolve(999, db) is None
+    with pytest.raises(ValueError):
+        cache.resolve("abc", db)
+
+
+def test_order_without_active_delivery_is_not_cached(db, order, delivery):
+    delivery.status = "completed"
+    db.commit()
+    cache = OrderResolutionCache()
+
+    assert cache.resolve(order.id, db).delivery_id == delivery.id
+    assert cache.stats()["entries"] == 0
+
+
+def test_finished_delivery_invalidates_entry(db, order, delivery):
+    cache = OrderResolutionCache()
+    cache.resolve(order.id, db)
+
+    cache._on_delivery_message({"type": "status_update", "delivery_id": delivery.id, "status": "in_progress"})
+    assert cache.stats()["entries"] == 1
+
+    cache._on_delivery_message({"type": "status_update", "delivery_id": delivery.id, "status": "completed"})
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["invalidations"] == 1
+    assert cache.resolve(12345, db, woocommerce=True) is not None
+    assert cache.stats()["misses"] == 2
+
+
+def test_new_assignment_replaces_entry(db, order, delivery):
+    cache = OrderResolutionCache()
+    cache.resolve(order.id, db)
+
+    cache._on_delivery_message({
+        "type": "assigned", "delivery_id": delivery.id + 1, "order_id": order.id,
+        "woocommerce_order_id": 12345, "driver_id": 77
+    })
+
+    resolution = cache.resolve(12345, db, woocommerce=True)
+    assert (resolution.delivery_id, resolution.driver_id) == (delivery.id + 1, 77)
+    assert cache.stats()["entries"] == 1
+
+
+def test_invalidation_during_lookup_is_not_cached(db, order, delivery, monkeypatch):
+    cache = OrderResolutionCache()
+    original_query = db.query
+
+    def query_then_finish(*args, **kwargs):
+        # La entrega termina (en otro worker) mientras se lee de la BD
+        cache.invalidate_delivery(delivery.id)
+        return original_query(*args, **kwargs)
+
+    monkeypatch.setattr(db, "query", query_then_finish)
+    cache.resolve(order.id, db)
+
+    assert cache.stats()["entries"] == 0
+
+
+def test_max_entries_evicts_oldest():
+    cache = OrderResolutionCache(max_entries=2)
+    for order_id in (1, 2, 3):
+        cache.remember(order_id, order_id + 1000, order_id * 10, 5)
+
+    assert cache.stats()["entries"] == 2
+    assert 1 not in cache._by_order_id and 1001 not in cache._by_woocommerce_id
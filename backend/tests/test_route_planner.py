@@ -0,0 +1,65 @@
+"""
+Pruebas del orden de visita de entregas
+"""
+from itertools import permutations
+
+import numpy as np
+import pytest
+
+from features.tracking.geo import haversine_km_matrix
+from features.tracking.route_planner import optimize_open_route
+
+
+def _length(points, order):
+    distances = haversine_km_matrix(points[:, 0], points[:, 1])
+    return sum(distances[a, b] for a, b in zip(order, order[1:]))
+
+
+def _optimal_length(points):
+    rest = range(1, len(points))
+    return min(_length(points, [0, *order]) for order in permutations(rest))
+
+
+@pytest.mark.parametrize("count", [1, 2])
+def test_trivial_routes(count):
+    points = np.array([[40.0 + i * 0.01, -74.0] for i in range(count)])
+
+    assert optimize_open_route(points) == list(range(count))
+
+
+def test_collinear_stops_are_visited_in_order():
+    # Paradas desordenadas sobre una recta que sale del origen
+    points = np.array([[40.0, -74.0], [40.03, -74.0], [40.01, -74.0], [40.04, -74.0], [40.02, -74.0]])
+
+    assert optimize_open_route(points) == [0, 2, 4, 1, 3]
+
+
+def test_route_is_a_permutation_starting_at_origin():
+    rng = np.random.default_rng(3)
+    points = np.column_stack([40.0 + rng.uniform(0, 0.2, 40), -74.0 + rng.uniform(0, 0.2, 40)])
+
+    order = optimize_open_route(points)
+
+    assert order[0] == 0
+    assert sorted(order) == list(range(40))
+
+
+def test_two_opt_removes_crossings():
+    # El vecino más cercano visita 1, 2, 3 y cruza el recorrido para volver a 4
+    points = np.array([[0.0, 0.0], [0.0, 0.01], [0.012, 0.011], [0.012, 0.0], [0.0, 0.03]]) + [40.0, -74.0]
+
+    order = optimize_open_route(points)
+
+    assert order == [0, 3, 2, 1, 4]
+    assert _length(points, order) == pytest.approx(_optimal_length(points))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_close_to_brute_force_optimum(seed):
+    rng = np.random.default_rng(seed)
+    points = np.column_stack([40.0 + rng.uniform(0, 0.1, 8), -74.0 + rng.uniform(0, 0.1, 8)])
+
+    order = optimize_open_route(points)
+
+    # Heurística: no garantiza el óptimo, pero en recorridos cortos queda muy cerca
+    assert _length(points, order) <= _optimal_length(points) * 1.1
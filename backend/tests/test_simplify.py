@@ -0,0 +1,47 @@
+"""
+Pruebas de la simplificación de trayectorias
+"""
+from datetime import datetime, timedelta
+
+from features.tracking.simplify import downsample_by_time, simplify_track
+
+
+def _point(lat, lng, seconds=0):
+    return {"latitude": lat, "longitude": lng, "timestamp": datetime(2026, 1, 1) + timedelta(seconds=seconds)}
+
+
+def test_straight_line_keeps_only_endpoints():
+    points = [_point(40.0 + i * 0.001, -74.0) for i in range(50)]
+
+    result = simplify_track(points, tolerance_m=5)
+
+    assert result == [points[0], points[-1]]
+
+
+def test_tolerance_keeps_corners():
+    # Forma de L: el vértice se desvía ~1 km de la recta entre los extremos
+    points = [_point(40.0 + i * 0.001, -74.0) for i in range(11)]
+    points += [_point(40.01, -74.0 + i * 0.001) for i in range(1, 11)]
+
+    result = simplify_track(points, tolerance_m=10)
+
+    assert result == [points[0], points[10], points[-1]]
+
+
+def test_max_points_keeps_most_significant():
+    points = [_point(40.0 + i * 0.001, -74.0 + (0.002 if i % 5 == 0 else 0.0)) for i in range(40)]
+
+    result = simplify_track(points, max_points=6)
+
+    assert len(result) == 6
+    assert result[0] is points[0] and result[-1] is points[-1]
+    # Conserva el orden cronológico
+    assert [points.index(point) for point in result] == sorted(points.index(point) for point in result)
+
+
+def test_downsample_keeps_last_point_per_bucket_and_start():
+    points = [_point(40.0, -74.0, seconds) for seconds in (0, 5, 10, 25, 31, 59, 61)]
+
+    result = downsample_by_time(points, 30)
+
+    assert [point["timestamp"].second for point in result] == [0, 25, 59, 1]
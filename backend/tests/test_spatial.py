@@ -0,0 +1,66 @@
+"""
+Pruebas del índice espacial de rejilla
+"""
+import random
+
+import pytest
+
+from features.tracking.geo import haversine_km
+from features.tracking.spatial import SpatialGridIndex
+
+
+def _brute_force(points, lat, lng, count, max_radius_km, predicate=None):
+    matches = [
+        (item_id, haversine_km(lat, lng, point_lat, point_lng))
+        for item_id, (point_lat, point_lng) in points.items()
+        if predicate is None or predicate(item_id)
+    ]
+    matches = sorted((item for item in matches if item[1] <= max_radius_km), key=lambda item: item[1])
+    return matches[:count]
+
+
+def _index(points, cell_size_deg=0.01):
+    index = SpatialGridIndex(cell_size_deg=cell_size_deg)
+    for item_id, (lat, lng) in points.items():
+        index.update(item_id, lat, lng)
+    return index
+
+
+@pytest.mark.parametrize("spread_deg, max_radius_km", [
+    (0.05, 2),    # flota densa: recorre anillos de celdas
+    (3.0, 500),   # flota dispersa: recorre solo las celdas ocupadas
+])
+def test_nearest_matches_brute_force(spread_deg, max_radius_km):
+    rng = random.Random(7)
+    points = {
+        item_id: (40.0 + rng.uniform(-spread_deg, spread_deg), -74.0 + rng.uniform(-spread_deg, spread_deg))
+        for item_id in range(500)
+    }
+    index = _index(points)
+
+    for _ in range(20):
+        lat, lng = 40.0 + rng.uniform(-spread_deg, spread_deg), -74.0 + rng.uniform(-spread_deg, spread_deg)
+        result = index.nearest(lat, lng, 5, max_radius_km=max_radius_km)
+        expected = _brute_force(points, lat, lng, 5, max_radius_km)
+        assert [item_id for item_id, _ in result] == [item_id for item_id, _ in expected]
+        assert [distance for _, distance in result] == pytest.approx([distance for _, distance in expected])
+
+
+def test_nearest_respects_max_radius_and_predicate():
+    points = {1: (40.0, -74.0), 2: (40.001, -74.0), 3: (40.2, -74.0)}
+    index = _index(points)
+
+    assert [item_id for item_id, _ in index.nearest(40.0, -74.0, 10, max_radius_km=1)] == [1, 2]
+    assert [item_id for item_id, _ in index.nearest(40.0, -74.0, 1, predicate=lambda item_id: item_id != 1)] == [2]
+
+
+def test_nearest_follows_moved_and_removed_items():
+    index = _index({1: (40.0, -74.0), 2: (40.01, -74.0)})
+
+    index.update(1, 41.0, -74.0)
+    assert index.nearest(40.0, -74.0, 1)[0][0] == 2
+
+    index.remove(2)
+    assert index.nearest(40.0, -74.0, 1) == []
+    assert index.nearest(41.0, -74.0, 1)[0][0] == 1
+    assert len(index) == 1